@@ -0,0 +1,29 @@
+"""
+Нагрузочные замеры сервиса. Запускаются как модули из корня проекта, например:
+
+    python -m benchmarks.login_throughput
+
+Замеры работают с базой данных из настроек проекта (DJANGO_SETTINGS_MODULE).
+"""
+import os
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dj_api_market.settings')
+    django.setup()
+
+
+def seeded_user(type='buyer'):
+    """
+    Первый пользователь синтетической площадки (python manage.py seed_marketplace) с типом type.
+    Все замеры работают с этой площадкой, без нее замер завершается с подсказкой
+    """
+    from market.models import User
+    from market.seeding import EMAIL_DOMAIN
+
+    user = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}', type=type).order_by('id').first()
+    if user is None:
+        raise SystemExit('Нет данных площадки, создайте их командой: python manage.py seed_marketplace --scale medium')
+    return user
@@ -0,0 +1,76 @@
+"""
+Задержка коротких запросов (статус поставщика, GET api/partner/state) с новым соединением с БД
+на каждый запрос, с постоянным соединением (CONN_MAX_AGE) и с пулом соединений.
+
+    python -m benchmarks.connection_pool --requests 500 --conn-max-age 60
+
+Запросы выполняются внутри процесса. В конце каждого запроса соединение закрывается, остается открытым
+(CONN_MAX_AGE) или возвращается в пул.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import seeded_user, setup
+
+def engines(conn_max_age):
+    """
+    Вариант -> (движок, CONN_MAX_AGE)
+    """
+    return {
+        'direct': ('django.db.backends.postgresql', 0),
+        'persistent': ('django.db.backends.postgresql', conn_max_age),
+        'pool': ('dj_api_market.db.postgresql_pool', 0),
+    }
+
+
+def use_engine(engine, conn_max_age):
+    """
+    Заменяет соединение default текущего потока соединением с движком engine
+    """
+    from django.db import connections
+    from django.db.utils import load_backend
+
+    connections['default'].close()
+    settings_dict = {**connections.settings['default'], 'ENGINE': engine, 'CONN_MAX_AGE': conn_max_age}
+    connections['default'] = load_backend(engine).DatabaseWrapper(settings_dict, 'default')
+
+
+def measure(client, requests):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get('/api/partner/state')
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.content
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)], sum(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--conn-max-age', type=int, default=60, help='CONN_MAX_AGE варианта persistent, секунды')
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    # запросы выполняются внутри процесса от имени тестового клиента
+    settings.ALLOWED_HOSTS.append('testserver')
+
+    token, _ = Token.objects.get_or_create(user=seeded_user('shop'))
+    client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+    print(f'{"engine":<12}{"p50, ms":>10}{"p95, ms":>10}{"req/s":>10}')
+    for name, (engine, conn_max_age) in engines(args.conn_max_age).items():
+        use_engine(engine, conn_max_age)
+        # прогрев: кеш токена, первое соединение (постоянное или пула)
+        measure(client, 10)
+        p50, p95, elapsed = measure(client, args.requests)
+        print(f'{name:<12}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}{args.requests / elapsed:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Влияние индексов на запросы основных сценариев: каталог, корзина, история заказов, заказы поставщика.
+
+    python -m benchmarks.indexes --repeat 50
+
+Запросы, которые обслуживает индекс, выполняются с индексом и без него: индекс удаляется в транзакции,
+которая затем откатывается. Удаление индекса блокирует таблицу до конца замера, поэтому замер запускается
+на отдельной базе с синтетической площадкой (python manage.py seed_marketplace --scale medium).
+Для каждого запроса выводятся медиана времени и чтение таблиц из плана выполнения. Замер выполняется
+на PostgreSQL: на нем работает сервис, и от него зависят секции заказов и триграммный индекс.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import seeded_user, setup
+
+
+def cases():
+    """
+    Индекс -> [(обработчик, запрос)] по данным площадки
+    """
+    from django.conf import settings
+    from django.db.models import Count
+    from market.models import Order, OrderItem, ProductInfo, Shop
+
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    buyer, shop_user = seeded_user('buyer'), seeded_user('shop')
+    # самый большой магазин: постраничный вывод его каталога дольше всего без индекса
+    shop = Shop.objects.annotate(offers=Count('product_infos')).order_by('-offers').first()
+    # номер товара из названия ("Смартфон Apple A12 (черный)") встречается в нескольких названиях
+    term = ProductInfo.objects.order_by('id').values_list('product__name', flat=True).first().split()[2]
+
+    history = Order.objects.filter(user_id=buyer.id).exclude(state='basket').order_by('-dt', '-id')
+    shop_orders = OrderItem.objects.filter(shop__user_id=shop_user.id).values('order_id')
+    return {
+        'unique_user_basket': [
+            ('basket', Order.objects.filter(user_id=buyer.id, state='basket')),
+        ],
+        'productinfo_shop_id_idx': [
+            ('market?shop', ProductInfo.objects.filter(shop_id=shop.id).order_by('id')[:page_size]),
+            ('market?shop&page=100', ProductInfo.objects.filter(shop_id=shop.id).order_by('id')[
+                99 * page_size:100 * page_size]),
+        ],
+        'product_name_trgm_idx': [
+            ('market?search', ProductInfo.objects.filter(product__name__icontains=term).order_by('id')[:page_size]),
+        ],
+        'order_user_dt_idx': [
+            ('order', history[:20]),
+        ],
+        'orderitem_shop_order_idx': [
+            ('partner/orders', Order.objects.filter(id__in=shop_orders).exclude(state='basket')
+             .order_by('-dt', '-id')[:20]),
+        ],
+    }
+
+
+def measure(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        list(queryset.all())
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def scans(queryset):
+    """
+    Узлы плана, читающие таблицы (Seq Scan, Index Scan, Bitmap Index Scan)
+    """
+    return [line.split('  (cost=')[0].strip(' ->') for line in queryset.explain().splitlines() if 'Scan' in line]
+
+
+def drop_index(connection, name):
+    """
+    Удаляет индекс в текущей транзакции, возвращает False, если индекса нет в этой БД
+    """
+    from django.db import DatabaseError, transaction
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    except DatabaseError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--index', action='append', help='Замерить только этот индекс (можно повторять)')
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection, transaction
+
+    if connection.vendor != 'postgresql':
+        raise SystemExit('Замер индексов выполняется только на PostgreSQL')
+
+    print(f'{"index / query":<40}{"with, ms":>12}{"without, ms":>14}{"speedup":>10}')
+    for index, queries in cases().items():
+        if args.index and index not in args.index:
+            continue
+        with transaction.atomic():
+            results = [(name, queryset, measure(queryset, args.repeat), scans(queryset)) for name, queryset in queries]
+            if not drop_index(connection, index):
+                print(f'{index:<40}{"нет в этой БД":>12}')
+                continue
+            print(index)
+            for name, queryset, with_index, plan in results:
+                without = measure(queryset, args.repeat)
+                print(f'  {name:<38}{with_index * 1000:>12.2f}{without * 1000:>14.2f}{without / with_index:>9.1f}x')
+                print(f'{"":<4}с индексом:  {"; ".join(plan)}')
+                print(f'{"":<4}без индекса: {"; ".join(scans(queryset))}')
+            transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
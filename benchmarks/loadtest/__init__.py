@@ -0,0 +1,17 @@
+"""
+Сквозной нагрузочный тест сценариев покупателя и поставщика на запущенном стенде (docker-compose):
+
+    покупатель: user/register -> user/register/confirm -> user/login -> market -> basket (добавление,
+                изменение) -> user/contact -> order (оформление заказа)
+    поставщик:  partner/update (импорт прайса) -> partner/orders
+
+Запускается в контейнере приложения (нужен доступ к базе для подготовки данных) на базе с синтетической
+площадкой (python manage.py seed_marketplace): данные теста добавляются к ее каталогу и заказам.
+
+    docker compose exec app python -m benchmarks.loadtest --profile release --output loadtest.json
+    docker compose exec app python -m benchmarks.loadtest --profile release --compare loadtest.json
+
+Профиль задает фиксированный масштаб (число покупателей, поставщиков, потоков) и seed: при одинаковом
+профиле запросы повторяются от запуска к запуску, и отчеты разных версий можно сравнивать.
+Для каждого обработчика выводятся пропускная способность, p50/p95/p99 задержки и число ошибок.
+"""
@@ -0,0 +1,116 @@
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from benchmarks import seeded_user, setup
+from benchmarks.loadtest.client import Client, Recorder, ScenarioError
+from benchmarks.loadtest.report import load, print_rows, save, summarize
+
+# фиксированный масштаб теста: отчеты сравнимы только при одинаковом профиле
+PROFILES = {
+    'smoke': {'buyers': 10, 'partners': 2, 'concurrency': 5, 'browse_pages': 2, 'order_pages': 2},
+    'release': {'buyers': 200, 'partners': 10, 'concurrency': 20, 'browse_pages': 5, 'order_pages': 5},
+}
+
+
+def run_phase(recorder, name, base_url, concurrency, tasks):
+    """
+    Выполняет сценарии фазы в concurrency потоках, у каждого потока свое соединение
+    """
+    recorder.phase = name
+    local = threading.local()
+    clients = []
+
+    def run(task):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client(base_url, recorder)
+            clients.append(client)
+        client.token = None
+        try:
+            task(client)
+        except ScenarioError as error:
+            return error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        errors = [error for error in executor.map(run, tasks) if error is not None]
+    recorder.phases[name] = time.perf_counter() - start
+    for client in clients:
+        client.close()
+
+    print(f'{name}: {len(tasks)} сценариев за {recorder.phases[name]:.1f} с, с ошибкой {len(errors)}')
+    if errors:
+        print(f'  первая ошибка: {errors[0]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест сценариев покупателя и поставщика')
+    parser.add_argument('--url', default='http://localhost:8000', help='адрес сервиса')
+    parser.add_argument('--profile', choices=PROFILES, default='release', help='масштаб теста')
+    parser.add_argument('--buyers', type=int, help='число покупателей (вместо значения профиля)')
+    parser.add_argument('--partners', type=int, help='число поставщиков (вместо значения профиля)')
+    parser.add_argument('--concurrency', type=int, help='число потоков (вместо значения профиля)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--price-host', default='localhost',
+                        help='адрес этой машины, по которому сервис скачивает прайсы поставщиков')
+    parser.add_argument('--price-port', type=int, default=8089)
+    parser.add_argument('--output', help='сохранить отчет в JSON')
+    parser.add_argument('--compare', help='сравнить с отчетом прошлого запуска (JSON)')
+    parser.add_argument('--keep', action='store_true', help='не удалять данные теста после замера')
+    args = parser.parse_args()
+
+    params = dict(PROFILES[args.profile], seed=args.seed)
+    for name in ('buyers', 'partners', 'concurrency'):
+        if getattr(args, name):
+            params[name] = getattr(args, name)
+
+    setup()
+    # каталог и история заказов синтетической площадки - общий для всех замеров фон
+    seeded_user()
+    from benchmarks.loadtest import fixtures
+    from benchmarks.loadtest import scenarios
+
+    # данные прерванного запуска
+    fixtures.cleanup()
+    recorder = Recorder()
+    try:
+        partners = fixtures.create_partners(params['partners'])
+        with fixtures.PriceListServer(args.price_host, args.price_port) as server:
+            run_phase(recorder, 'partner-import', args.url, params['concurrency'], [
+                partial(scenarios.partner_import, token=token, url=server.url(index)) for index, token in partners])
+
+        products = fixtures.product_ids()
+        if not products:
+            sys.exit('Каталог поставщиков пуст: проверьте, что сервис может скачать прайс по --price-host')
+
+        run_phase(recorder, 'buyer', args.url, params['concurrency'], [
+            partial(scenarios.buyer, index=index, rng=random.Random(f'{params["seed"]}:{index}'),
+                    products=products, browse_pages=params['browse_pages'])
+            for index in range(params['buyers'])])
+        run_phase(recorder, 'partner-orders', args.url, params['concurrency'], [
+            partial(scenarios.partner_orders, token=token, pages=params['order_pages'])
+            for _, token in partners])
+    finally:
+        if not args.keep:
+            fixtures.cleanup()
+
+    rows = summarize(recorder)
+    report = {'profile': args.profile, 'params': params, 'url': args.url, 'phases': recorder.phases, 'rows': rows}
+    previous = None
+    if args.compare:
+        previous = load(args.compare)
+        if previous['params'] != params:
+            print(f'Внимание: параметры прошлого отчета отличаются: {previous["params"]}')
+    print()
+    print_rows(rows, previous and previous['rows'])
+    if args.output:
+        save(args.output, report)
+
+
+if __name__ == '__main__':
+    main()
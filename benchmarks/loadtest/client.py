@@ -0,0 +1,97 @@
+"""
+HTTP клиент нагрузочного теста и учет задержек по обработчикам
+"""
+import http.client
+import json
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+
+class ScenarioError(Exception):
+    """
+    Запрос сценария завершился ошибкой, продолжать сценарий нельзя
+    """
+
+
+class Recorder:
+    """
+    Задержки и ошибки запросов по фазам теста и обработчикам, общий для всех потоков
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (фаза, обработчик) - [задержки успешных запросов, число ошибок]
+        self.results = defaultdict(lambda: [[], 0])
+        # фаза - время выполнения, с
+        self.phases = {}
+        self.phase = None
+
+    def add(self, endpoint, latency, ok):
+        with self.lock:
+            result = self.results[(self.phase, endpoint)]
+            if ok:
+                result[0].append(latency)
+            else:
+                result[1] += 1
+
+
+class Client:
+    """
+    Клиент одного виртуального пользователя: постоянное (keep-alive) соединение,
+    тело запросов и ответов - JSON
+    """
+
+    def __init__(self, base_url, recorder, timeout=60):
+        parts = urlsplit(base_url)
+        self.connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.connection = None
+        self.token = None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, method, path, endpoint, data=None, params=None):
+        """
+        Выполняет запрос и учитывает его задержку под именем обработчика endpoint.
+        Ошибкой считается статус 400 и выше или {"Status": false} в ответе
+        """
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        url = self.prefix + path + (f'?{urlencode(params)}' if params else '')
+
+        if self.connection is None:
+            self.connection = self.connection_class(self.netloc, timeout=self.timeout)
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, url, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException) as error:
+            self.recorder.add(endpoint, time.perf_counter() - start, False)
+            self.close()
+            raise ScenarioError(f'{method} {url}: {error}') from error
+        latency = time.perf_counter() - start
+
+        try:
+            payload = json.loads(content) if content else None
+        except ValueError:
+            payload = None
+        ok = response.status < 400 and not (isinstance(payload, dict) and payload.get('Status') is False)
+        self.recorder.add(endpoint, latency, ok)
+        if not ok:
+            raise ScenarioError(f'{method} {url}: {response.status} {content[:200]!r}')
+        return payload
@@ -0,0 +1,113 @@
+"""
+Подготовка данных нагрузочного теста: поставщики, прайсы для импорта, токены подтверждения email.
+Все объекты теста отличаются доменом email и префиксом названия магазина и удаляются после замера
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+
+from market.models import ConfirmEmailToken, ProductInfo, Shop, User
+
+EMAIL_DOMAIN = 'loadtest.example.com'
+SHOP_PREFIX = 'Loadtest shop'
+PASSWORD = 'Loadtest-Passw0rd'
+PRICE_LIST = Path(__file__).resolve().parents[2] / 'data' / 'shop1.yaml'
+
+
+def buyer_email(index):
+    return f'buyer{index}@{EMAIL_DOMAIN}'
+
+
+def shop_name(index):
+    return f'{SHOP_PREFIX} {index}'
+
+
+class PriceListHandler(BaseHTTPRequestHandler):
+    """
+    Отдает прайс data/shop1.yaml с названием магазина поставщика: /partner-<номер>.yaml
+    """
+
+    def do_GET(self):
+        name = self.path.strip('/').removesuffix('.yaml')
+        prefix, _, index = name.partition('-')
+        if prefix != 'partner' or not index.isdigit():
+            self.send_error(404)
+            return
+        # первая строка прайса - название магазина
+        _, goods = self.server.price_list.split('\n', 1)
+        content = f'shop: {shop_name(index)}\n{goods}'.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/yaml; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class PriceListServer:
+    """
+    HTTP сервер прайсов для partner/update, работает в отдельном потоке на время теста
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.server = ThreadingHTTPServer(('0.0.0.0', port), PriceListHandler)
+        self.server.price_list = PRICE_LIST.read_text(encoding='utf-8')
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, index):
+        return f'http://{self.host}:{self.server.server_port}/partner-{index}.yaml'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def create_partners(count):
+    """
+    Создает активных пользователей-поставщиков, возвращает список (номер, токен)
+    """
+    partners = []
+    for index in range(count):
+        user = User.objects.create_user(email=f'partner{index}@{EMAIL_DOMAIN}', password=PASSWORD,
+                                        first_name='Loadtest', last_name=f'Partner {index}',
+                                        company=shop_name(index), position='manager',
+                                        type='shop', is_active=True)
+        partners.append((index, Token.objects.create(user=user).key))
+    return partners
+
+
+def product_ids():
+    """
+    Позиции каталога, импортированные поставщиками теста, в постоянном порядке
+    """
+    return list(ProductInfo.objects.filter(shop__name__startswith=SHOP_PREFIX).order_by('id')
+                .values_list('id', flat=True))
+
+
+def confirmation_key(email):
+    """
+    Токен подтверждения email. Регистрация в тесте идет без письма (test=test),
+    поэтому токен создается напрямую, как это делает задача отправки письма
+    """
+    try:
+        return ConfirmEmailToken.objects.create(user=User.objects.get(email=email)).key
+    finally:
+        close_old_connections()
+
+
+def cleanup():
+    """
+    Удаляет пользователей и магазины, созданные тестом (с заказами, контактами и позициями каталога)
+    """
+    Shop.objects.filter(name__startswith=SHOP_PREFIX).delete()
+    return User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()[0]
@@ -0,0 +1,65 @@
+"""
+Отчет нагрузочного теста: пропускная способность и задержки по обработчикам, сравнение с прошлым отчетом
+"""
+import json
+import math
+
+
+def percentile(latencies, value):
+    """
+    Перцентиль по ближайшему рангу, latencies отсортированы
+    """
+    if not latencies:
+        return 0.0
+    return latencies[max(0, math.ceil(value / 100 * len(latencies)) - 1)]
+
+
+def summarize(recorder):
+    """
+    Строки отчета: фаза, обработчик, число запросов и ошибок, запросов в секунду, p50/p95/p99 (мс)
+    """
+    rows = []
+    for (phase, endpoint), (latencies, errors) in recorder.results.items():
+        latencies = sorted(latencies)
+        duration = recorder.phases.get(phase) or 1
+        rows.append({
+            'phase': phase,
+            'endpoint': endpoint,
+            'requests': len(latencies) + errors,
+            'errors': errors,
+            'rps': round((len(latencies) + errors) / duration, 2),
+            'p50': round(percentile(latencies, 50) * 1000, 1),
+            'p95': round(percentile(latencies, 95) * 1000, 1),
+            'p99': round(percentile(latencies, 99) * 1000, 1),
+        })
+    return rows
+
+
+def print_rows(rows, previous=None):
+    """
+    Печатает таблицу отчета. Если передан прошлый отчет, рядом с rps и p95 выводится изменение в процентах
+    """
+    previous = {(row['phase'], row['endpoint']): row for row in previous or []}
+
+    def delta(row, field):
+        old = previous.get((row['phase'], row['endpoint']), {}).get(field)
+        if not old:
+            return ''
+        return f' ({(row[field] - old) / old * 100:+.0f}%)'
+
+    print(f'{"фаза":<15}{"обработчик":<30}{"запросы":>8}{"ошибки":>8}{"rps":>16}'
+          f'{"p50, мс":>10}{"p95, мс":>18}{"p99, мс":>10}')
+    for row in rows:
+        print(f'{row["phase"]:<15}{row["endpoint"]:<30}{row["requests"]:>8}{row["errors"]:>8}'
+              f'{row["rps"]:>8.1f}{delta(row, "rps"):>8}{row["p50"]:>10.1f}'
+              f'{row["p95"]:>10.1f}{delta(row, "p95"):>8}{row["p99"]:>10.1f}')
+
+
+def save(path, report):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
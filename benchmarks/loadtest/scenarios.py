@@ -0,0 +1,60 @@
+"""
+Сценарии нагрузочного теста. Выбор страниц и товаров зависит только от seed и номера пользователя
+"""
+from benchmarks.loadtest.fixtures import PASSWORD, buyer_email, confirmation_key
+
+SEARCH_TERMS = ['Смартфон', 'Apple', 'Samsung', 'накопитель']
+
+
+def buyer(client, index, rng, products, browse_pages):
+    """
+    Покупатель: регистрация -> подтверждение email -> вход -> просмотр каталога ->
+    корзина (добавление и изменение) -> контакт -> оформление заказа
+    """
+    email = buyer_email(index)
+    client.request('POST', '/api/user/register', 'POST user/register', {
+        'first_name': 'Loadtest', 'last_name': f'Buyer {index}', 'email': email, 'password': PASSWORD,
+        'company': 'Loadtest', 'position': 'buyer', 'test': 'test'})
+    client.request('POST', '/api/user/register/confirm', 'POST user/register/confirm',
+                   {'email': email, 'token': confirmation_key(email)})
+    client.token = client.request('POST', '/api/user/login', 'POST user/login',
+                                  {'email': email, 'password': PASSWORD})['Token']
+
+    catalog = client.request('GET', '/api/market/', 'GET market')
+    pages = max(1, -(-catalog['count'] // len(catalog['results']))) if catalog['results'] else 1
+    for _ in range(browse_pages - 1):
+        client.request('GET', '/api/market/', 'GET market', params={'page': rng.randint(1, pages)})
+    client.request('GET', '/api/market/', 'GET market?search', params={'search': rng.choice(SEARCH_TERMS)})
+    chosen = rng.sample(products, min(3, len(products)))
+    for product_id in chosen[:2]:
+        client.request('GET', f'/api/market/{product_id}/', 'GET market/{id}')
+
+    client.request('POST', '/api/basket', 'POST basket', {'ordered_items': [
+        {'product_info': product_id, 'quantity': rng.randint(1, 3)} for product_id in chosen]})
+    basket = client.request('GET', '/api/basket', 'GET basket')
+    client.request('PUT', '/api/basket', 'PUT basket', {'ordered_items': [
+        {'id': item['id'], 'quantity': rng.randint(1, 5)} for item in basket[0]['ordered_items']]})
+
+    contact = client.request('POST', '/api/user/contact/', 'POST user/contact', {
+        'city': 'Москва', 'street': 'Тверская', 'house': str(index), 'phone': f'+7900{index:07d}'})
+    client.request('POST', '/api/order', 'POST order', {'contact': contact['id']})
+    client.request('GET', '/api/order', 'GET order')
+
+
+def partner_import(client, token, url):
+    """
+    Поставщик: импорт прайса
+    """
+    client.token = token
+    client.request('POST', '/api/partner/update', 'POST partner/update', {'url': url})
+
+
+def partner_orders(client, token, pages):
+    """
+    Поставщик: просмотр заказов покупателей (все заказы и новые)
+    """
+    client.token = token
+    for _ in range(pages):
+        client.request('GET', '/api/partner/orders/', 'GET partner/orders')
+    client.request('GET', '/api/partner/orders/', 'GET partner/orders?state',
+                   params={'state': 'new'})
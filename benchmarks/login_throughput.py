@@ -0,0 +1,69 @@
+"""
+Пропускная способность авторизации (запросов в секунду на ядро) через тот же путь, что и в работе:
+nginx направляет POST api/user/login на сервис app_asgi, пароль проверяется в пуле хеширования.
+
+    python -m benchmarks.login_throughput --requests 400 --concurrency 32 --url http://nginx
+
+Сравнение с синхронным сервером (тот же обработчик под gunicorn с синхронными воркерами):
+
+    python -m benchmarks.login_throughput --url http://app:8000
+
+Размер пула хеширования задается переменной PASSWORD_HASHING_WORKERS сервиса app_asgi,
+--cores - число ядер, доступных серверу (для пересчета на ядро).
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import seeded_user, setup
+from benchmarks.loadtest.client import Client, Recorder, ScenarioError
+from benchmarks.loadtest.report import percentile
+
+
+def run(url, email, password, requests, concurrency):
+    recorder = Recorder()
+    local = threading.local()
+
+    def login(_):
+        # у каждого потока свое постоянное соединение
+        if not hasattr(local, 'client'):
+            local.client = Client(url, recorder)
+        try:
+            local.client.request('POST', '/api/user/login', 'user/login', {'email': email, 'password': password})
+        except ScenarioError:
+            pass
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(login, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies, failed = recorder.results[(None, 'user/login')]
+    return elapsed, sorted(latencies), failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://nginx', help='Адрес сервиса (nginx, app:8000 или app_asgi:8001)')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--cores', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    setup()
+    from market.seeding import PASSWORD
+
+    user = seeded_user('buyer')
+    elapsed, latencies, failed = run(args.url, user.email, PASSWORD, args.requests, args.concurrency)
+
+    throughput = args.requests / elapsed
+    print(f'url: {args.url}, requests: {args.requests}, concurrency: {args.concurrency}')
+    print(f'failed: {failed}')
+    print(f'elapsed: {elapsed:.2f} s, p50: {percentile(latencies, 50) * 1000:.1f} ms, '
+          f'p95: {percentile(latencies, 95) * 1000:.1f} ms')
+    print(f'throughput: {throughput:.1f} req/s, {throughput / args.cores:.1f} req/s per core')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Пропускная способность чтения при большом числе одновременных соединений:
+синхронные обработчики (WSGI) против асинхронных (ASGI).
+
+Замер работает с запущенными серверами по HTTP, каждое соединение - отдельный поток клиента
+с постоянным (keep-alive) соединением:
+
+    python -m benchmarks.read_throughput --token <token> --connections 10 50 200 --duration 20 \\
+        --target wsgi=http://localhost:8000/api/order --target asgi=http://localhost:8001/api/async/order
+
+Серверы для сравнения (одинаковое число процессов):
+
+    gunicorn dj_api_market.wsgi:application -w 4 -b 0.0.0.0:8000
+    gunicorn dj_api_market.asgi:application -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:8001
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def worker(url, headers, deadline, results):
+    """
+    Выполняет запросы по одному соединению до deadline, сохраняет задержки и ошибки
+    """
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    connection = connection_class(parts.netloc, timeout=30)
+    latencies, errors = [], 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    results.append((latencies, errors))
+
+
+def measure(url, headers, connections, duration):
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(url, headers, deadline, results)) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(latency for thread_latencies, _ in results for latency in thread_latencies)
+    errors = sum(thread_errors for _, thread_errors in results)
+    if not latencies:
+        return len(latencies) / duration, None, None, errors
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    return len(latencies) / duration, statistics.median(latencies), p95, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                        help='Сервер для замера, можно указать несколько раз')
+    parser.add_argument('--token', help='Токен авторизации')
+    parser.add_argument('--connections', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--duration', type=float, default=20, help='Длительность замера, секунды')
+    args = parser.parse_args()
+
+    headers = {'Authorization': f'Token {args.token}'} if args.token else {}
+    print(f'{"target":<10}{"connections":>12}{"req/s":>10}{"p50, ms":>10}{"p95, ms":>10}{"errors":>8}')
+    for target in args.target:
+        name, _, url = target.partition('=')
+        for connections in args.connections:
+            throughput, p50, p95, errors = measure(url, headers, connections, args.duration)
+            p50 = f'{p50 * 1000:.1f}' if p50 is not None else '-'
+            p95 = f'{p95 * 1000:.1f}' if p95 is not None else '-'
+            print(f'{name:<10}{connections:>12}{throughput:>10.1f}{p50:>10}{p95:>10}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
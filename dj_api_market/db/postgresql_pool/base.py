@@ -0,0 +1,47 @@
+"""
+PostgreSQL с пулом соединений процесса.
+
+    DATABASES = {'default': {'ENGINE': 'dj_api_market.db.postgresql_pool', ..., 'POOL': {'MAX_SIZE': 4}}}
+
+Настройки пула (POOL): MAX_SIZE, MAX_LIFETIME, CHECK_INTERVAL, TIMEOUT (см. ConnectionPool).
+CONN_MAX_AGE должен быть 0: соединение возвращается в пул в конце каждого запроса,
+поэтому соединений в процессе не больше, чем одновременно выполняемых запросов (и не больше MAX_SIZE)
+"""
+from functools import partial
+
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+
+from dj_api_market.db.postgresql_pool.pool import close_pools, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # свободные соединения пула не дают удалить тестовую базу данных
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+
+    def get_new_connection(self, conn_params):
+        # служебное соединение без базы данных (создание и удаление тестовой базы) не кешируется
+        if self.alias == NO_DB_ALIAS:
+            return super().get_new_connection(conn_params)
+        self.pool = get_pool(conn_params, self.settings_dict.get('POOL', {}))
+        connection = self.pool.getconn(partial(super().get_new_connection, conn_params))
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        # соединение, закрытое внутри atomic, остается у DatabaseWrapper до отката и в пул не возвращается
+        with self.wrap_database_errors:
+            self.pool.putconn(self.connection, discard=self.in_atomic_block)
@@ -0,0 +1,196 @@
+"""
+Пул соединений psycopg2 процесса.
+
+Соединение берется из пула при подключении DatabaseWrapper и возвращается при его закрытии
+(в конце запроса или задачи Celery). Перед выдачей соединение, простаивавшее дольше check_interval,
+проверяется запросом SELECT 1; соединения старше max_lifetime закрываются.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений с одной базой данных.
+
+    database - имя базы данных;
+    max_size - наибольшее число открытых соединений (выданных и свободных);
+    max_lifetime - время жизни соединения, секунды;
+    check_interval - простой, после которого соединение проверяется перед выдачей, секунды;
+    timeout - время ожидания свободного соединения, секунды
+    """
+
+    def __init__(self, database=None, max_size=4, max_lifetime=1800, check_interval=30, timeout=10):
+        self.database = database
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self.timeout = timeout
+        # свободные соединения и время их возврата, последним берется последнее возвращенное
+        self._idle = deque()
+        # время открытия всех соединений пула
+        self._opened = {}
+        # число открытых соединений и соединений, открываемых в данный момент
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def stats(self):
+        with self._condition:
+            return {'size': self._size, 'idle': len(self._idle), 'max_size': self.max_size}
+
+    def getconn(self, connect):
+        """
+        Свободное соединение из пула или новое соединение, открытое функцией connect.
+        Если открыто max_size соединений, ожидает возврата соединения не дольше timeout
+        """
+        while True:
+            connection, returned_at = self._acquire()
+            if connection is None:
+                return self._open(connect)
+            if self._is_usable(connection, returned_at):
+                return connection
+            self._discard(connection)
+
+    def putconn(self, connection, discard=False):
+        """
+        Возвращает соединение в пул. Незавершенная транзакция откатывается.
+        Закрытые, устаревшие и неисправные соединения закрываются
+        """
+        with self._condition:
+            opened = self._opened.get(connection)
+        if opened is None:
+            # соединение не из этого пула (например, унаследовано от родительского процесса)
+            self._close(connection)
+            return
+
+        if not discard and not connection.closed:
+            try:
+                if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or connection.closed or self._expired(opened):
+            self._discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def close(self):
+        """
+        Закрывает свободные соединения, выданные закрываются при возврате
+        """
+        with self._condition:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+        for connection in idle:
+            self._discard(connection)
+
+    def _acquire(self):
+        """
+        Свободное соединение и время его возврата или (None, None),
+        если соединений меньше max_size и можно открыть новое
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError(
+                        f'Connection pool exhausted: {self.max_size} connections in use for {self.timeout} s')
+                self._condition.wait(remaining)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opened[connection] = time.monotonic()
+        return connection
+
+    def _expired(self, opened):
+        return self.max_lifetime is not None and time.monotonic() - opened >= self.max_lifetime
+
+    def _is_usable(self, connection, returned_at):
+        with self._condition:
+            opened = self._opened[connection]
+        if connection.closed or self._expired(opened):
+            return False
+        if time.monotonic() - returned_at < self.check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, connection):
+        self._close(connection)
+        with self._condition:
+            if self._opened.pop(connection, None) is not None:
+                self._size -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+_pools = {}
+# пулы родительского процесса: соединения не закрываются в дочернем процессе,
+# иначе закрылись бы и соединения родителя (сокет общий)
+_inherited = []
+_pid = os.getpid()
+_lock = threading.Lock()
+
+
+def get_pool(conn_params, options):
+    """
+    Пул процесса для параметров подключения conn_params, options - настройки пула (POOL в DATABASES)
+    """
+    global _pid
+    key = repr(sorted(conn_params.items()))
+    with _lock:
+        if os.getpid() != _pid:
+            _inherited.extend(_pools.values())
+            _pools.clear()
+            _pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                database=conn_params.get('database'),
+                max_size=options.get('MAX_SIZE', 4),
+                max_lifetime=options.get('MAX_LIFETIME', 1800),
+                check_interval=options.get('CHECK_INTERVAL', 30),
+                timeout=options.get('TIMEOUT', 10),
+            )
+        return pool
+
+
+def close_pools(database=None):
+    """
+    Закрывает свободные соединения всех пулов процесса или пулов базы данных database
+    """
+    with _lock:
+        pools = [pool for pool in _pools.values() if database is None or pool.database == database]
+    for pool in pools:
+        pool.close()
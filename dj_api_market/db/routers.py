@@ -0,0 +1,55 @@
+"""
+Маршрутизация чтения на реплики БД.
+
+Чтение идет на реплику (DATABASE_REPLICAS) только в обработчиках из настройки REPLICA_VIEWS
+для безопасных методов (GET, HEAD), остальное чтение и вся запись - на основную базу данных.
+Состояние маршрутизации запроса задает ReplicaRoutingMiddleware (market/middleware.py)
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# состояние маршрутизации текущего HTTP запроса. Объект общий для потоков sync_to_async,
+# поэтому запись в асинхронном обработчике учитывается так же, как в синхронном
+current_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """
+    replica - чтение разрешено с реплики;
+    wrote - запрос записывал в основную базу данных
+    """
+
+    def __init__(self):
+        self.replica = False
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """
+    Чтение с случайной реплики, если это разрешено состоянием запроса и чтение идет не внутри транзакции
+    и не из моделей REPLICA_PRIMARY_MODELS. Запись - в основную базу данных
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        if state is None or not state.replica or not settings.DATABASE_REPLICAS:
+            return None
+        if model._meta.label_lower in settings.REPLICA_PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        # в транзакции читаются данные, которые она же изменяет
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная база данных
+        return True
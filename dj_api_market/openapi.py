@@ -0,0 +1,139 @@
+"""
+Схема OpenAPI.
+
+Схема генерируется один раз командой generate_openapi (при запуске сервера) в каталог OPENAPI_SCHEMA_DIR
+и отдается как статический файл с ETag. Повторно схема генерируется, только если изменился код:
+в каталоге сохраняется отпечаток исходников (OPENAPI_SOURCE_DIRS) и версий библиотек.
+"""
+import hashlib
+import json
+import os
+import threading
+from importlib.metadata import version
+from pathlib import Path
+
+import yaml
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import condition
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+INFO = openapi.Info(
+    title="Snippets API",
+    default_version='v1',
+    description="Test description",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@snippets.local"),
+    license=openapi.License(name="BSD License"),
+)
+
+# страницы swagger/ и redoc/, схему они загружают из статического файла (SWAGGER_SETTINGS['SPEC_URL'])
+schema_view = get_schema_view(
+    INFO,
+    public=True,
+    permission_classes=[permissions.AllowAny],
+)
+
+# расширение файла схемы - тип содержимого
+FORMATS = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+MANIFEST = 'manifest.json'
+
+# загруженные файлы схемы процесса: путь - (время изменения файла, содержимое, ETag)
+_loaded = {}
+_lock = threading.Lock()
+
+
+def source_fingerprint():
+    """
+    Отпечаток кода, от которого зависит схема: исходники OPENAPI_SOURCE_DIRS и версии библиотек
+    """
+    digest = hashlib.sha256()
+    for package in ('Django', 'djangorestframework', 'drf-yasg', 'django-filter'):
+        digest.update(f'{package}=={version(package)}\n'.encode())
+    for directory in settings.OPENAPI_SOURCE_DIRS:
+        for path in sorted(Path(directory).rglob('*.py')):
+            digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_file(path, content):
+    # запись во временный файл и замена: обработчики не читают частично записанную схему
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+def generate(directory=None, force=False):
+    """
+    Генерирует файлы схемы swagger.json и swagger.yaml в каталог directory (OPENAPI_SCHEMA_DIR).
+    Если код не изменился с прошлой генерации и force не задан, возвращает False
+    """
+    directory = directory or settings.OPENAPI_SCHEMA_DIR
+    fingerprint = source_fingerprint()
+    if not force and read_manifest(directory).get('fingerprint') == fingerprint \
+            and all(os.path.exists(os.path.join(directory, f'swagger{ext}')) for ext in FORMATS):
+        return False
+
+    schema = OpenAPISchemaGenerator(INFO).get_schema(request=None, public=True)
+    content = OpenAPICodecJson(validators=[]).encode(schema)
+    os.makedirs(directory, exist_ok=True)
+    write_file(os.path.join(directory, 'swagger.json'), content)
+    # YAML строится из JSON: кодек YAML drf_yasg несовместим с актуальными версиями ruamel.yaml
+    write_file(os.path.join(directory, 'swagger.yaml'),
+               yaml.safe_dump(json.loads(content), allow_unicode=True, sort_keys=False).encode())
+    write_file(os.path.join(directory, MANIFEST), json.dumps({'fingerprint': fingerprint}).encode())
+    return True
+
+
+def load(ext):
+    """
+    Содержимое и ETag файла схемы. Файл перечитывается только после повторной генерации.
+    Если схема еще не сгенерирована, она генерируется при первом запросе
+    """
+    path = os.path.join(settings.OPENAPI_SCHEMA_DIR, f'swagger{ext}')
+    with _lock:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            generate()
+            mtime = os.stat(path).st_mtime_ns
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != mtime:
+            with open(path, 'rb') as file:
+                content = file.read()
+            loaded = _loaded[path] = (mtime, content, hashlib.sha256(content).hexdigest()[:32])
+        return loaded[1], loaded[2]
+
+
+def schema_etag(request, format):
+    return load(format)[1] if format in FORMATS else None
+
+
+@condition(etag_func=schema_etag)
+def schema_file_view(request, format):
+    """
+    Файл схемы swagger.json или swagger.yaml. Поддерживает If-None-Match (ответ 304)
+    """
+    if format not in FORMATS:
+        raise Http404
+    content, _ = load(format)
+    response = HttpResponse(content, content_type=FORMATS[format])
+    response['Cache-Control'] = f'public, max-age={settings.OPENAPI_SCHEMA_MAX_AGE}'
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 import os
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'market.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +60,10 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'market.profiling.ProfilingMiddleware',
+    'market.slow_queries.SlowQueryMiddleware',
+    'market.middleware.QueryBudgetMiddleware',
+    'market.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'dj_api_market.urls'
@@ -85,17 +91,63 @@ WSGI_APPLICATION = 'dj_api_market.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# DB_POOL=True: соединения с БД берутся из пула процесса (dj_api_market/db/postgresql_pool) и возвращаются
+# в него в конце запроса. Пул включается явно: сравнение с постоянными соединениями (DB_CONN_MAX_AGE)
+# на PostgreSQL еще не выполнено (benchmarks/connection_pool.py). Размер пула процесса - доля соединений
+# сервиса (DB_POOL_CONNECTIONS) на один процесс gunicorn (WEB_CONCURRENCY), либо явно заданный DB_POOL_MAX_SIZE
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 0)) or max(
+    int(os.getenv('DB_POOL_CONNECTIONS', 20)) // int(os.getenv('WEB_CONCURRENCY', 1)), 1)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'dj_api_market.db.postgresql_pool' if DB_POOL else 'django.db.backends.postgresql',
         'NAME': 'market_base',
         'HOST': os.getenv('PG_HOST', 'pg_db'),
         'PORT': os.getenv('PG_PORT', '5432'),
         'USER': os.getenv('PG_USER', 'user'),
-        'PASSWORD': os.getenv('PG_PASSWORD', '1234')
+        'PASSWORD': os.getenv('PG_PASSWORD', '1234'),
+        # с пулом соединение возвращается в пул в конце каждого запроса
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        'POOL': {
+            'MAX_SIZE': DB_POOL_MAX_SIZE,
+            # время жизни соединения и простой, после которого соединение проверяется перед выдачей, секунды
+            'MAX_LIFETIME': int(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+            'CHECK_INTERVAL': int(os.getenv('DB_POOL_CHECK_INTERVAL', 30)),
+            # время ожидания свободного соединения, секунды
+            'TIMEOUT': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        },
     }
 }
 
+# Реплики для чтения: PG_REPLICA_HOSTS=host1:5432,host2. В тестах реплики используют тестовую базу default
+DATABASE_REPLICAS = []
+for number, replica_host in enumerate(filter(None, os.getenv('PG_REPLICA_HOSTS', '').split(',')), 1):
+    replica_host, _, replica_port = replica_host.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['dj_api_market.db.routers.ReplicaRouter']
+
+# Обработчики (имена url), читающие с реплик в запросах GET и HEAD
+REPLICA_VIEWS = [
+    'productinfo-list', 'productinfo-detail', 'Order-list', 'Order-detail', 'order', 'basket',
+    'async-market-list', 'async-market-detail', 'async-partner-orders-list', 'async-partner-orders-detail',
+    'async-order', 'async-basket',
+]
+# Модели, которые всегда читаются из основной базы данных (токен доступен сразу после входа)
+REPLICA_PRIMARY_MODELS = ['authtoken.token']
+# Сколько секунд после записи клиент читает из основной базы данных
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+
+# Число потоков для хеширования паролей при авторизации и регистрации
+PASSWORD_HASHING_WORKERS = int(os.getenv('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -135,6 +187,14 @@ STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Схема OpenAPI генерируется командой generate_openapi в OPENAPI_SCHEMA_DIR, повторно - при изменении
+# исходников OPENAPI_SOURCE_DIRS. Страницы swagger/ и redoc/ загружают схему из сгенерированного файла
+OPENAPI_SCHEMA_DIR = os.getenv('OPENAPI_SCHEMA_DIR', os.path.join(BASE_DIR, 'openapi'))
+OPENAPI_SOURCE_DIRS = [os.path.join(BASE_DIR, 'market'), os.path.join(BASE_DIR, 'dj_api_market')]
+OPENAPI_SCHEMA_MAX_AGE = 300
+SWAGGER_SETTINGS = {'SPEC_URL': ('schema-json', {'format': '.json'})}
+REDOC_SETTINGS = {'SPEC_URL': ('schema-json', {'format': '.json'})}
+
 AUTH_USER_MODEL = 'market.User'
 
 # Default primary key field type
@@ -151,12 +211,122 @@ EMAIL_PORT = '465'
 EMAIL_USE_SSL = True
 SERVER_EMAIL = EMAIL_HOST_USER
 # EMAIL_USE_TLS = True
+EMAIL_TIMEOUT = 30
+
+# Очередь исходящих писем (market.mail): письма, поставленные за MAIL_FLUSH_DELAY секунд,
+# отправляются пачками по MAIL_BATCH_SIZE через одно соединение с почтовым сервером
+MAIL_QUEUE_BACKEND = 'market.mail.RedisMailQueue'
+MAIL_FLUSH_DELAY = 2
+MAIL_BATCH_SIZE = 100
+MAIL_RETRY_DELAY = 60
+MAIL_MAX_ATTEMPTS = 10
+# Очередь отправляет один процесс; блокировка снимается по истечении MAIL_FLUSH_LOCK_TIMEOUT секунд,
+# если отправивший процесс завершился аварийно
+MAIL_FLUSH_LOCK_TIMEOUT = 600
+
+# Outbox задач Celery (market.outbox): ретранслятор передает задачи в брокер пачками по OUTBOX_BATCH_SIZE,
+# после неудачной попытки сообщение откладывается на OUTBOX_RETRY_DELAY * 2 ** (попытка - 1) секунд,
+# но не больше OUTBOX_RETRY_MAX_DELAY. Ошибки брокера не ограничивают число попыток
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_RETRY_DELAY = 1
+OUTBOX_RETRY_MAX_DELAY = 300
 
 REDIS_HOST = os.getenv('REDIS_HOST', 'redis')
 REDIS_PORT = os.getenv('REDIS_PORT', '6379')
 BROKER_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/0'
-BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600}
+# priority_steps и queue_order_strategy включают приоритеты задач в Redis (0 - наивысший)
+BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': 3600,
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
 CELERY_RESULT_BACKEND = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/0'
+# Результаты задач никто не читает: задача, которой нужен результат, включает его явно (ignore_result=False)
+CELERY_IGNORE_RESULT = True
+# Задача подтверждается после выполнения, воркер берет по одной задаче на процесс:
+# длинная задача не задерживает задачи, уже полученные воркером
+CELERY_ACKS_LATE = True
+CELERYD_PREFETCH_MULTIPLIER = 1
+
+# Очереди задач: письма, импорт прайсов, обслуживание БД. Каждую очередь обрабатывает
+# свой воркер (профиль split в docker-compose.yml) со своим числом процессов
+CELERY_DEFAULT_QUEUE = 'default'
+CELERY_ROUTES = {
+    # письма для входа в аккаунт (подтверждение email, сброс пароля) - с наивысшим приоритетом
+    'market.tasks.send_token_to_email_task': {'queue': 'mail', 'priority': 0},
+    'market.tasks.flush_mail_task': {'queue': 'mail', 'priority': 0},
+    'market.tasks.send_*': {'queue': 'mail', 'priority': 5},
+    'market.tasks.import_*': {'queue': 'imports'},
+    'market.tasks.create_order_partitions_task': {'queue': 'maintenance'},
+    'market.tasks.purge_*': {'queue': 'maintenance'},
+    'market.tasks.sample_queues_task': {'queue': 'maintenance'},
+    'market.tasks.explain_slow_query_task': {'queue': 'maintenance'},
+}
+# Ограничения частоты выполнения задач одним воркером
+CELERY_ANNOTATIONS = {
+    'market.tasks.send_tokens_to_emails_task': {'rate_limit': '30/m'},
+    'market.tasks.send_orders_state_mail_task': {'rate_limit': '60/m'},
+}
+CELERYBEAT_SCHEDULE = {
+    # секции таблиц заказов создаются заранее, на несколько месяцев вперед
+    'create-order-partitions': {
+        'task': 'market.tasks.create_order_partitions_task',
+        'schedule': timedelta(days=1),
+    },
+    'purge-stale-auth-tokens': {
+        'task': 'market.tasks.purge_stale_auth_tokens_task',
+        'schedule': timedelta(hours=1),
+    },
+    # отправка писем, оставшихся в очереди (например, если запланированная отправка потеряна)
+    'flush-mail': {
+        'task': 'market.tasks.flush_mail_task',
+        'schedule': timedelta(minutes=1),
+    },
+    # длина очередей для метрик
+    'sample-queues': {
+        'task': 'market.tasks.sample_queues_task',
+        'schedule': timedelta(seconds=30),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'market.cache.RedisCache',
+        'LOCATION': 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/1',
+    }
+}
+
+# Хранилище метрик (market.metrics)
+METRICS_BACKEND = 'market.metrics.RedisBackend'
+METRICS_REDIS_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/2'
+# Границы гистограммы времени обработки HTTP запросов, секунды
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+# Токен для сбора метрик Prometheus (GET /metrics, заголовок "Authorization: Bearer <токен>").
+# Если не задан, метрики доступны без авторизации (nginx закрывает /metrics снаружи)
+METRICS_SCRAPE_TOKEN = os.getenv('METRICS_SCRAPE_TOKEN')
+MAIL_QUEUE_REDIS_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/3'
+
+# Кэш аутентификации по токену: LOCAL_SIZE записей и LOCAL_TTL секунд в памяти процесса,
+# TTL секунд в Redis
+AUTH_TOKEN_CACHE = {
+    'LOCAL_SIZE': 10000,
+    'LOCAL_TTL': 5,
+    'TTL': 300,
+}
+
+# Время жизни токена авторизации. Токен продлевается при использовании,
+# но записывается в БД не чаще раза в AUTH_TOKEN_RENEW_INTERVAL
+AUTH_TOKEN_TTL = timedelta(days=int(os.getenv('AUTH_TOKEN_TTL_DAYS', '7')))
+AUTH_TOKEN_RENEW_INTERVAL = timedelta(hours=1)
+# Время жизни токена подтверждения email и сброса пароля
+CONFIRM_TOKEN_TTL = timedelta(days=3)
+# Размер пачки при удалении просроченных токенов
+AUTH_PURGE_BATCH_SIZE = 500
+
+# Массовая регистрация пользователей: максимальное число строк в запросе и размер пачки записи в БД
+BULK_PROVISION_MAX_ROWS = 5000
+BULK_PROVISION_BATCH_SIZE = 500
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
@@ -167,8 +337,49 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 2,
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'market.authentication.CachedTokenAuthentication',
     ),
 
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
+
+# Сколько секунд ответы каталога могут храниться в кэшах клиентов и nginx (Cache-Control: max-age)
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', 5))
+
+# Бюджеты запросов к БД для обработчиков: "имя обработчика" или "имя обработчика:МЕТОД" - число запросов.
+# Число запросов не должно зависеть от объема данных, при превышении бюджета QueryBudgetMiddleware
+# пишет предупреждение в лог ('log') или выбрасывает исключение ('raise', используется в тестах)
+QUERY_BUDGETS = {
+    'user-login:POST': 6,
+    'user-logout:POST': 2,
+    'user-details:GET': 3,
+    'order:GET': 5,
+    'order:POST': 8,
+    'Order-list:GET': 5,
+    'partner-orders-state:POST': 5,
+    'async-basket:GET': 8,
+    'async-order:GET': 5,
+    'async-partner-orders-list:GET': 5,
+}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'log')
+
+# Профилирование запросов сотрудников (market/profiling.py): запросы с заголовком PROFILING_HEADER
+# и доля PROFILING_SAMPLE_RATE остальных. Профиль хранит не больше PROFILING_MAX_EVENTS вызовов и возвратов
+# функций и PROFILING_MAX_QUERIES запросов к БД, в базе хранятся последние PROFILING_KEEP профилей
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_HEADER = 'X-Profile'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MAX_EVENTS = 500000
+PROFILING_MAX_QUERIES = 1000
+PROFILING_KEEP = 500
+
+# Медленные запросы к БД (market/slow_queries.py): запросы дольше SLOW_QUERY_THRESHOLD секунд (None - не
+# записывать) сохраняются с агрегацией по отпечатку SQL без значений параметров. Для доли SLOW_QUERY_EXPLAIN_RATE
+# медленных SELECT записывается план выполнения (EXPLAIN ANALYZE не дольше SLOW_QUERY_EXPLAIN_TIMEOUT секунд).
+# Для плана параметры запроса (email, ключи токенов и т.п.) передаются через outbox и брокер, поэтому
+# по умолчанию планы не записываются
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.5))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', 0))
+SLOW_QUERY_EXPLAIN_TIMEOUT = 30
+SLOW_QUERY_STACK_DEPTH = 15
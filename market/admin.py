@@ -1,8 +1,17 @@
+import zlib
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from market.catalog import bump_version
 from market.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter,\
-    Order, OrderItem, Contact, ConfirmEmailToken
+    Order, OrderItem, Contact, ConfirmEmailToken, OutboxMessage, RequestProfile, SlowQuery
 
 
 @admin.register(User)
@@ -50,7 +59,18 @@ class ParameterAdmin(admin.ModelAdmin):
 
 @admin.register(ProductParameter)
 class ProductParameterAdmin(admin.ModelAdmin):
-    pass
+    """
+    Удаление параметра меняет каталог магазина (изменения учитываются сигналами в market/signals.py)
+    """
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_version(obj.product_info.shop_id)
+
+    def delete_queryset(self, request, queryset):
+        shop_ids = set(queryset.values_list('product_info__shop_id', flat=True))
+        super().delete_queryset(request, queryset)
+        bump_version(*shop_ids)
 
 
 @admin.register(Order)
@@ -71,3 +91,94 @@ class ContactAdmin(admin.ModelAdmin):
 @admin.register(ConfirmEmailToken)
 class ConfirmEmailTokenAdmin(admin.ModelAdmin):
     list_display = ('user', 'key', 'created_at',)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'created_at', 'attempts', 'next_attempt_at', 'dead')
+    list_filter = ('dead', 'task')
+    readonly_fields = ('created_at', 'last_error')
+    actions = ['retry']
+
+    @admin.action(description='Отправить повторно')
+    def retry(self, request, queryset):
+        queryset.update(dead=False, attempts=0, next_attempt_at=timezone.now())
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Профили запросов (market/profiling.py) со ссылками на скачивание в форматах pstats и speedscope
+    """
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration', 'queries', 'db_time', 'user',
+                    'downloads')
+    list_filter = ('method', 'view_name', 'status_code')
+    search_fields = ('path',)
+    exclude = ('stats', 'speedscope')
+    readonly_fields = ('created_at', 'user', 'method', 'path', 'view_name', 'status_code', 'duration',
+                       'queries', 'db_time', 'truncated', 'sql', 'downloads')
+
+    # файл - (расширение, тип содержимого)
+    formats = {
+        'pstats': ('prof', 'application/octet-stream'),
+        'speedscope': ('speedscope.json', 'application/json'),
+    }
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user').defer('stats', 'speedscope', 'sql')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/<str:file_format>/', self.admin_site.admin_view(self.download),
+                 name='market_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download(self, request, pk, file_format):
+        if file_format not in self.formats or not self.has_view_permission(request):
+            raise PermissionDenied
+        record = get_object_or_404(RequestProfile, pk=pk)
+        extension, content_type = self.formats[file_format]
+        content = bytes(record.stats) if file_format == 'pstats' else zlib.decompress(record.speedscope)
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="profile-{record.id}.{extension}"'
+        return response
+
+    @admin.display(description='Скачать')
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">pstats</a> / <a href="{}">speedscope</a>',
+            reverse('admin:market_requestprofile_download', args=[obj.pk, 'pstats']),
+            reverse('admin:market_requestprofile_download', args=[obj.pk, 'speedscope']),
+        )
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    """
+    Медленные запросы к БД по отпечаткам, по умолчанию - по убыванию суммарного времени
+    """
+    list_display = ('statement_start', 'calls', 'total_time', 'max_time', 'view', 'last_seen', 'has_plan')
+    list_filter = ('view',)
+    search_fields = ('statement', 'view')
+    readonly_fields = ('fingerprint', 'statement', 'calls', 'total_time', 'max_time', 'view', 'stack',
+                       'first_seen', 'last_seen', 'plan', 'plan_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='SQL')
+    def statement_start(self, obj):
+        return obj.statement[:150]
+
+    @admin.display(description='План', boolean=True)
+    def has_plan(self, obj):
+        return bool(obj.plan)
@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+from redis.exceptions import RedisError
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from market.middleware import count_cache
+
+
+class LocalCache:
+    """
+    Ограниченный по размеру LRU кэш процесса с временем жизни записей
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Кэш процесса живет несколько секунд: изменения пользователя в других процессах
+# сбрасывают только общий кэш в Redis
+local_cache = LocalCache(settings.AUTH_TOKEN_CACHE['LOCAL_SIZE'], settings.AUTH_TOKEN_CACHE['LOCAL_TTL'])
+
+
+def token_cache_key(key):
+    return f'auth-token:{key}'
+
+
+def invalidate_token(key):
+    """
+    Удаляет токен из кэшей
+    """
+    local_cache.delete(key)
+    try:
+        cache.delete(token_cache_key(key))
+    except RedisError:
+        pass
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Удаляет из кэшей токены пользователя
+    """
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+def token_expired(token, now=None):
+    return token.created < (now or timezone.now()) - settings.AUTH_TOKEN_TTL
+
+
+def issue_token(user):
+    """
+    Возвращает действующий токен пользователя, просроченный токен заменяется новым
+    """
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and token_expired(token):
+        token.delete()
+        token = Token.objects.create(user=user)
+    return token
+
+
+# Поле пользователя, которое не попадает в кэш токенов: загружается из БД при обращении к нему
+UNCACHED_USER_FIELDS = {'password'}
+
+
+def dump_token(token):
+    """
+    Данные токена для кэша: JSON с полями пользователя (id, is_active, is_staff и остальными,
+    кроме пароля) и временем продления токена, от которого отсчитывается срок действия.
+    Модели не сериализуются (pickle), поэтому кэш не зависит от версии кода моделей
+    """
+    user = token.user
+    fields = {field.attname: getattr(user, field.attname) for field in user._meta.concrete_fields
+              if field.attname not in UNCACHED_USER_FIELDS}
+    # даты записываются через str: DjangoJSONEncoder отбрасывает микросекунды
+    return json.dumps({'user': fields, 'created': token.created}, default=str)
+
+
+def load_token(model, key, data):
+    """
+    Восстанавливает токен и пользователя из данных кэша (dump_token)
+    """
+    data = json.loads(data)
+    user_model = model._meta.get_field('user').related_model
+    fields = [field for field in user_model._meta.concrete_fields if field.attname in data['user']]
+    user = user_model.from_db(router.db_for_read(user_model), [field.attname for field in fields],
+                              [field.to_python(data['user'][field.attname]) for field in fields])
+    token = model(key=key, user=user, created=parse_datetime(data['created']))
+    token._state.adding = False
+    token._state.db = router.db_for_read(model)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену с кэшированием пары токен - пользователь
+    в кэше процесса и в Redis (JSON, см. dump_token).
+    Токен действует AUTH_TOKEN_TTL с момента последнего продления
+    """
+
+    def authenticate_credentials(self, key):
+        data = local_cache.get(key)
+        count_cache('auth-local', data is not None)
+        if data is None:
+            data = self.get_cached(key)
+            if data is None:
+                try:
+                    token = self.get_model().objects.select_related('user').get(key=key)
+                except self.get_model().DoesNotExist:
+                    raise exceptions.AuthenticationFailed(_('Invalid token.'))
+                data = dump_token(token)
+                self.set_cached(key, data)
+            local_cache.set(key, data)
+
+        # каждый запрос получает свою копию токена и пользователя
+        token = load_token(self.get_model(), key, data)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        now = timezone.now()
+        if token_expired(token, now):
+            token.delete()
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        if token.created < now - settings.AUTH_TOKEN_RENEW_INTERVAL:
+            self.renew(token, now)
+
+        return token.user, token
+
+    def renew(self, token, now):
+        """
+        Продлевает срок действия токена
+        """
+        self.get_model().objects.filter(key=token.key).update(created=now)
+        token.created = now
+        data = dump_token(token)
+        self.set_cached(token.key, data)
+        local_cache.set(token.key, data)
+
+    @staticmethod
+    def get_cached(key):
+        try:
+            return cache.get(token_cache_key(key))
+        except RedisError:
+            return None
+
+    @staticmethod
+    def set_cached(key, data):
+        try:
+            cache.set(token_cache_key(key), data, settings.AUTH_TOKEN_CACHE['TTL'])
+        except RedisError:
+            pass
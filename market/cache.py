@@ -0,0 +1,33 @@
+"""
+Бэкенды кэша Django с учетом попаданий и промахов в метриках HTTP запросов (метрика "cache")
+"""
+from django.core.cache.backends import locmem, redis
+
+from market.middleware import count_cache
+
+_missing = object()
+
+
+class CacheMetricsMixin:
+    # имя кэша в метриках
+    metrics_name = 'default'
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        count_cache(self.metrics_name, value is not _missing)
+        return default if value is _missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version)
+        for key in keys:
+            count_cache(self.metrics_name, key in values)
+        return values
+
+
+class RedisCache(CacheMetricsMixin, redis.RedisCache):
+    pass
+
+
+class LocMemCache(CacheMetricsMixin, locmem.LocMemCache):
+    pass
@@ -0,0 +1,96 @@
+"""
+Условные запросы каталога (ETag, Last-Modified).
+
+Любое изменение записи каталога (импорт прайса, правка в админке или через ORM) увеличивает версию
+каталога магазина (bump_version, сигналы в market/signals.py). ETag ответа каталога строится по адресу
+запроса и версиям каталогов магазинов, поэтому проверка If-None-Match стоит один агрегирующий запрос
+к таблице магазинов вместо выборки товаров: версии только растут, поэтому их сумма вместе с числом
+магазинов меняется при любом изменении каталога, добавлении или удалении магазина.
+"""
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from market.models import Shop
+
+# внутри catalog_update изменения отдельных записей каталога не увеличивают версии
+_batch = ContextVar('catalog_batch', default=False)
+
+
+def bump_version(*shop_ids):
+    """
+    Увеличивает версию каталогов магазинов: закэшированные ответы каталога становятся неактуальными
+    """
+    _bump(shop_ids)
+
+
+def catalog_changed(shop_ids):
+    """
+    Изменилась запись каталога (сигналы моделей каталога): shop_ids - id магазинов или запрос, выбирающий их.
+    Внутри catalog_update ничего не делает, версия увеличивается один раз в конце пакетного изменения
+    """
+    if not _batch.get():
+        _bump(shop_ids)
+
+
+def _bump(shop_ids):
+    Shop.objects.filter(id__in=shop_ids).update(catalog_version=F('catalog_version') + 1,
+                                                catalog_updated_at=timezone.now())
+
+
+@contextmanager
+def catalog_update(*shop_ids):
+    """
+    Пакетное изменение каталогов магазинов (импорт прайса): вместо запроса на каждую измененную запись
+    версии каталогов увеличиваются одним запросом при выходе из блока, в том числе после ошибки -
+    уже сохраненная часть изменений должна сбросить кэш
+    """
+    token = _batch.set(True)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+        bump_version(*shop_ids)
+
+
+def catalog_state(request):
+    """
+    Сводка каталогов магазинов, от которых зависит ответ: время последнего обновления,
+    сумма версий и число магазинов. Учитывается фильтр shop, результат сохраняется в запросе
+    """
+    state = getattr(request, '_catalog_state', None)
+    if state is None:
+        shops = Shop.objects.all()
+        shop_id = request.GET.get('shop')
+        if shop_id and shop_id.isdigit():
+            shops = shops.filter(id=shop_id)
+        state = request._catalog_state = shops.aggregate(
+            last_modified=Max('catalog_updated_at'), versions=Sum('catalog_version'), shops=Count('id'))
+    return state
+
+
+def catalog_etag(request, *args, **kwargs):
+    state = catalog_state(request)
+    digest = hashlib.sha1(request.get_full_path().encode())
+    # ответ зависит от формата (JSON или страница DRF)
+    digest.update(request.META.get('HTTP_ACCEPT', '').encode())
+    digest.update(f'{state["versions"]}:{state["shops"]}'.encode())
+    return digest.hexdigest()
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return catalog_state(request)['last_modified']
+
+
+def patch_catalog_headers(response):
+    """
+    Ответы каталога не зависят от пользователя: разрешено кэширование в общих кэшах (nginx) на CATALOG_MAX_AGE
+    """
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_MAX_AGE)
+    patch_vary_headers(response, ['Accept'])
+    return response
@@ -0,0 +1,29 @@
+from django_filters import rest_framework as filters
+
+from market.models import Order, ProductInfo
+
+
+class OrderFilter(filters.FilterSet):
+    """
+    Фильтрация заказов по статусу и диапазону дат
+    """
+
+    class Meta:
+        model = Order
+        fields = {
+            'state': ['exact', 'in'],
+            'dt': ['gte', 'lte'],
+        }
+
+
+class ProductInfoFilter(filters.FilterSet):
+    """
+    Фильтрация товаров по магазину и категории.
+    Фильтры по id не обращаются к БД при проверке значений и подходят для асинхронных обработчиков
+    """
+    shop = filters.NumberFilter(field_name='shop_id')
+    product__category = filters.NumberFilter(field_name='product__category_id')
+
+    class Meta:
+        model = ProductInfo
+        fields = ['shop', 'product__category']
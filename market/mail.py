@@ -0,0 +1,300 @@
+"""
+Очередь исходящих писем.
+
+Задачи Celery не отправляют письма сами, а ставят их в очередь (queue_mail).
+Постановка в очередь планирует отправку через MAIL_FLUSH_DELAY секунд, поэтому письма,
+поставленные за это время, отправляются одной пачкой (flush) через одно соединение
+с почтовым сервером. Письмо, не отправленное из-за временной ошибки, откладывается: оно ждет
+MAIL_RETRY_DELAY секунд вне очереди (отложенные письма упорядочены по времени повтора) и возвращается
+в очередь отправкой, запущенной после этого времени (не более MAIL_MAX_ATTEMPTS попыток).
+
+Взятые из очереди письма переносятся в список обработки и удаляются из него только после отправки
+(или возврата в очередь), поэтому письма не теряются при аварийном завершении воркера: следующая
+отправка возвращает их в очередь. Отправка выполняется одним процессом (блокировка очереди).
+
+Хранилище очереди задается настройкой MAIL_QUEUE_BACKEND:
+    market.mail.RedisMailQueue - общая очередь всех процессов (по умолчанию);
+    market.mail.LocalMailQueue - очередь в памяти процесса (тесты, разработка).
+"""
+import json
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from collections import deque
+
+import redis
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class LocalMailQueue:
+    """
+    Очередь писем в памяти процесса
+    """
+
+    def __init__(self):
+        self._items = deque()
+        self._processing = []
+        self._deferred = []
+        self._scheduled = False
+        self._locked = False
+        self._lock = threading.Lock()
+
+    def push(self, items):
+        with self._lock:
+            self._items.extend(items)
+
+    def pop(self, count):
+        with self._lock:
+            items = [self._items.popleft() for _ in range(min(count, len(self._items)))]
+            self._processing.extend(items)
+            return items
+
+    def ack(self, item):
+        with self._lock:
+            self._processing.remove(item)
+
+    def restore(self):
+        with self._lock:
+            restored, self._processing = self._processing, []
+            self._items.extendleft(reversed(restored))
+            return len(restored)
+
+    def defer(self, items, due):
+        with self._lock:
+            self._deferred.extend((due, item) for item in items)
+
+    def promote(self, now):
+        with self._lock:
+            due = [item for when, item in self._deferred if when <= now]
+            self._deferred = [(when, item) for when, item in self._deferred if when > now]
+            self._items.extend(due)
+            return len(due)
+
+    def lock(self, timeout):
+        with self._lock:
+            locked, self._locked = self._locked, True
+            return not locked
+
+    def unlock(self):
+        with self._lock:
+            self._locked = False
+
+    def schedule(self, timeout):
+        with self._lock:
+            scheduled, self._scheduled = self._scheduled, True
+            return not scheduled
+
+    def unschedule(self):
+        with self._lock:
+            self._scheduled = False
+
+    def __len__(self):
+        return len(self._items) + len(self._deferred)
+
+
+class RedisMailQueue:
+    """
+    Очередь писем в списке Redis
+    """
+
+    key = 'mail:queue'
+    processing_key = 'mail:processing'
+    deferred_key = 'mail:deferred'
+    flush_key = 'mail:flush-scheduled'
+    lock_key = 'mail:flush-lock'
+
+    def __init__(self):
+        self.client = redis.Redis.from_url(settings.MAIL_QUEUE_REDIS_URL)
+
+    def push(self, items):
+        if items:
+            self.client.rpush(self.key, *items)
+
+    def pop(self, count):
+        # LMOVE атомарно переносит письмо в список обработки: письмо не пропадает между чтением и отправкой
+        with self.client.pipeline(transaction=False) as pipe:
+            for _ in range(count):
+                pipe.lmove(self.key, self.processing_key, 'LEFT', 'RIGHT')
+            items = pipe.execute()
+        return [item.decode() for item in items if item is not None]
+
+    def ack(self, item):
+        self.client.lrem(self.processing_key, 1, item)
+
+    def restore(self):
+        restored = 0
+        while self.client.lmove(self.processing_key, self.key, 'RIGHT', 'LEFT') is not None:
+            restored += 1
+        return restored
+
+    def defer(self, items, due):
+        # отложенные письма - сортированное множество, оценка - время повтора
+        if items:
+            self.client.zadd(self.deferred_key, {item: due for item in items})
+
+    def promote(self, now):
+        items = self.client.zrangebyscore(self.deferred_key, '-inf', now)
+        if items:
+            with self.client.pipeline() as pipe:
+                pipe.rpush(self.key, *items)
+                pipe.zrem(self.deferred_key, *items)
+                pipe.execute()
+        return len(items)
+
+    def lock(self, timeout):
+        return bool(self.client.set(self.lock_key, 1, nx=True, ex=timeout))
+
+    def unlock(self):
+        self.client.delete(self.lock_key)
+
+    def schedule(self, timeout):
+        return bool(self.client.set(self.flush_key, 1, nx=True, ex=timeout))
+
+    def unschedule(self):
+        self.client.delete(self.flush_key)
+
+    def __len__(self):
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.llen(self.key)
+            pipe.zcard(self.deferred_key)
+            return sum(pipe.execute())
+
+
+_queues = {}
+_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Очередь писем из настройки MAIL_QUEUE_BACKEND (один экземпляр на процесс)
+    """
+    path = settings.MAIL_QUEUE_BACKEND
+    queue = _queues.get(path)
+    if queue is None:
+        with _lock:
+            queue = _queues.get(path) or _queues.setdefault(path, import_string(path)())
+    return queue
+
+
+def queue_mail(messages, delay=None):
+    """
+    Ставит письма в очередь и планирует отправку.
+    messages - список кортежей (адрес, тема, текст)
+    """
+    items = [json.dumps({'to': to, 'subject': subject, 'body': body, 'attempts': 0})
+             for to, subject, body in messages if to]
+    if not items:
+        return 0
+    get_queue().push(items)
+    schedule_flush(settings.MAIL_FLUSH_DELAY if delay is None else delay)
+    return len(items)
+
+
+def schedule_flush(delay):
+    """
+    Планирует отправку очереди, если она еще не запланирована
+    """
+    from market.tasks import flush_mail_task
+
+    if get_queue().schedule(max(int(delay), 1) * 2):
+        flush_mail_task.apply_async(countdown=delay)
+
+
+def is_transient(error):
+    """
+    Временная ошибка: письмо можно отправить повторно
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return any(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    # ошибки сети (таймауты, разрыв соединения); остальные ошибки SMTP постоянные
+    return not isinstance(error, smtplib.SMTPException) and isinstance(error, OSError)
+
+
+def build_message(item):
+    return EmailMultiAlternatives(item['subject'], item['body'], settings.EMAIL_HOST_USER, [item['to']])
+
+
+def flush(batch_size=None):
+    """
+    Отправляет письма из очереди пачками по batch_size через одно соединение.
+    Возвращает число отправленных писем и писем, возвращенных в очередь
+    """
+    queue = get_queue()
+    queue.unschedule()
+    if not queue.lock(settings.MAIL_FLUSH_LOCK_TIMEOUT):
+        # очередь отправляет другой процесс: письма, поставленные после его последней пачки, отправит следующий запуск
+        schedule_flush(settings.MAIL_FLUSH_DELAY)
+        return 0, 0
+    batch_size = batch_size or settings.MAIL_BATCH_SIZE
+    sent, retry = 0, []
+
+    connection = get_connection()
+    try:
+        restored = queue.restore()
+        if restored:
+            logger.warning('%s mails left in processing are returned to the queue', restored)
+        # отложенные письма, время повтора которых наступило
+        queue.promote(time.time())
+        while True:
+            items = [(raw, json.loads(raw)) for raw in queue.pop(batch_size)]
+            for number, (raw, item) in enumerate(items):
+                try:
+                    # соединение открывается один раз и переоткрывается только после разрыва
+                    connection.open()
+                except Exception as error:
+                    # почтовый сервер недоступен: оставшиеся письма пачки откладываем
+                    logger.warning('Mail server is not available: %s', error)
+                    retry.extend(items[number:])
+                    return sent, _requeue(queue, retry)
+                try:
+                    connection.send_messages([build_message(item)])
+                except Exception as error:
+                    if not isinstance(error, smtplib.SMTPResponseException):
+                        connection.close()
+                    if is_transient(error):
+                        retry.append((raw, item))
+                        continue
+                    logger.error('Mail to %s is not sent: %s', item['to'], error)
+                else:
+                    sent += 1
+                queue.ack(raw)
+            if len(items) < batch_size:
+                return sent, _requeue(queue, retry)
+    finally:
+        connection.close()
+        queue.unlock()
+
+
+def _requeue(queue, items):
+    """
+    Откладывает письма для повторной отправки через MAIL_RETRY_DELAY секунд
+    и удаляет их из списка обработки
+    """
+    requeued = []
+    for _, item in items:
+        item['attempts'] += 1
+        if item['attempts'] < settings.MAIL_MAX_ATTEMPTS:
+            # отложенные письма различаются id: одинаковые письма не сливаются в сортированном множестве
+            item.setdefault('id', uuid.uuid4().hex)
+            requeued.append(json.dumps(item))
+        else:
+            logger.error('Mail to %s is not sent after %s attempts', item['to'], item['attempts'])
+    queue.defer(requeued, time.time() + settings.MAIL_RETRY_DELAY)
+    for raw, _ in items:
+        queue.ack(raw)
+    if requeued:
+        from market.tasks import flush_mail_task
+
+        # отправки, запущенные раньше (новые письма, периодическая задача), отложенные письма не отправляют
+        flush_mail_task.apply_async(countdown=settings.MAIL_RETRY_DELAY)
+    return len(requeued)
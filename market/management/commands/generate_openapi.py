@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from dj_api_market.openapi import generate
+
+
+class Command(BaseCommand):
+    help = 'Генерация файлов схемы OpenAPI (swagger.json, swagger.yaml), если изменился код'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir',
+                            help='Каталог для файлов схемы, по умолчанию OPENAPI_SCHEMA_DIR')
+        parser.add_argument('--force', action='store_true',
+                            help='Сгенерировать схему, даже если код не изменился')
+
+    def handle(self, *args, **options):
+        if generate(options['output_dir'], force=options['force']):
+            self.stdout.write('Схема OpenAPI сгенерирована')
+        else:
+            self.stdout.write('Код не изменился, схема OpenAPI актуальна')
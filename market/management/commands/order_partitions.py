@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from market.partitions import create_partitions, detach_partitions
+
+
+class Command(BaseCommand):
+    help = 'Создание будущих и отключение старых секций таблиц заказов (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3,
+                            help='На сколько месяцев вперед создать секции')
+        parser.add_argument('--detach-before', metavar='YYYY-MM-DD',
+                            help='Отключить помесячные секции, целиком лежащие раньше этой даты (секции *_legacy не отключаются)')
+        parser.add_argument('--drop', action='store_true',
+                            help='Удалить отключенные секции вместо сохранения их отдельными таблицами')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Секционирование заказов поддерживается только для PostgreSQL')
+
+        for name in create_partitions(connection, months=options['months']):
+            self.stdout.write(f'Создана секция {name}')
+
+        if options['detach_before']:
+            try:
+                before = datetime.strptime(options['detach_before'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            except ValueError as error:
+                raise CommandError(str(error))
+            try:
+                for name in detach_partitions(connection, before, drop=options['drop']):
+                    self.stdout.write(f'Отключена секция {name}')
+            except OperationalError as error:
+                # блокировку таблицы не удалось получить: уже отключенные секции остаются отключенными
+                raise CommandError(f'Не удалось отключить секцию, повторите позже: {error}')
+        elif options['drop']:
+            raise CommandError('--drop используется только вместе с --detach-before')
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from market.outbox import relay
+
+
+class Command(BaseCommand):
+    help = 'Передача задач из outbox в брокер Celery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Пауза между проверками outbox, секунды')
+        parser.add_argument('--batch-size', type=int,
+                            help='Число сообщений, передаваемых за одну транзакцию')
+        parser.add_argument('--once', action='store_true',
+                            help='Передать накопившиеся сообщения и завершить работу')
+
+    def handle(self, *args, **options):
+        while True:
+            relayed = relay(options['batch_size'])
+            if options['once']:
+                self.stdout.write(f'Передано сообщений: {relayed}')
+                return
+            if not relayed:
+                time.sleep(options['interval'])
@@ -0,0 +1,53 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from market.models import User
+from market.partitions import create_partitions
+from market.seeding import EMAIL_DOMAIN, HISTORY_MONTHS, SCALES, Loader, Marketplace
+
+SIZES = {'shops': 'магазинов', 'categories': 'категорий', 'products': 'товаров', 'buyers': 'покупателей'}
+
+
+class Command(BaseCommand):
+    help = 'Создание детерминированной синтетической площадки для замеров производительности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small',
+                            help='Масштаб: ' + ', '.join(f'{name} ({sizes["products"]} товаров)'
+                                                         for name, sizes in SCALES.items()))
+        parser.add_argument('--seed', type=int, default=1, help='Seed генератора')
+        parser.add_argument('--end-date', metavar='YYYY-MM-DD',
+                            help='Дата окончания истории заказов (по умолчанию - сегодня)')
+        for name, title in SIZES.items():
+            parser.add_argument(f'--{name}', type=int, help=f'Число {title} вместо заданного масштабом')
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] if options[name] is not None else value
+                 for name, value in SCALES[options['scale']].items()}
+        if any(value < 1 for value in sizes.values()):
+            raise CommandError('Размеры площадки должны быть положительными')
+        try:
+            end = (datetime.strptime(options['end_date'], '%Y-%m-%d') if options['end_date']
+                   else datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+        except ValueError as error:
+            raise CommandError(str(error))
+        if User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').exists():
+            raise CommandError(f'Данные площадки уже созданы (пользователи @{EMAIL_DOMAIN})')
+
+        marketplace = Marketplace(end=end, seed=options['seed'], **sizes)
+        start = time.perf_counter()
+        with transaction.atomic():
+            # секции истории заказов создаются до загрузки, иначе строки попадут в секцию по умолчанию
+            create_partitions(connection, months=HISTORY_MONTHS + 1, start=end - timedelta(days=30 * HISTORY_MONTHS))
+            counts = marketplace.load(Loader(connection))
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in counts:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        for model, count in counts.items():
+            self.stdout.write(f'{model._meta.db_table}: {count}')
+        self.stdout.write(f'Площадка создана за {time.perf_counter() - start:.1f} с')
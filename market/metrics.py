@@ -0,0 +1,152 @@
+"""
+Агрегированные метрики сервиса.
+
+Метрика - набор счетчиков, сгруппированных по ключу (например, "order:GET"):
+    metrics.incr('queries', 'order:GET', requests=1, queries=12, db_time=0.031)
+    metrics.collect('queries') -> {'order:GET': {'requests': 1.0, 'queries': 12.0, 'db_time': 0.031}}
+Текущие значения (например, длина очереди) записываются вместо увеличения:
+    metrics.set('queues', 'mail', depth=15)
+Несколько метрик увеличиваются за одно обращение к хранилищу:
+    metrics.incr_many([('http', 'order:GET:200', {'requests': 1}), ('cache', 'default', {'hits': 2})])
+
+Хранилище задается настройкой METRICS_BACKEND:
+    market.metrics.RedisBackend - общие счетчики всех процессов (по умолчанию);
+    market.metrics.LocalBackend - счетчики в памяти процесса (тесты, разработка).
+"""
+import logging
+import threading
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBackend:
+    """
+    Счетчики в памяти процесса
+    """
+
+    def __init__(self):
+        self._data = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+        self._lock = threading.Lock()
+
+    def incr(self, name, key, values):
+        self.incr_many([(name, key, values)])
+
+    def incr_many(self, items):
+        with self._lock:
+            for name, key, values in items:
+                counters = self._data[name][key]
+                for field, value in values.items():
+                    counters[field] += value
+
+    def set(self, name, key, values):
+        with self._lock:
+            self._data[name][key].update(values)
+
+    def collect(self, name):
+        with self._lock:
+            return {key: dict(counters) for key, counters in self._data[name].items()}
+
+    def clear(self, name=None):
+        with self._lock:
+            if name is None:
+                self._data.clear()
+            else:
+                self._data.pop(name, None)
+
+
+class RedisBackend:
+    """
+    Счетчики в Redis: метрика - хеш, поле хеша - "ключ|счетчик".
+    Недоступность Redis не влияет на обработку запросов, значения теряются
+    """
+
+    prefix = 'metrics:'
+    separator = '|'
+
+    def __init__(self):
+        self.client = redis.Redis.from_url(settings.METRICS_REDIS_URL)
+
+    def incr(self, name, key, values):
+        self.incr_many([(name, key, values)])
+
+    def incr_many(self, items):
+        try:
+            with self.client.pipeline(transaction=False) as pipe:
+                for name, key, values in items:
+                    for field, value in values.items():
+                        pipe.hincrbyfloat(self.prefix + name, f'{key}{self.separator}{field}', value)
+                pipe.execute()
+        except RedisError as error:
+            logger.warning('Metrics are not saved: %s', error)
+
+    def set(self, name, key, values):
+        try:
+            self.client.hset(self.prefix + name,
+                             mapping={f'{key}{self.separator}{field}': value for field, value in values.items()})
+        except RedisError as error:
+            logger.warning('Metrics are not saved: %s', error)
+
+    def collect(self, name):
+        try:
+            data = self.client.hgetall(self.prefix + name)
+        except RedisError as error:
+            logger.warning('Metrics are not available: %s', error)
+            return {}
+        result = defaultdict(dict)
+        for field, value in data.items():
+            key, _, counter = field.decode().rpartition(self.separator)
+            result[key][counter] = float(value)
+        return dict(result)
+
+    def clear(self, name=None):
+        try:
+            if name is None:
+                keys = list(self.client.scan_iter(self.prefix + '*'))
+                if keys:
+                    self.client.delete(*keys)
+            else:
+                self.client.delete(self.prefix + name)
+        except RedisError as error:
+            logger.warning('Metrics are not cleared: %s', error)
+
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Хранилище метрик из настройки METRICS_BACKEND (один экземпляр на процесс)
+    """
+    path = settings.METRICS_BACKEND
+    backend = _backends.get(path)
+    if backend is None:
+        with _lock:
+            backend = _backends.setdefault(path, import_string(path)())
+    return backend
+
+
+def incr(name, key, **values):
+    get_backend().incr(name, key, values)
+
+
+def incr_many(items):
+    get_backend().incr_many(items)
+
+
+def set(name, key, **values):
+    get_backend().set(name, key, values)
+
+
+def collect(name):
+    return get_backend().collect(name)
+
+
+def clear(name=None):
+    get_backend().clear(name)
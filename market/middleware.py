@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+from dj_api_market.db.routers import RoutingState, current_routing
+from market import metrics
+
+logger = logging.getLogger(__name__)
+
+# счетчик запросов к БД текущего HTTP запроса. Контекст копируется в потоки sync_to_async,
+# поэтому запросы асинхронных обработчиков учитываются так же, как синхронных
+current_counter = ContextVar('query_counter', default=None)
+# статистика текущего HTTP запроса для метрик (обращения к кэшам)
+current_stats = ContextVar('request_stats', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Обработчик выполнил больше запросов к БД, чем разрешено бюджетом
+    """
+
+
+class QueryCounter:
+    """
+    Число запросов к БД и время их выполнения
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Обертка выполнения запросов к БД, устанавливается на каждое соединение (см. market/signals.py)
+    """
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.queries += 1
+        counter.db_time += time.perf_counter() - start
+
+
+def install_query_counter(connection):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+def endpoint_name(request):
+    """
+    Имя обработчика и метод запроса: "order:GET"
+    """
+    match = request.resolver_match
+    return f'{match.view_name if match else "unresolved"}:{request.method}'
+
+
+def query_budget(endpoint):
+    """
+    Бюджет запросов к БД для обработчика из настройки QUERY_BUDGETS.
+    Бюджет для метода ("order:GET") важнее бюджета обработчика ("order")
+    """
+    budgets = settings.QUERY_BUDGETS
+    view_name = endpoint.rpartition(':')[0]
+    return budgets.get(endpoint, budgets.get(view_name, settings.QUERY_BUDGET_DEFAULT))
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает запросы к БД и время их выполнения для каждого обработчика и метода,
+    сохраняет агрегаты в метрику "queries". Если подключен RequestMetricsMiddleware,
+    метрика записывается вместе с остальными метриками запроса за одно обращение к хранилищу.
+    При превышении бюджета (QUERY_BUDGETS) пишет предупреждение в лог,
+    при QUERY_BUDGET_MODE = 'raise' выбрасывает QueryBudgetExceeded.
+    Работает и в WSGI, и в ASGI (без перевода асинхронных обработчиков в синхронный режим)
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        self.record(request, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        await sync_to_async(self.record, thread_sensitive=False)(request, counter)
+        return response
+
+    @staticmethod
+    def record(request, counter):
+        endpoint = endpoint_name(request)
+        budget = query_budget(endpoint)
+        over_budget = budget is not None and counter.queries > budget
+
+        values = {'requests': 1, 'queries': counter.queries, 'db_time': counter.db_time,
+                  'over_budget': int(over_budget)}
+        stats = current_stats.get()
+        if stats is not None:
+            stats.metrics.append(('queries', endpoint, values))
+        else:
+            metrics.incr('queries', endpoint, **values)
+
+        if over_budget:
+            message = f'{endpoint}: {counter.queries} queries to the database, budget {budget}'
+            if settings.QUERY_BUDGET_MODE == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+def primary_cache_key(request):
+    """
+    Ключ кэша, по которому запросы клиента после записи читают из основной базы данных.
+    Клиент определяется по заголовку Authorization, для запросов без него - None
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return f'db-primary:{hashlib.sha1(authorization.encode()).hexdigest()}'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Разрешает чтение с реплик БД в обработчиках из REPLICA_VIEWS для методов GET и HEAD.
+    После записи клиент REPLICA_STICKY_SECONDS читает из основной базы данных,
+    поэтому видит свои изменения, даже если реплика отстает
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        self.stick(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if state.wrote and settings.DATABASE_REPLICAS:
+            await sync_to_async(self.stick, thread_sensitive=False)(request, state)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = current_routing.get()
+        if state is None or request.method not in ('GET', 'HEAD') or not settings.DATABASE_REPLICAS:
+            return None
+        if request.resolver_match.view_name not in settings.REPLICA_VIEWS:
+            return None
+        key = primary_cache_key(request)
+        try:
+            state.replica = key is None or not cache.get(key)
+        except RedisError:
+            state.replica = False
+        return None
+
+    @staticmethod
+    def stick(request, state):
+        if not state.wrote or not settings.DATABASE_REPLICAS:
+            return
+        key = primary_cache_key(request)
+        if key is None:
+            return
+        try:
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+        except RedisError as error:
+            logger.warning('Primary database stickiness is not saved: %s', error)
+
+
+class RequestStats:
+    """
+    Попадания и промахи кэшей за время запроса: имя кэша - [попадания, промахи],
+    и метрики других middleware, которые записываются вместе с метриками запроса
+    """
+
+    def __init__(self):
+        self.cache = defaultdict(lambda: [0, 0])
+        self.metrics = []
+
+
+def count_cache(name, hit):
+    """
+    Учитывает обращение к кэшу name в метриках текущего HTTP запроса
+    """
+    stats = current_stats.get()
+    if stats is not None:
+        stats.cache[name][0 if hit else 1] += 1
+
+
+class RequestMetricsMiddleware:
+    """
+    Записывает метрики HTTP запросов:
+    "http" (ключ "обработчик:МЕТОД:статус") - число запросов, время обработки (сумма и гистограмма
+    по границам METRICS_LATENCY_BUCKETS), размер ответов;
+    "cache" (ключ - имя кэша) - попадания и промахи;
+    метрики вложенных middleware (например, "queries" от QueryBudgetMiddleware).
+    Все метрики запроса пишутся в общее хранилище (market.metrics) одним вызовом incr_many,
+    поэтому суммируются по всем процессам
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        await sync_to_async(self.record, thread_sensitive=False)(
+            request, response, time.perf_counter() - start, stats)
+        return response
+
+    @staticmethod
+    def record(request, response, duration, stats):
+        if response.streaming:
+            size = int(response.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+        values = {'requests': 1, 'duration': duration, 'response_bytes': size}
+        for bound in settings.METRICS_LATENCY_BUCKETS:
+            if duration <= bound:
+                values[f'le_{bound}'] = 1
+
+        items = [('http', f'{endpoint_name(request)}:{response.status_code}', values)]
+        items += [('cache', name, {'hits': hits, 'misses': misses}) for name, (hits, misses) in stats.cache.items()]
+        items += stats.metrics
+        metrics.incr_many(items)
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.7 on 2026-10-19 12:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_orderitem_shop(apps, schema_editor):
+    """
+    Заполняем магазин у уже существующих позиций заказов
+    """
+    OrderItem = apps.get_model('market', 'OrderItem')
+    ProductInfo = apps.get_model('market', 'ProductInfo')
+    OrderItem.objects.filter(shop__isnull=True).update(
+        shop_id=models.Subquery(
+            ProductInfo.objects.filter(id=models.OuterRef('product_info_id')).values('shop_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ordered_items', to='market.shop', verbose_name='Магазин'),
+        ),
+        migrations.RunPython(fill_orderitem_shop, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['state', '-dt'], name='order_state_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['shop', 'order'], name='orderitem_shop_order_idx'),
+        ),
+    ]
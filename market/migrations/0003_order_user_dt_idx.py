@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0002_orderitem_shop'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-dt'], name='order_user_dt_idx'),
+        ),
+    ]
@@ -0,0 +1,187 @@
+# Generated by Django 4.1.7 on 2026-10-19 13:05
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Определения секционирования зафиксированы в миграции и не зависят от текущего кода приложения
+# (market/partitions.py, STATE_CHOICES): последующие изменения моделей не меняют историю миграций
+ORDER_TABLE = 'market_order'
+ORDER_ITEM_TABLE = 'market_orderitem'
+ORDER_HISTORY_TABLE = 'market_order_history'
+HISTORY_STATES = ['new', 'confirmed', 'assembled', 'sent', 'delivered', 'canceled']
+MONTHLY_TABLES = {
+    ORDER_HISTORY_TABLE: 'dt',
+    ORDER_ITEM_TABLE: 'order_dt',
+}
+FUTURE_MONTHS = 3
+
+
+def fill_orderitem_order_dt(apps, schema_editor):
+    """
+    Копируем дату заказа в уже существующие позиции заказов
+    """
+    OrderItem = apps.get_model('market', 'OrderItem')
+    Order = apps.get_model('market', 'Order')
+    OrderItem.objects.filter(order_dt__isnull=True).update(
+        order_dt=models.Subquery(Order.objects.filter(id=models.OuterRef('order_id')).values('dt')[:1]))
+
+
+def month_start(value, shift=0):
+    month = value.year * 12 + value.month - 1 + shift
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def partition_tables(connection):
+    """
+    Переводит market_order и market_orderitem на секционированное хранение.
+    Существующие таблицы становятся секциями *_legacy за период до начала следующего месяца
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    cutover = month_start(datetime.now(timezone.utc), shift=1)
+    states = ', '.join(f"'{state}'" for state in HISTORY_STATES)
+
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor, ORDER_TABLE):
+            return
+
+        legacy_order = convert_to_parent(cursor, ORDER_TABLE, 'LIST (state)', ['state', 'dt'])
+        cursor.execute(f"CREATE TABLE market_order_basket PARTITION OF {ORDER_TABLE} FOR VALUES IN ('basket')")
+        cursor.execute(f"CREATE TABLE {ORDER_HISTORY_TABLE} PARTITION OF {ORDER_TABLE} "
+                       f"FOR VALUES IN ({states}) PARTITION BY RANGE (dt)")
+        cursor.execute(f"CREATE TABLE market_order_default PARTITION OF {ORDER_TABLE} DEFAULT")
+        cursor.execute(f"CREATE TABLE {ORDER_HISTORY_TABLE}_default PARTITION OF {ORDER_HISTORY_TABLE} DEFAULT")
+
+        # корзины (и заказы с неизвестными статусами) переносим в их секции,
+        # в legacy остаются только оформленные заказы
+        cursor.execute(f"INSERT INTO {ORDER_TABLE} SELECT * FROM {legacy_order} WHERE state NOT IN ({states})")
+        cursor.execute(f"DELETE FROM {legacy_order} WHERE state NOT IN ({states})")
+        attach_legacy(cursor, ORDER_HISTORY_TABLE, legacy_order, f"state IN ({states}) AND dt < %s", cutover)
+
+        legacy_item = convert_to_parent(cursor, ORDER_ITEM_TABLE, 'RANGE (order_dt)', ['order_dt'])
+        cursor.execute(f"CREATE TABLE {ORDER_ITEM_TABLE}_default PARTITION OF {ORDER_ITEM_TABLE} DEFAULT")
+        attach_legacy(cursor, ORDER_ITEM_TABLE, legacy_item, "order_dt < %s", cutover)
+
+        # помесячные секции с начала следующего месяца, дальше их создает задача Celery
+        for shift in range(FUTURE_MONTHS + 1):
+            month = month_start(cutover, shift)
+            for table in MONTHLY_TABLES:
+                cursor.execute(f"CREATE TABLE {table}_y{month.year}m{month.month:02d} PARTITION OF {table} "
+                               f"FOR VALUES FROM (%s) TO (%s)", [month, month_start(month, 1)])
+
+
+def convert_to_parent(cursor, table, partition_by, partition_key):
+    """
+    Переименовывает таблицу в *_legacy и создает на ее месте секционированную таблицу
+    с теми же колонками, индексами и ограничениями. Возвращает имя legacy таблицы
+    """
+    legacy = f'{table}_legacy'
+
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    max_id = cursor.fetchone()[0]
+
+    # индексы, не связанные с ограничениями
+    cursor.execute("""
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass AND NOT EXISTS (
+            SELECT 1 FROM pg_constraint c WHERE c.conrelid = x.indrelid AND c.conindid = x.indexrelid)
+    """, [table])
+    indexes = cursor.fetchall()
+    cursor.execute("""
+        SELECT conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')
+    """, [table])
+    constraints = cursor.fetchall()
+
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    for name, _ in indexes:
+        cursor.execute(f"ALTER INDEX {name} RENAME TO {legacy_name(name)}")
+    for name, _, _ in constraints:
+        cursor.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {name} TO {legacy_name(name)}")
+    cursor.execute(f"ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+    # таблицы, созданные до Django 4.1, используют serial: его последовательность тоже удаляется
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [legacy])
+    sequence = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(f"ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT")
+        cursor.execute(f"DROP SEQUENCE {sequence}")
+
+    cursor.execute(f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING STORAGE) "
+                   f"PARTITION BY {partition_by}")
+    # identity колонки секционированным таблицам недоступны, используем последовательность
+    cursor.execute(f"CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    cursor.execute(f"SELECT setval('{table}_id_seq', %s, %s)", [max(max_id, 1), max_id > 0])
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+
+    # индексы создаются по исходным определениям, они ссылаются на имя таблицы,
+    # которое теперь принадлежит секционированной таблице
+    for _, definition in indexes:
+        cursor.execute(definition)
+    # уникальные ограничения секционированной таблицы обязаны включать ключ секционирования
+    key = ', '.join(partition_key)
+    for name, kind, definition in constraints:
+        if kind == 'p':
+            cursor.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {legacy_name(name)}")
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} PRIMARY KEY (id, {key})")
+        elif kind == 'u':
+            columns = definition[definition.index('(') + 1:definition.rindex(')')]
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE ({columns}, {key})")
+        else:
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    return legacy
+
+
+def attach_legacy(cursor, parent, legacy, condition, cutover):
+    """
+    Подключает legacy таблицу секцией за период до cutover.
+    Проверочное ограничение позволяет PostgreSQL не сканировать таблицу повторно при подключении
+    """
+    cursor.execute(f"ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_bounds CHECK ({condition}) NOT VALID", [cutover])
+    cursor.execute(f"ALTER TABLE {legacy} VALIDATE CONSTRAINT {legacy}_bounds")
+    cursor.execute(f"ALTER TABLE {parent} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO (%s)", [cutover])
+    cursor.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {legacy}_bounds")
+
+
+def legacy_name(name):
+    return f'legacy_{name}'[:63]
+
+
+def create_partitioned_tables(apps, schema_editor):
+    partition_tables(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0003_order_user_dt_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(blank=True, db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='ordered_items', to='market.order', verbose_name='Заказ'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='order_dt',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Дата заказа'),
+        ),
+        migrations.RunPython(fill_orderitem_order_dt, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order_dt',
+            field=models.DateTimeField(editable=False, verbose_name='Дата заказа'),
+        ),
+        migrations.RunPython(create_partitioned_tables, migrations.RunPython.noop),
+    ]
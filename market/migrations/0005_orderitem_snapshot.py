@@ -0,0 +1,54 @@
+# Generated by Django 4.1.7 on 2026-10-19 12:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_orderitem_snapshot(apps, schema_editor):
+    """
+    Фиксируем данные товаров в позициях уже оформленных заказов
+    """
+    OrderItem = apps.get_model('market', 'OrderItem')
+    ProductInfo = apps.get_model('market', 'ProductInfo')
+    product_info = ProductInfo.objects.filter(id=models.OuterRef('product_info_id'))
+    OrderItem.objects.exclude(order__state='basket').update(
+        product_name=models.Subquery(product_info.values('product__name')[:1]),
+        product_model=models.Subquery(product_info.values('model')[:1]),
+        shop_name=models.Subquery(product_info.values('shop__name')[:1]),
+        price=models.Subquery(product_info.values('price')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0004_order_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Цена'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_model',
+            field=models.CharField(blank=True, max_length=80, verbose_name='Модель'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=80, verbose_name='Название'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop_name',
+            field=models.CharField(blank=True, max_length=50, verbose_name='Название магазина'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product_info',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordered_items', to='market.productinfo', verbose_name='Информация о продукте'),
+        ),
+        migrations.RunPython(fill_orderitem_snapshot, migrations.RunPython.noop),
+    ]
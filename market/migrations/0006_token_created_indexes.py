@@ -0,0 +1,25 @@
+# Generated by Django 4.1.7 on 2026-10-19 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0005_orderitem_snapshot'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='confirmemailtoken',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='When was this token generated'),
+        ),
+        # таблица токенов авторизации принадлежит rest_framework.authtoken,
+        # индекс по дате создания нужен для поиска просроченных токенов
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS authtoken_token_created_idx ON authtoken_token (created)',
+            'DROP INDEX IF EXISTS authtoken_token_created_idx',
+        ),
+    ]
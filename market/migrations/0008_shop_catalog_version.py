@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-19 13:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0007_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Каталог обновлен'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия каталога'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.7 on 2026-10-19 13:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0008_shop_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.TextField(verbose_name='Адрес')),
+                ('view_name', models.CharField(blank=True, max_length=100, verbose_name='Обработчик')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Статус ответа')),
+                ('duration', models.FloatField(verbose_name='Время обработки, с')),
+                ('queries', models.PositiveIntegerField(verbose_name='Запросов к БД')),
+                ('db_time', models.FloatField(verbose_name='Время запросов к БД, с')),
+                ('sql', models.JSONField(default=list, verbose_name='Хронология запросов к БД')),
+                ('truncated', models.BooleanField(default=False, verbose_name='Профиль неполный')),
+                ('stats', models.BinaryField(verbose_name='Статистика вызовов')),
+                ('speedscope', models.BinaryField(verbose_name='Профиль speedscope')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
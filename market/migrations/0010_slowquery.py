@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-19 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0009_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True, verbose_name='Отпечаток')),
+                ('statement', models.TextField(verbose_name='Нормализованный SQL')),
+                ('sql', models.TextField(verbose_name='Пример SQL')),
+                ('calls', models.PositiveIntegerField(default=1, verbose_name='Выполнений')),
+                ('total_time', models.FloatField(verbose_name='Суммарное время, с')),
+                ('max_time', models.FloatField(verbose_name='Максимальное время, с')),
+                ('view', models.CharField(blank=True, max_length=100, verbose_name='Обработчик')),
+                ('stack', models.TextField(blank=True, verbose_name='Стек вызова')),
+                ('first_seen', models.DateTimeField(auto_now_add=True, verbose_name='Первое выполнение')),
+                ('last_seen', models.DateTimeField(verbose_name='Последнее выполнение')),
+                ('plan', models.TextField(blank=True, verbose_name='План выполнения')),
+                ('plan_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата плана')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ('-total_time',),
+            },
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 4.1.7 on 2026-10-19 13:44
+
+from django.db import migrations, models
+
+# зафиксировано в миграции, чтобы не зависеть от текущего кода приложения (market/partitions.py)
+ORDER_TABLE = 'market_order'
+BASKET_CONSTRAINT = models.UniqueConstraint(condition=models.Q(('state', 'basket')), fields=('user',),
+                                            name='unique_user_basket')
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def merge_duplicate_baskets(apps, schema_editor):
+    """
+    Оставляем у пользователя самую раннюю корзину, позиции остальных корзин переносим в нее
+    (кроме товаров, которые в ней уже есть)
+    """
+    Order = apps.get_model('market', 'Order')
+    OrderItem = apps.get_model('market', 'OrderItem')
+    duplicates = Order.objects.filter(state='basket').values('user_id').annotate(
+        count=models.Count('id'), first=models.Min('id')).filter(count__gt=1)
+    for row in duplicates:
+        basket = Order.objects.get(id=row['first'])
+        extra = list(Order.objects.filter(user_id=row['user_id'], state='basket').exclude(id=basket.id)
+                     .values_list('id', flat=True))
+        products = set(OrderItem.objects.filter(order_id=basket.id).values_list('product_info_id', flat=True))
+        for item_id, product_info_id in OrderItem.objects.filter(order_id__in=extra).order_by('id').values_list(
+                'id', 'product_info_id'):
+            if product_info_id not in products:
+                products.add(product_info_id)
+                OrderItem.objects.filter(id=item_id).update(order_id=basket.id, order_dt=basket.dt)
+        OrderItem.objects.filter(order_id__in=extra).delete()
+        Order.objects.filter(id__in=extra).delete()
+
+
+def create_basket_constraint(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        partitioned = connection.vendor == 'postgresql' and is_partitioned(cursor, ORDER_TABLE)
+        if partitioned:
+            # уникальный индекс секционированной таблицы обязан включать ключ секционирования (state, dt),
+            # поэтому индекс создается на секции корзин: в ней только корзины
+            cursor.execute(f'CREATE UNIQUE INDEX {BASKET_CONSTRAINT.name} ON {ORDER_TABLE}_basket (user_id)')
+    if not partitioned:
+        schema_editor.add_constraint(apps.get_model('market', 'Order'), BASKET_CONSTRAINT)
+
+
+def drop_basket_constraint(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX IF EXISTS {BASKET_CONSTRAINT.name}')
+    else:
+        schema_editor.remove_constraint(apps.get_model('market', 'Order'), BASKET_CONSTRAINT)
+
+
+def create_product_name_trgm_index(apps, schema_editor):
+    """
+    Поиск по названию в каталоге (product__name__icontains): UPPER(name) LIKE UPPER('%...%').
+    Такой поиск обслуживает только триграммный индекс (PostgreSQL, расширение pg_trgm)
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS product_name_trgm_idx '
+                          'ON market_product USING gin (UPPER(name::text) gin_trgm_ops)')
+
+
+def drop_product_name_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0010_slowquery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'id'], name='productinfo_shop_id_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_baskets, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(model_name='order', constraint=BASKET_CONSTRAINT),
+            ],
+            database_operations=[
+                migrations.RunPython(create_basket_constraint, drop_basket_constraint),
+            ],
+        ),
+        migrations.RunPython(create_product_name_trgm_index, drop_product_name_trgm_index),
+    ]
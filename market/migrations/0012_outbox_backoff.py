@@ -0,0 +1,28 @@
+# Generated by Django 4.1.7 on 2026-10-19 13:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0011_basket_constraint_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='dead',
+            field=models.BooleanField(default=False, verbose_name='Не может быть отправлено'),
+        ),
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(condition=models.Q(('dead', False)), fields=['next_attempt_at'], name='outbox_due_idx'),
+        ),
+    ]
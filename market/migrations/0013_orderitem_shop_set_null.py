@@ -0,0 +1,19 @@
+# Generated by Django 4.1.7 on 2026-10-19 14:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0012_outbox_backoff'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderitem',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordered_items', to='market.shop', verbose_name='Магазин'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-19 14:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0013_orderitem_shop_set_null'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='slowquery',
+            name='sql',
+        ),
+    ]
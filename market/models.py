@@ -2,7 +2,9 @@ from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
-from django.db.models import Sum, F
+from django.db.models import Sum, F, Value as V
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 
@@ -16,6 +18,14 @@ STATE_CHOICES = (
     ('canceled', 'Отменен')
 )
 
+# Допустимые переходы статусов заказа: текущий статус -> возможные новые статусы
+STATE_TRANSITIONS = {
+    'new': ('confirmed', 'canceled'),
+    'confirmed': ('assembled', 'canceled'),
+    'assembled': ('sent', 'canceled'),
+    'sent': ('delivered',),
+}
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель')
@@ -112,6 +122,7 @@ class ConfirmEmailToken(models.Model):
 
     created_at = models.DateTimeField(
         auto_now_add=True,
+        db_index=True,
         verbose_name=_("When was this token generated")
     )
 
@@ -159,6 +170,9 @@ class Shop(models.Model):
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
     state = models.BooleanField(verbose_name='статус получения заказов', default=True)
+    # увеличивается при каждом импорте прайса, по версиям каталогов строятся ETag ответов каталога
+    catalog_version = models.PositiveIntegerField(verbose_name='Версия каталога', default=0)
+    catalog_updated_at = models.DateTimeField(verbose_name='Каталог обновлен', default=timezone.now)
 
     # filename = models.CharField(blank=True)
 
@@ -215,6 +229,10 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
         ]
+        indexes = [
+            # каталог магазина постранично в порядке id (фильтр shop)
+            models.Index(fields=['shop', 'id'], name='productinfo_shop_id_idx'),
+        ]
 
 
 class Parameter(models.Model):
@@ -259,22 +277,76 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказ"
         ordering = ('-dt',)
+        indexes = [
+            models.Index(fields=['state', '-dt'], name='order_state_dt_idx'),
+            models.Index(fields=['user', '-dt'], name='order_user_dt_idx'),
+        ]
+        constraints = [
+            # одна корзина на пользователя, индекс ограничения обслуживает поиск корзины.
+            # В PostgreSQL создается на секции корзин market_order_basket (см. миграцию 0011)
+            models.UniqueConstraint(fields=['user'], condition=models.Q(state='basket'), name='unique_user_basket'),
+        ]
 
     def __str__(self):
         return str(self.dt)
 
     def sum(self):
-        return self.ordered_items.aggregate(total=Sum(F("quantity")*F("product_info__price")))["total"]
+        # если позиции загружены заранее (prefetch_related), сумма считается без запроса к БД.
+        # Как и агрегат SUM, для заказа без позиций с ценой возвращается None
+        prefetched = 'ordered_items' in getattr(self, '_prefetched_objects_cache', {})
+        if self.state == 'basket':
+            # в корзине цены актуальные, из каталога
+            if prefetched:
+                totals = [item.quantity * item.product_info.price
+                          for item in self.ordered_items.all() if item.product_info is not None]
+                return sum(totals) if totals else None
+            return self.ordered_items.aggregate(total=Sum(F("quantity")*F("product_info__price")))["total"]
+        # в оформленном заказе - цены на момент оформления
+        if prefetched:
+            totals = [item.quantity * item.price for item in self.ordered_items.all() if item.price is not None]
+            return sum(totals) if totals else None
+        return self.ordered_items.aggregate(total=Sum(F("quantity")*F("price")))["total"]
+
+
+class OrderItemQuerySet(models.QuerySet):
+
+    def capture_catalog(self, **kwargs):
+        """
+        Сохраняет в позициях заказа название, модель, магазин и цену товара из каталога
+        """
+        product_info = ProductInfo.objects.filter(id=models.OuterRef('product_info_id'))
+        return self.update(product_name=Coalesce(models.Subquery(product_info.values('product__name')[:1]), V('')),
+                           product_model=Coalesce(models.Subquery(product_info.values('model')[:1]), V('')),
+                           shop_name=Coalesce(models.Subquery(product_info.values('shop__name')[:1]), V('')),
+                           price=models.Subquery(product_info.values('price')[:1]),
+                           **kwargs)
 
 
 class OrderItem(models.Model):
+    # Внешний ключ на заказ не создается в БД: в PostgreSQL таблица заказов секционирована
+    # и id заказа в ней не уникален сам по себе (см. market/partitions.py)
     order = models.ForeignKey(Order, verbose_name='Заказ',
                               related_name='ordered_items',
-                              blank=True, on_delete=models.CASCADE)
+                              blank=True, on_delete=models.CASCADE, db_constraint=False)
+    # Дата заказа - ключ секционирования позиций заказов
+    order_dt = models.DateTimeField(verbose_name='Дата заказа', editable=False)
+    # При обновлении прайса поставщиком товары каталога удаляются,
+    # история заказов сохраняется за счет данных товара, зафиксированных при оформлении заказа
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте',
                                      related_name='ordered_items',
-                                     blank=True, on_delete=models.CASCADE)
+                                     blank=True, null=True, on_delete=models.SET_NULL)
+    # Магазин позиции дублируется из product_info, чтобы поставщик получал свои заказы без join по каталогу
+    shop = models.ForeignKey(Shop, verbose_name='Магазин',
+                             related_name='ordered_items',
+                             blank=True, null=True, on_delete=models.SET_NULL)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    # Данные товара на момент оформления заказа
+    product_name = models.CharField(max_length=80, verbose_name='Название', blank=True)
+    product_model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    shop_name = models.CharField(max_length=50, verbose_name='Название магазина', blank=True)
+    price = models.PositiveIntegerField(verbose_name='Цена', blank=True, null=True)
+
+    objects = OrderItemQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Заказанная позиция'
@@ -282,3 +354,97 @@ class OrderItem(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['order_id', 'product_info'], name='unique_order_item'),
         ]
+        indexes = [
+            models.Index(fields=['shop', 'order'], name='orderitem_shop_order_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.shop_id is None and self.product_info_id is not None:
+            self.shop_id = self.product_info.shop_id
+        if self.order_dt is None and self.order_id is not None:
+            self.order_dt = self.order.dt
+        return super(OrderItem, self).save(*args, **kwargs)
+
+
+class OutboxMessage(models.Model):
+    """
+    Задача Celery, записанная в одной транзакции с изменением данных.
+    Ретранслятор (market/outbox.py) передает задачи в брокер после фиксации транзакции
+    """
+    task = models.CharField(max_length=100, verbose_name='Задача')
+    kwargs = models.JSONField(default=dict, verbose_name='Аргументы')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попытки отправки')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    # после неудачной попытки сообщение откладывается с экспоненциально растущей паузой
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    # задача не найдена или аргументы не сериализуются: повтор не поможет, сообщение ждет разбора в админке
+    dead = models.BooleanField(default=False, verbose_name='Не может быть отправлено')
+
+    class Meta:
+        verbose_name = 'Сообщение outbox'
+        verbose_name_plural = 'Сообщения outbox'
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(dead=False), name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} {self.kwargs}'
+
+
+class RequestProfile(models.Model):
+    """
+    Профиль HTTP запроса (market/profiling.py): статистика вызовов и хронология запросов к БД
+    """
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='request_profiles',
+                             blank=True, null=True, on_delete=models.SET_NULL)
+    method = models.CharField(max_length=10, verbose_name='Метод')
+    path = models.TextField(verbose_name='Адрес')
+    view_name = models.CharField(max_length=100, verbose_name='Обработчик', blank=True)
+    status_code = models.PositiveSmallIntegerField(verbose_name='Статус ответа')
+    duration = models.FloatField(verbose_name='Время обработки, с')
+    queries = models.PositiveIntegerField(verbose_name='Запросов к БД')
+    db_time = models.FloatField(verbose_name='Время запросов к БД, с')
+    # смещение от начала запроса и длительность (секунды), соединение, SQL
+    sql = models.JSONField(default=list, verbose_name='Хронология запросов к БД')
+    # трассировка остановлена по достижении PROFILING_MAX_EVENTS событий
+    truncated = models.BooleanField(default=False, verbose_name='Профиль неполный')
+    # статистика вызовов в формате pstats (marshal) и профиль speedscope (JSON, zlib)
+    stats = models.BinaryField(verbose_name='Статистика вызовов')
+    speedscope = models.BinaryField(verbose_name='Профиль speedscope')
+
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
+
+
+class SlowQuery(models.Model):
+    """
+    Медленные запросы к БД (market/slow_queries.py), агрегированные по отпечатку нормализованного SQL
+    """
+    fingerprint = models.CharField(max_length=40, unique=True, verbose_name='Отпечаток')
+    statement = models.TextField(verbose_name='Нормализованный SQL')
+    calls = models.PositiveIntegerField(default=1, verbose_name='Выполнений')
+    total_time = models.FloatField(verbose_name='Суммарное время, с')
+    max_time = models.FloatField(verbose_name='Максимальное время, с')
+    # обработчик ("order:GET") или задача Celery и стек вызова последнего выполнения
+    view = models.CharField(max_length=100, blank=True, verbose_name='Обработчик')
+    stack = models.TextField(blank=True, verbose_name='Стек вызова')
+    first_seen = models.DateTimeField(auto_now_add=True, verbose_name='Первое выполнение')
+    last_seen = models.DateTimeField(verbose_name='Последнее выполнение')
+    plan = models.TextField(blank=True, verbose_name='План выполнения')
+    plan_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата плана')
+
+    class Meta:
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+        ordering = ('-total_time',)
+
+    def __str__(self):
+        return self.statement[:100]
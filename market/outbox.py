@@ -0,0 +1,86 @@
+"""
+Transactional outbox для задач Celery.
+
+Обработчики запросов не обращаются к брокеру: enqueue записывает задачу в таблицу
+OutboxMessage в той же транзакции, что и изменение данных. Если транзакция откатывается,
+задача не отправляется. Ретранслятор (команда relay_outbox) забирает сообщения пачками
+и передает их в брокер. Доставка "хотя бы один раз": при сбое после отправки в брокер
+задача может быть отправлена повторно. Пока брокер недоступен, сообщения остаются в outbox
+и отправляются повторно с растущей паузой.
+"""
+import logging
+from datetime import timedelta
+
+from celery.exceptions import NotRegistered
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from kombu.exceptions import EncodeError
+
+from dj_api_market.celery import app
+from market.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# ошибки, которые не исчезнут при повторе (в отличие от недоступности брокера)
+PERMANENT_ERRORS = (NotRegistered, EncodeError)
+
+
+def enqueue(task, **kwargs):
+    """
+    Записывает задачу в outbox. Вызывается внутри транзакции, изменяющей данные
+    """
+    return OutboxMessage.objects.create(task=task.name, kwargs=kwargs)
+
+
+def relay(batch_size=None):
+    """
+    Передает сообщения outbox, время попытки которых наступило, в брокер пачками по batch_size.
+    Несколько ретрансляторов не мешают друг другу: заблокированные сообщения пропускаются.
+    Неотправленное сообщение не задерживает остальные сообщения пачки. Возвращает число переданных сообщений
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    relayed = 0
+    while True:
+        with transaction.atomic():
+            messages = list(OutboxMessage.objects.select_for_update(skip_locked=True).filter(
+                dead=False, next_attempt_at__lte=timezone.now()).order_by('id')[:batch_size])
+            sent = []
+            for message in messages:
+                try:
+                    app.tasks[message.task].apply_async(kwargs=message.kwargs)
+                except PERMANENT_ERRORS as error:
+                    park(message, error)
+                except Exception as error:
+                    # брокер недоступен: сообщение не теряется, повтор откладывается
+                    postpone(message, error)
+                else:
+                    sent.append(message.id)
+
+            OutboxMessage.objects.filter(id__in=sent).delete()
+            relayed += len(sent)
+
+        if len(messages) < batch_size:
+            return relayed
+
+
+def postpone(message, error):
+    message.attempts += 1
+    message.last_error = repr(error)
+    delay = min(settings.OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1), settings.OUTBOX_RETRY_MAX_DELAY)
+    message.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    logger.warning('Outbox message %s (%s) is not relayed, attempt %s, next in %s s: %s',
+                   message.id, message.task, message.attempts, delay, message.last_error)
+    message.save(update_fields=['attempts', 'last_error', 'next_attempt_at'])
+
+
+def park(message, error):
+    """
+    Задача не зарегистрирована или аргументы не сериализуются: сообщение остается в outbox с пометкой dead
+    и повторно отправляется из админки после исправления
+    """
+    message.attempts += 1
+    message.last_error = repr(error)
+    message.dead = True
+    logger.error('Outbox message %s (%s) cannot be relayed: %s', message.id, message.task, message.last_error)
+    message.save(update_fields=['attempts', 'last_error', 'dead'])
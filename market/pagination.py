@@ -0,0 +1,10 @@
+from rest_framework.pagination import PageNumberPagination
+
+
+class OrderPagination(PageNumberPagination):
+    """
+    Постраничный вывод истории заказов
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
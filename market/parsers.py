@@ -0,0 +1,21 @@
+import codecs
+import csv
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class CSVParser(BaseParser):
+    """
+    Разбор CSV с заголовком в список словарей
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return list(csv.DictReader(codecs.iterdecode(stream, encoding)))
+        except (csv.Error, UnicodeDecodeError) as error:
+            raise ParseError(f'CSV parse error - {error}')
@@ -0,0 +1,175 @@
+"""
+Секционирование таблиц заказов (только PostgreSQL).
+
+market_order секционирована списком по статусу:
+    market_order_basket   - корзины;
+    market_order_history  - оформленные заказы, секционирована по месяцам по полю dt;
+    market_order_default  - заказы с неизвестными статусами.
+market_orderitem секционирована по месяцам по полю order_dt (копия dt заказа).
+
+Таблицы переводятся на секционированное хранение миграцией 0004_order_partitions: таблицы, существовавшие
+до секционирования, подключаются как секции *_legacy за весь период до начала следующего месяца, поэтому
+перенос данных не требуется. Секции *_legacy не отключаются командой order_partitions, их архивируют вручную.
+"""
+import re
+import time
+from datetime import datetime, timezone
+
+from django.db import OperationalError, transaction
+from psycopg2 import errors
+
+ORDER_TABLE = 'market_order'
+ORDER_ITEM_TABLE = 'market_orderitem'
+ORDER_HISTORY_TABLE = 'market_order_history'
+
+# таблицы, секционированные по месяцам: таблица -> поле даты
+MONTHLY_TABLES = {
+    ORDER_HISTORY_TABLE: 'dt',
+    ORDER_ITEM_TABLE: 'order_dt',
+}
+
+UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+# DETACH PARTITION берет ACCESS EXCLUSIVE на секционированную таблицу и ее секцию по умолчанию.
+# DETACH PARTITION ... CONCURRENTLY (PostgreSQL 14) недоступен: у помесячных таблиц есть секции по умолчанию.
+# Пока блокировка ждет завершения текущих запросов, за ней в очередь встают все новые запросы к таблице,
+# поэтому ожидание ограничено DETACH_LOCK_TIMEOUT, после чего попытка повторяется через DETACH_RETRY_DELAY секунд
+DETACH_LOCK_TIMEOUT = '2s'
+DETACH_ATTEMPTS = 5
+DETACH_RETRY_DELAY = 5
+
+
+def month_start(value, shift=0):
+    """
+    Начало месяца (UTC), сдвинутого на shift месяцев относительно value
+    """
+    month = value.year * 12 + value.month - 1 + shift
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table, month):
+    return f'{table}_y{month.year}m{month.month:02d}'
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def create_partitions(connection, months=3, start=None):
+    """
+    Создает помесячные секции заказов и позиций заказов на months месяцев вперед.
+    Возвращает список созданных секций
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    start = month_start(start or datetime.now(timezone.utc))
+    created = []
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor, ORDER_TABLE):
+            return []
+        existing = {name for name, _ in _partitions(cursor, ORDER_HISTORY_TABLE)}
+        existing |= {name for name, _ in _partitions(cursor, ORDER_ITEM_TABLE)}
+
+        for shift in range(months + 1):
+            month = month_start(start, shift)
+            for table in MONTHLY_TABLES:
+                name = partition_name(table, month)
+                if name in existing or _covered(cursor, table, month):
+                    continue
+                _create_partition(connection, cursor, table, name, month)
+                created.append(name)
+    return created
+
+
+def _create_partition(connection, cursor, table, name, month):
+    """
+    Создает секцию месяца. Строки месяца, уже попавшие в секцию по умолчанию (например, заказы с датой
+    после последней созданной секции), переносятся в новую секцию: иначе PostgreSQL не подключит ее
+    """
+    column = MONTHLY_TABLES[table]
+    bounds = [month, month_start(month, 1)]
+    with transaction.atomic(using=connection.alias):
+        cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING STORAGE)")
+        cursor.execute(f"WITH moved AS (DELETE FROM {table}_default WHERE {column} >= %s AND {column} < %s "
+                       f"RETURNING *) INSERT INTO {name} SELECT * FROM moved", bounds)
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+
+
+def detach_partitions(connection, before, drop=False):
+    """
+    Отключает секции заказов и позиций заказов, целиком лежащие раньше даты before.
+    Отключенные секции становятся обычными таблицами (их можно выгрузить в архив),
+    при drop=True удаляются. Каждая секция отключается в отдельной короткой транзакции (_detach_partition).
+    Возвращает список отключенных секций
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    detached = []
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor, ORDER_TABLE):
+            return []
+        for table in MONTHLY_TABLES:
+            for name, bound in _partitions(cursor, table):
+                upper = _upper_bound(bound)
+                # секция *_legacy (FROM MINVALUE) хранит всю историю до секционирования и не отключается
+                if not upper or upper > before or 'MINVALUE' in bound:
+                    continue
+                _detach_partition(connection, cursor, table, name)
+                if drop:
+                    cursor.execute(f"DROP TABLE {name}")
+                detached.append(name)
+    return detached
+
+
+def _detach_partition(connection, cursor, table, name):
+    """
+    Отключает секцию, ожидая блокировку таблицы не дольше DETACH_LOCK_TIMEOUT. Если блокировку не удалось
+    получить за DETACH_ATTEMPTS попыток, ошибка LockNotAvailable передается вызывающему
+    """
+    for attempt in range(1, DETACH_ATTEMPTS + 1):
+        try:
+            with transaction.atomic(using=connection.alias):
+                cursor.execute("SELECT set_config('lock_timeout', %s, true)", [DETACH_LOCK_TIMEOUT])
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            return
+        except OperationalError as error:
+            if not isinstance(error.__cause__, errors.LockNotAvailable) or attempt == DETACH_ATTEMPTS:
+                raise
+        time.sleep(DETACH_RETRY_DELAY)
+
+
+def _partitions(cursor, table):
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, [table])
+    return cursor.fetchall()
+
+
+def _covered(cursor, table, month):
+    """
+    Проверяет, что месяц уже покрыт какой-либо секцией, кроме секции по умолчанию
+    """
+    for _, bound in _partitions(cursor, table):
+        upper = _upper_bound(bound)
+        if upper and 'MINVALUE' in bound and upper > month:
+            return True
+    return False
+
+
+def _upper_bound(bound):
+    """
+    Верхняя граница секции из ее описания: FOR VALUES FROM (...) TO ('2023-02-01 00:00:00+00')
+    """
+    upper = UPPER_BOUND_RE.search(bound)
+    if not upper:
+        return None
+    value = upper.group(1)
+    if re.search(r'[+-]\d\d$', value):
+        value += ':00'
+    return datetime.fromisoformat(value)
@@ -0,0 +1,35 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.db import close_old_connections
+
+# Хеширование паролей (PBKDF2) выполняется в отдельном ограниченном пуле потоков.
+# hashlib отпускает GIL на время вычисления, поэтому потоки пула работают параллельно,
+# а обработчики запросов не простаивают в ожидании хеширования
+executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix='password-hashing')
+
+
+async def amake_password(password):
+    """
+    Вычисляет хеш пароля в пуле хеширования
+    """
+    return await asyncio.get_running_loop().run_in_executor(executor, make_password, password)
+
+
+def _authenticate(request, **credentials):
+    # потоки пула не обслуживают HTTP запросы, поэтому устаревшие соединения с БД закрываются здесь
+    close_old_connections()
+    return authenticate(request, **credentials)
+
+
+async def aauthenticate(request, **credentials):
+    """
+    django.contrib.auth.authenticate в пуле хеширования: учитываются AUTHENTICATION_BACKENDS
+    и user_can_authenticate, отправляются сигналы user_login_failed, хеш пароля обновляется
+    при изменении PASSWORD_HASHERS
+    """
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(_authenticate, request, **credentials))
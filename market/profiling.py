@@ -0,0 +1,302 @@
+"""
+Профилирование отдельных HTTP запросов: стеки вызовов Python и хронология запросов к БД.
+
+Профилируются запросы сотрудников (is_staff) с заголовком PROFILING_HEADER или доля PROFILING_SAMPLE_RATE
+их запросов, если PROFILING_ENABLED. Профиль сохраняется в RequestProfile, список профилей - в админке,
+оттуда же профиль скачивается в формате pstats (python -m pstats, snakeviz) или speedscope
+(https://www.speedscope.app). Номер профиля возвращается в заголовке ответа X-Profile-Id.
+
+Вызовы функций записываются трассировкой (sys.setprofile), из нее строятся и статистика pstats,
+и точная хронология вызовов для speedscope. Трассировка замедляет код Python, поэтому время функций
+в профиле завышено, время запросов к БД - нет. Трассируется один поток, поэтому асинхронные обработчики
+под ASGI не профилируются: в цикле событий одновременно выполняются другие запросы
+"""
+import asyncio
+import json
+import logging
+import marshal
+import random
+import sys
+import time
+import zlib
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError
+from rest_framework import exceptions
+
+from market.authentication import CachedTokenAuthentication
+from market.middleware import endpoint_name
+from market.models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+# профиль текущего HTTP запроса
+current_profile = ContextVar('request_profile', default=None)
+
+
+def label(code):
+    """
+    Функция в статистике pstats: (файл, строка, имя)
+    """
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class Profile:
+    """
+    Профиль запроса: вызовы и возвраты функций Python и запросы к БД со смещением от начала запроса
+    """
+
+    def __init__(self):
+        # (вызов или возврат, код функции, время)
+        self.events = []
+        self.queries = []
+        self.query_count = 0
+        self.db_time = 0.0
+        self.start = None
+        self.duration = None
+        self._token = None
+        self._previous = None
+
+    def __enter__(self):
+        self._token = current_profile.set(self)
+        self._previous = sys.getprofile()
+        self.start = time.perf_counter()
+        sys.setprofile(self._tracer())
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(self._previous)
+        self.duration = time.perf_counter() - self.start
+        current_profile.reset(self._token)
+
+    def _tracer(self):
+        events = self.events
+        append = events.append
+        clock = time.perf_counter
+        limit = settings.PROFILING_MAX_EVENTS
+
+        def trace(frame, event, arg):
+            if event == 'call' or event == 'return':
+                append((event == 'call', frame.f_code, clock()))
+                if len(events) >= limit:
+                    sys.setprofile(None)
+        return trace
+
+    @property
+    def truncated(self):
+        return len(self.events) >= settings.PROFILING_MAX_EVENTS
+
+    def add_query(self, alias, sql, start, duration, many):
+        self.query_count += 1
+        self.db_time += duration
+        if len(self.queries) < settings.PROFILING_MAX_QUERIES:
+            self.queries.append({'start': start - self.start, 'duration': duration, 'alias': alias,
+                                 'sql': sql, 'many': many})
+
+    def calls(self):
+        """
+        Завершенные вызовы функций: (код функции, вызывающая функция, начало, длительность, время вложенных
+        вызовов, рекурсивный ли вызов). Возвраты из функций, вызванных до начала трассировки, пропускаются,
+        незавершенные к концу трассировки вызовы завершаются ее концом
+        """
+        stack, active = [], Counter()
+        end = self.start + self.duration
+        for is_call, code, at in self.events:
+            if is_call:
+                stack.append([code, at, 0.0])
+                active[code] += 1
+            elif stack:
+                yield self._finish(stack, active, at)
+        while stack:
+            yield self._finish(stack, active, end)
+
+    @staticmethod
+    def _finish(stack, active, at):
+        code, start, children = stack.pop()
+        active[code] -= 1
+        elapsed = at - start
+        if stack:
+            stack[-1][2] += elapsed
+        return code, stack[-1][0] if stack else None, start, elapsed, children, active[code] > 0
+
+    def pstats(self):
+        """
+        Статистика вызовов в формате файлов pstats: функция - (cc, nc, tt, ct, {вызывающая: (nc, cc, tt, ct)})
+        """
+        stats = {}
+        for code, caller, _, elapsed, children, recursive in self.calls():
+            entry = stats.setdefault(label(code), [0, 0, 0.0, 0.0, {}])
+            entry[1] += 1
+            entry[2] += elapsed - children
+            if not recursive:
+                entry[0] += 1
+                entry[3] += elapsed
+            if caller is not None:
+                calls = entry[4].setdefault(label(caller), [0, 0, 0.0, 0.0])
+                calls[0] += 1
+                calls[2] += elapsed - children
+                if not recursive:
+                    calls[1] += 1
+                    calls[3] += elapsed
+        return marshal.dumps({func: (cc, nc, tt, ct, {caller: tuple(calls) for caller, calls in callers.items()})
+                              for func, (cc, nc, tt, ct, callers) in stats.items()})
+
+    def speedscope(self, name):
+        """
+        Профиль в формате speedscope: хронология вызовов Python и запросов к БД
+        """
+        frames, frame_ids = [], {}
+
+        def frame(key, **data):
+            if key not in frame_ids:
+                frame_ids[key] = len(frames)
+                frames.append(data)
+            return frame_ids[key]
+
+        python_events = []
+        for code, _, start, elapsed, _, _ in self.calls():
+            index = frame(code, name=code.co_name, file=code.co_filename, line=code.co_firstlineno)
+            python_events.append((start - self.start, elapsed, index))
+        # вызовы завершаются в порядке, обратном открытию вложенных: упорядочиваем по началу,
+        # вложенные вызовы (с тем же началом) - после внешних
+        python_events.sort(key=lambda event: (event[0], -event[1]))
+
+        sql_events, at = [], 0.0
+        for number, query in enumerate(self.queries, 1):
+            # запросы выполняются последовательно, смещения выравниваются, чтобы события не пересекались
+            start = max(query['start'], at)
+            at = start + query['duration']
+            sql_events.append((start, query['duration'],
+                               frame(number, name=f'{number}. {query["alias"]}: {query["sql"][:200]}')))
+
+        return json.dumps({
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'dj_api_market',
+            'shared': {'frames': frames},
+            'profiles': [
+                {'type': 'evented', 'name': f'{name} (Python)', 'unit': 'seconds', 'startValue': 0,
+                 'endValue': self.duration, 'events': evented(python_events)},
+                {'type': 'evented', 'name': f'{name} (SQL)', 'unit': 'seconds', 'startValue': 0,
+                 'endValue': max(self.duration, at), 'events': evented(sql_events)},
+            ],
+        })
+
+
+def evented(calls):
+    """
+    События открытия и закрытия кадров speedscope по вызовам (начало, длительность, кадр),
+    упорядоченным по началу
+    """
+    events, stack = [], []
+    for start, elapsed, index in calls:
+        while stack and stack[-1][0] <= start:
+            end, closed = stack.pop()
+            events.append({'type': 'C', 'frame': closed, 'at': end})
+        # вложенный вызов не может закончиться позже внешнего
+        end = min(start + elapsed, stack[-1][0]) if stack else start + elapsed
+        events.append({'type': 'O', 'frame': index, 'at': start})
+        stack.append((end, index))
+    while stack:
+        end, closed = stack.pop()
+        events.append({'type': 'C', 'frame': closed, 'at': end})
+    return events
+
+
+def profile_queries(execute, sql, params, many, context):
+    """
+    Обертка выполнения запросов к БД, устанавливается на каждое соединение (см. market/signals.py)
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(context['connection'].alias, sql, start, time.perf_counter() - start, many)
+
+
+def install_query_profiler(connection):
+    if profile_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_queries)
+
+
+def profiling_user(request):
+    """
+    Сотрудник, запрос которого нужно профилировать, или None.
+    Пользователь определяется по сессии (админка) или по токену
+    """
+    if request.headers.get(settings.PROFILING_HEADER) is None:
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return None
+    if request.user.is_authenticated:
+        return request.user if request.user.is_staff else None
+    try:
+        result = CachedTokenAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    if result is None or not result[0].is_staff:
+        return None
+    return result[0]
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запросы сотрудников (см. описание модуля) и сохраняет профиль в RequestProfile.
+    Хранятся последние PROFILING_KEEP профилей
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+        user = profiling_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        profile = Profile()
+        with profile:
+            response = self.get_response(request)
+        record = self.save(request, response, user, profile)
+        if record is not None:
+            response['X-Profile-Id'] = str(record.id)
+        return response
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    @staticmethod
+    def save(request, response, user, profile):
+        try:
+            record = RequestProfile.objects.create(
+                user=user,
+                method=request.method,
+                path=request.get_full_path(),
+                view_name=endpoint_name(request).rpartition(':')[0],
+                status_code=response.status_code,
+                duration=profile.duration,
+                queries=profile.query_count,
+                db_time=profile.db_time,
+                sql=profile.queries,
+                truncated=profile.truncated,
+                stats=profile.pstats(),
+                speedscope=zlib.compress(profile.speedscope(f'{request.method} {request.path}').encode()),
+            )
+            RequestProfile.objects.filter(id__lte=record.id - settings.PROFILING_KEEP).delete()
+        except DatabaseError as error:
+            logger.warning('Request profile is not saved: %s', error)
+            return None
+        return record
@@ -0,0 +1,110 @@
+"""
+Метрики сервиса в текстовом формате Prometheus (GET /metrics).
+
+Значения читаются из общего хранилища метрик (market.metrics), поэтому ответ любого процесса gunicorn
+содержит суммы по всем процессам и воркерам Celery.
+"""
+from django.conf import settings
+
+from market import metrics
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def labels(**values):
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in values.items()) + '}'
+
+
+class Exposition:
+    """
+    Текст ответа: значения одной метрики выводятся подряд после ее описания (HELP, TYPE)
+    """
+
+    def __init__(self):
+        # имя метрики - (тип, описание, строки значений)
+        self.families = {}
+
+    def add(self, name, kind, help_text, label_values, value, suffix=''):
+        family = self.families.setdefault(name, (kind, help_text, []))
+        family[2].append(f'{name}{suffix}{labels(**label_values)} {format_value(value)}')
+
+    def render(self):
+        lines = []
+        for name, (kind, help_text, samples) in self.families.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+def split_endpoint(endpoint, parts):
+    """
+    "order:GET:200" -> ['order', 'GET', '200']
+    """
+    return endpoint.rsplit(':', parts - 1)
+
+
+def add_http(exposition):
+    histogram = 'http_request_duration_seconds'
+    for key, counters in sorted(metrics.collect('http').items()):
+        view, method, status = split_endpoint(key, 3)
+        label_values = {'view': view, 'method': method, 'status': status}
+        requests = counters.get('requests', 0)
+        exposition.add('http_requests_total', 'counter', 'HTTP requests by view, method and status',
+                       label_values, requests)
+        for bound in settings.METRICS_LATENCY_BUCKETS:
+            exposition.add(histogram, 'histogram', 'HTTP request processing time',
+                           {**label_values, 'le': bound}, counters.get(f'le_{bound}', 0), '_bucket')
+        exposition.add(histogram, 'histogram', None, {**label_values, 'le': '+Inf'}, requests, '_bucket')
+        exposition.add(histogram, 'histogram', None, label_values, counters.get('duration', 0), '_sum')
+        exposition.add(histogram, 'histogram', None, label_values, requests, '_count')
+        exposition.add('http_response_size_bytes_total', 'counter', 'Size of HTTP response bodies',
+                       label_values, counters.get('response_bytes', 0))
+
+
+def add_queries(exposition):
+    for key, counters in sorted(metrics.collect('queries').items()):
+        view, method = split_endpoint(key, 2)
+        label_values = {'view': view, 'method': method}
+        exposition.add('db_queries_total', 'counter', 'Database queries by view and method',
+                       label_values, counters.get('queries', 0))
+        exposition.add('db_query_duration_seconds_total', 'counter', 'Database query time by view and method',
+                       label_values, counters.get('db_time', 0))
+        exposition.add('db_query_budget_exceeded_total', 'counter', 'Requests over the database query budget',
+                       label_values, counters.get('over_budget', 0))
+
+
+def add_cache(exposition):
+    for name, counters in sorted(metrics.collect('cache').items()):
+        exposition.add('cache_hits_total', 'counter', 'Cache hits', {'cache': name}, counters.get('hits', 0))
+        exposition.add('cache_misses_total', 'counter', 'Cache misses', {'cache': name}, counters.get('misses', 0))
+
+
+def add_tasks(exposition):
+    for task, counters in sorted(metrics.collect('tasks').items()):
+        for counter in ('published', 'started', 'succeeded', 'failed', 'retried'):
+            exposition.add(f'celery_tasks_{counter}_total', 'counter', f'Celery tasks {counter}',
+                           {'task': task}, counters.get(counter, 0))
+        exposition.add('celery_task_wait_seconds_total', 'counter', 'Time Celery tasks waited in the queue',
+                       {'task': task}, counters.get('wait_time', 0))
+        exposition.add('celery_task_run_seconds_total', 'counter', 'Celery task run time',
+                       {'task': task}, counters.get('run_time', 0))
+    for queue, values in sorted(metrics.collect('queues').items()):
+        exposition.add('celery_queue_depth', 'gauge', 'Messages waiting in the queue',
+                       {'queue': queue}, values.get('depth', 0))
+
+
+def render():
+    exposition = Exposition()
+    for add in (add_http, add_queries, add_cache, add_tasks):
+        add(exposition)
+    return exposition.render()
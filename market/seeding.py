@@ -0,0 +1,362 @@
+"""
+Синтетическая площадка для замеров производительности (команда seed_marketplace).
+
+Данные детерминированы: при одинаковых масштабе, seed и дате окончания истории заказов создаются
+одни и те же строки. Распределения приближены к реальным: размеры магазинов и популярность категорий
+и товаров - по степенному закону, цены - логнормальные, число заказов покупателя и позиций заказа -
+геометрические, даты заказов - равномерно за HISTORY_MONTHS месяцев.
+
+Строки не хранятся в памяти целиком: каждая таблица загружается потоком (в PostgreSQL - через COPY),
+заказы и их позиции генерируются дважды от одного seed покупателя.
+"""
+import csv
+import io
+import math
+import random
+from array import array
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db.models import Max
+
+from market.models import Category, Contact, Order, OrderItem, Parameter, Product, ProductInfo, \
+    ProductParameter, Shop, User
+
+EMAIL_DOMAIN = 'seed.example.com'
+PASSWORD = 'Seed-Passw0rd'
+
+SCALES = {
+    'small': {'shops': 5, 'categories': 20, 'products': 1000, 'buyers': 500},
+    'medium': {'shops': 50, 'categories': 200, 'products': 50000, 'buyers': 20000},
+    'large': {'shops': 500, 'categories': 1000, 'products': 1000000, 'buyers': 200000},
+}
+
+# средние значения распределений
+OFFERS_PER_PRODUCT = 2
+ORDERS_PER_BUYER = 5
+ITEMS_PER_ORDER = 3
+CONTACTS_PER_BUYER = 1.3
+BASKET_SHARE = 0.3
+HISTORY_MONTHS = 12
+HISTORY_STATES = {'delivered': 60, 'canceled': 8, 'sent': 7, 'assembled': 5, 'confirmed': 10, 'new': 10}
+
+KINDS = ['Смартфон', 'Ноутбук', 'Планшет', 'Телевизор', 'Наушники', 'Flash-накопитель', 'Монитор',
+         'Фотоаппарат', 'Смарт-часы', 'Колонка', 'Роутер', 'Принтер']
+BRANDS = ['Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Sony', 'LG', 'Lenovo', 'ASUS', 'Acer', 'HP', 'Philips',
+          'Honor', 'Realme', 'JBL', 'Canon', 'TP-Link']
+COLORS = ['черный', 'белый', 'серебристый', 'золотистый', 'синий', 'красный']
+CATEGORIES = ['Смартфоны', 'Ноутбуки', 'Планшеты', 'Телевизоры', 'Аксессуары', 'Flash-накопители', 'Мониторы',
+              'Фототехника', 'Носимая электроника', 'Акустика', 'Сетевое оборудование', 'Оргтехника']
+PARAMETERS = {
+    'Цвет': lambda rng: rng.choice(COLORS),
+    'Встроенная память (Гб)': lambda rng: rng.choice([32, 64, 128, 256, 512, 1024]),
+    'Диагональ (дюйм)': lambda rng: round(rng.uniform(1.2, 75), 1),
+    'Разрешение (пикс)': lambda rng: rng.choice(['1920x1080', '2560x1440', '3840x2160', '2688x1242', '1792x828']),
+    'Вес (г)': lambda rng: rng.randint(20, 25000),
+    'Гарантия (мес)': lambda rng: rng.choice([6, 12, 24, 36]),
+    'Страна производства': lambda rng: rng.choice(['Китай', 'Вьетнам', 'Корея', 'Тайвань', 'Индия']),
+}
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Нижний Новгород', 'Самара']
+STREETS = ['Ленина', 'Мира', 'Советская', 'Гагарина', 'Садовая', 'Лесная', 'Центральная', 'Школьная']
+
+
+def geometric(rng, mean, minimum=0):
+    """
+    Целое не меньше minimum с геометрическим распределением и средним mean
+    """
+    if mean <= minimum:
+        return minimum
+    return minimum + int(rng.expovariate(1 / (mean - minimum)))
+
+
+def power_law_weights(count, exponent=1.1):
+    """
+    Накопленные веса по закону Ципфа: элемент с номером i в 1 / (i + 1) ** exponent раз популярнее первого
+    """
+    return array('d', accumulate(1 / (index + 1) ** exponent for index in range(count)))
+
+
+def pick(rng, cum_weights):
+    return min(bisect(cum_weights, rng.random() * cum_weights[-1]), len(cum_weights) - 1)
+
+
+def permutation(count):
+    """
+    Перестановка номеров 0..count-1 (index * step mod count): самые популярные элементы
+    не идут подряд и не принадлежат одному магазину
+    """
+    step = 7919
+    while math.gcd(step, count) != 1:
+        step += 2
+    return lambda index: index * step % count
+
+
+def product_name(index):
+    kind = KINDS[index % len(KINDS)]
+    brand = BRANDS[index // len(KINDS) % len(BRANDS)]
+    return f'{kind} {brand} {chr(65 + index % 26)}{index} ({COLORS[index % len(COLORS)]})'
+
+
+def product_model(index):
+    brand = BRANDS[index // len(KINDS) % len(BRANDS)]
+    return f'{brand.lower()}/{KINDS[index % len(KINDS)].lower()}/{index}'
+
+
+def shop_name(index):
+    return f'Seed shop {index}'
+
+
+def category_name(index):
+    name = CATEGORIES[index % len(CATEGORIES)]
+    return name if index < len(CATEGORIES) else f'{name} {index // len(CATEGORIES) + 1}'
+
+
+class CSVStream:
+    """
+    Файловый объект для COPY: строки CSV формируются по мере чтения
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = list(islice(self.rows, 1000))
+            if not chunk:
+                break
+            output = io.StringIO()
+            csv.writer(output, lineterminator='\n').writerows(
+                [['\\N' if value is None else value for value in row] for row in chunk])
+            self.buffer += output.getvalue()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    readline = read
+
+
+class Loader:
+    """
+    Загрузка строк в таблицу модели: в PostgreSQL - COPY, в остальных БД - пачками INSERT
+    """
+
+    def __init__(self, connection, batch_size=5000):
+        self.connection = connection
+        self.batch_size = batch_size
+
+    def load(self, model, fields, rows):
+        qn = self.connection.ops.quote_name
+        table = qn(model._meta.db_table)
+        columns = ', '.join(qn(model._meta.get_field(field).column) for field in fields)
+        count = 0
+
+        def counted():
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        with self.connection.cursor() as cursor:
+            if self.connection.vendor == 'postgresql':
+                cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                                   CSVStream(counted()))
+            else:
+                sql = f'INSERT INTO {table} ({columns}) VALUES ({", ".join(["%s"] * len(fields))})'
+                rows_iter = counted()
+                while batch := list(islice(rows_iter, self.batch_size)):
+                    cursor.executemany(sql, [[self.adapt(value) for value in row] for row in batch])
+        return count
+
+    def adapt(self, value):
+        if isinstance(value, datetime):
+            return self.connection.ops.adapt_datetimefield_value(value)
+        return value
+
+    def reset_sequences(self, models):
+        with self.connection.cursor() as cursor:
+            for sql in self.connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+
+class Marketplace:
+    """
+    Генератор синтетической площадки. load() загружает таблицы и возвращает число строк по моделям
+    """
+
+    def __init__(self, shops, categories, products, buyers, end, seed=1):
+        self.shops = shops
+        self.categories = categories
+        self.products = products
+        self.buyers = buyers
+        self.seed = seed
+        self.end = end
+
+    def rng(self, *scope):
+        return random.Random(f'{self.seed}:' + ':'.join(map(str, scope)))
+
+    def start_ids(self, models):
+        """
+        Первый id новых строк каждой таблицы: данные добавляются к существующим
+        """
+        self.ids = {model: (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1 for model in models}
+
+    def load(self, loader):
+        models = [User, Shop, Category, Parameter, Product, ProductInfo, ProductParameter, Contact, Order, OrderItem]
+        self.start_ids(models)
+        self.prepare()
+        counts = {}
+        counts[User] = loader.load(User, [
+            'id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff',
+            'is_active', 'date_joined', 'company', 'position', 'type'], self.users())
+        counts[Shop] = loader.load(Shop, [
+            'id', 'name', 'url', 'user', 'state', 'catalog_version', 'catalog_updated_at'], self.shop_rows())
+        counts[Category] = loader.load(Category, ['id', 'name'], self.category_rows())
+        counts[Parameter] = loader.load(Parameter, ['id', 'name'], self.parameter_rows())
+        counts[Product] = loader.load(Product, ['id', 'name', 'category'], self.product_rows())
+        counts[ProductInfo] = loader.load(ProductInfo, [
+            'id', 'product', 'shop', 'model', 'quantity', 'price', 'price_rrc', 'external_id'], self.offer_rows())
+        counts[Category.shops.through] = loader.load(Category.shops.through, ['category', 'shop'],
+                                                     self.category_shop_rows())
+        counts[ProductParameter] = loader.load(ProductParameter, ['id', 'product_info', 'parameter', 'value'],
+                                               self.product_parameter_rows())
+        counts[Contact] = loader.load(Contact, [
+            'id', 'user', 'city', 'street', 'house', 'structure', 'building', 'apartment', 'phone'],
+            self.contact_rows())
+        counts[Order] = loader.load(Order, ['id', 'user', 'dt', 'state', 'contact'], self.order_rows())
+        counts[OrderItem] = loader.load(OrderItem, [
+            'id', 'order', 'order_dt', 'product_info', 'shop', 'quantity', 'product_name', 'product_model',
+            'shop_name', 'price'], self.order_item_rows())
+        loader.reset_sequences(models + [Category.shops.through])
+        return counts
+
+    def prepare(self):
+        """
+        Товарные предложения магазинов: товар, магазин и цена каждого предложения (нужны позициям заказов)
+        """
+        rng = self.rng('offers')
+        shop_weights = array('d', accumulate(rng.paretovariate(1.2) for _ in range(self.shops)))
+        category_weights = power_law_weights(self.categories)
+        self.product_category = array('l', (pick(rng, category_weights) for _ in range(self.products)))
+        self.offer_product, self.offer_shop, self.offer_price = array('l'), array('l'), array('l')
+        self.category_shops = set()
+        for product in range(self.products):
+            base_price = max(int(rng.lognormvariate(9, 1.2)), 100)
+            offers = min(geometric(rng, OFFERS_PER_PRODUCT, 1), self.shops)
+            shops = set()
+            while len(shops) < offers:
+                shops.add(pick(rng, shop_weights))
+            for shop in sorted(shops):
+                self.offer_product.append(product)
+                self.offer_shop.append(shop)
+                self.offer_price.append(int(base_price * rng.uniform(0.9, 1.1)))
+                self.category_shops.add((self.product_category[product], shop))
+        self.offer_weights = power_law_weights(len(self.offer_product), 0.9)
+        self.offer_rank = permutation(len(self.offer_product))
+
+    def users(self):
+        password = make_password(PASSWORD)
+        joined = self.end - timedelta(days=30 * HISTORY_MONTHS)
+        for shop in range(self.shops):
+            yield (self.ids[User] + shop, password, False, '', 'Seed', f'Shop {shop}', f'shop{shop}@{EMAIL_DOMAIN}',
+                   False, True, joined, shop_name(shop), 'manager', 'shop')
+        for buyer in range(self.buyers):
+            yield (self.ids[User] + self.shops + buyer, password, False, '', 'Seed', f'Buyer {buyer}',
+                   f'buyer{buyer}@{EMAIL_DOMAIN}', False, True, joined, '', '', 'buyer')
+
+    def shop_rows(self):
+        for shop in range(self.shops):
+            yield self.ids[Shop] + shop, shop_name(shop), None, self.ids[User] + shop, True, 1, self.end
+
+    def category_rows(self):
+        for category in range(self.categories):
+            yield self.ids[Category] + category, category_name(category)
+
+    def category_shop_rows(self):
+        for category, shop in sorted(self.category_shops):
+            yield self.ids[Category] + category, self.ids[Shop] + shop
+
+    def parameter_rows(self):
+        for number, name in enumerate(PARAMETERS):
+            yield self.ids[Parameter] + number, name
+
+    def product_rows(self):
+        for product in range(self.products):
+            category = self.ids[Category] + self.product_category[product]
+            yield self.ids[Product] + product, product_name(product), category
+
+    def offer_rows(self):
+        rng = self.rng('offer-rows')
+        for offer, product in enumerate(self.offer_product):
+            price = self.offer_price[offer]
+            yield (self.ids[ProductInfo] + offer, self.ids[Product] + product, self.ids[Shop] + self.offer_shop[offer],
+                   product_model(product), geometric(rng, 20), price, int(price * rng.uniform(1.03, 1.25)),
+                   product)
+
+    def product_parameter_rows(self):
+        rng = self.rng('parameters')
+        names = list(PARAMETERS)
+        row_id = self.ids[ProductParameter]
+        for offer in range(len(self.offer_product)):
+            for number in sorted(rng.sample(range(len(names)), rng.randint(3, 6))):
+                value = PARAMETERS[names[number]](rng)
+                yield row_id, self.ids[ProductInfo] + offer, self.ids[Parameter] + number, value
+                row_id += 1
+
+    def contacts(self, buyer):
+        return geometric(self.rng('contacts', buyer), CONTACTS_PER_BUYER, 1)
+
+    def contact_rows(self):
+        row_id = self.ids[Contact]
+        for buyer in range(self.buyers):
+            rng = self.rng('contacts', buyer)
+            for _ in range(geometric(rng, CONTACTS_PER_BUYER, 1)):
+                yield (row_id, self.ids[User] + self.shops + buyer, rng.choice(CITIES), rng.choice(STREETS),
+                       str(rng.randint(1, 150)), '', '', str(rng.randint(1, 300)),
+                       f'+7{rng.randint(9000000000, 9999999999)}')
+                row_id += 1
+
+    def buyer_orders(self):
+        """
+        Заказы и позиции заказов покупателей: (id заказа, покупатель, дата, статус, id контакта, позиции),
+        позиция - (предложение, количество)
+        """
+        states, weights = list(HISTORY_STATES), list(HISTORY_STATES.values())
+        history = timedelta(days=30 * HISTORY_MONTHS).total_seconds()
+        order_id, contact_id = self.ids[Order], self.ids[Contact]
+        for buyer in range(self.buyers):
+            contacts = self.contacts(buyer)
+            rng = self.rng('orders', buyer)
+            orders = [(self.end - timedelta(seconds=rng.uniform(0, history)),
+                       rng.choices(states, weights)[0], contact_id + rng.randrange(contacts))
+                      for _ in range(geometric(rng, ORDERS_PER_BUYER))]
+            orders.sort()
+            if rng.random() < BASKET_SHARE:
+                orders.append((self.end, 'basket', None))
+            for dt, state, contact in orders:
+                offers = {self.offer_rank(pick(rng, self.offer_weights))
+                          for _ in range(geometric(rng, ITEMS_PER_ORDER, 1))}
+                items = [(offer, geometric(rng, 1.5, 1)) for offer in sorted(offers)]
+                yield order_id, self.ids[User] + self.shops + buyer, dt, state, contact, items
+                order_id += 1
+            contact_id += contacts
+
+    def order_rows(self):
+        for order_id, user_id, dt, state, contact, _ in self.buyer_orders():
+            yield order_id, user_id, dt, state, contact
+
+    def order_item_rows(self):
+        row_id = self.ids[OrderItem]
+        for order_id, _, dt, state, _, items in self.buyer_orders():
+            for offer, quantity in items:
+                product, shop = self.offer_product[offer], self.offer_shop[offer]
+                # в корзине данные товара не фиксируются
+                snapshot = ('', '', '', None) if state == 'basket' else (
+                    product_name(product), product_model(product), shop_name(shop), self.offer_price[offer])
+                yield (row_id, order_id, dt, self.ids[ProductInfo] + offer, self.ids[Shop] + shop, quantity,
+                       *snapshot)
+                row_id += 1
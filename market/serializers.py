@@ -23,6 +23,22 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'type']
 
 
+class UserProvisionSerializer(serializers.ModelSerializer):
+    """
+    Пользователь при массовой регистрации.
+    Уникальность email проверяется сразу для всей пачки пользователей
+    """
+
+    class Meta:
+        model = User
+        fields = ['first_name', 'last_name', 'email', 'company', 'position', 'type']
+        extra_kwargs = {
+            'first_name': {'required': True, 'allow_blank': False},
+            'last_name': {'required': True, 'allow_blank': False},
+            'email': {'validators': []},
+        }
+
+
 class ShopSerializer(serializers.ModelSerializer):
     class Meta:
         model = Shop
@@ -74,7 +90,8 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'order', 'product_info', 'quantity']
         read_only_fields = ['id']
         extra_kwargs = {
-            'order': {'write_only': True}
+            'order': {'write_only': True},
+            'product_info': {'required': True, 'allow_null': False},
         }
 
 
@@ -91,3 +108,34 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'state', 'dt', 'contact', 'ordered_items', 'total_sum']
         read_only_fields = ['id', 'dt']
+
+
+class OrderedItemSerializer(serializers.ModelSerializer):
+    """
+    Позиция оформленного заказа с данными товара на момент оформления
+    """
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product_info', 'product_name', 'product_model', 'shop', 'shop_name', 'price', 'quantity']
+        read_only_fields = fields
+
+
+class OrderHistorySerializer(OrderSerializer):
+    """
+    Оформленный заказ. Данные берутся только из таблиц заказов, без обращения к каталогу
+    """
+    ordered_items = OrderedItemSerializer(read_only=True, many=True)
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Краткая информация о заказе, без позиций
+    """
+    total_sum = serializers.IntegerField(read_only=True)
+    items_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'state', 'dt', 'contact', 'items_count', 'total_sum']
+        read_only_fields = ['id', 'dt']
@@ -1,3 +1,15 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from market.authentication import invalidate_token, invalidate_user_tokens
+from market.catalog import catalog_changed
+from market.middleware import install_query_counter
+from market.models import User, Category, Product, ProductInfo, ProductParameter
+from market.profiling import install_query_profiler
+from market.slow_queries import install_slow_query_capture
+
 # from django.conf import settings
 # from django.core.mail import EmailMultiAlternatives
 # from django.dispatch import receiver, Signal
@@ -76,3 +88,63 @@
 #         [user.email]
 #     )
 #     msg.send()
+
+
+@receiver(post_save, sender=User)
+def user_saved(instance, **kwargs):
+    """
+    Сбрасываем кэш токенов пользователя при изменении его данных (пароль, активность, email)
+    """
+    invalidate_user_tokens(instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    """
+    Сбрасываем кэш удаленного токена (выход пользователя, удаление пользователя)
+    """
+    invalidate_token(instance.key)
+
+
+@receiver([post_save, post_delete], sender=ProductInfo)
+def product_info_changed(instance, **kwargs):
+    """
+    Увеличиваем версию каталога магазина при изменении или удалении товара (админка, ORM),
+    закэшированные ответы каталога с ним становятся неактуальными
+    """
+    catalog_changed([instance.shop_id])
+
+
+@receiver(post_save, sender=ProductParameter)
+def product_parameter_changed(instance, **kwargs):
+    """
+    Параметры выводятся в каталоге вместе с товаром. Обработчика удаления нет: он отключил бы быстрое
+    каскадное удаление параметров при импорте, удаление в админке учитывает ProductParameterAdmin
+    """
+    catalog_changed(ProductInfo.objects.filter(id=instance.product_info_id).values('shop_id'))
+
+
+@receiver(post_save, sender=Product)
+def product_changed(instance, **kwargs):
+    """
+    Название и категория продукта выводятся в каталогах всех магазинов, которые его продают
+    """
+    catalog_changed(ProductInfo.objects.filter(product_id=instance.id).values('shop_id'))
+
+
+@receiver(post_save, sender=Category)
+def category_changed(instance, **kwargs):
+    """
+    Название категории выводится в каталогах магазинов с товарами этой категории
+    """
+    catalog_changed(ProductInfo.objects.filter(product__category_id=instance.id).values('shop_id'))
+
+
+@receiver(connection_created)
+def count_connection_queries(sender, connection, **kwargs):
+    """
+    Учет запросов к БД для QueryBudgetMiddleware, профилирования и записи медленных запросов
+    """
+    install_query_counter(connection)
+    install_query_profiler(connection)
+    install_slow_query_capture(connection)
@@ -0,0 +1,210 @@
+"""
+Запись медленных запросов к БД.
+
+Запросы дольше SLOW_QUERY_THRESHOLD секунд сохраняются в SlowQuery с агрегацией по отпечатку
+нормализованного SQL (литералы и параметры заменены на "?", списки IN свернуты): число выполнений,
+суммарное и максимальное время, последний обработчик (или задача Celery) и стек вызова в коде проекта.
+Значения параметров запросов не сохраняются. План выполнения (в PostgreSQL - EXPLAIN (ANALYZE, BUFFERS))
+записывается только при SLOW_QUERY_EXPLAIN_RATE > 0 (по умолчанию выключено): для такой доли медленных SELECT
+задача explain_slow_query_task получает SQL и параметры запроса через outbox и брокер.
+
+Запросы HTTP запроса сохраняются после ответа (SlowQueryMiddleware), чтобы запись не попала в транзакцию
+обработчика и не откатилась вместе с ней, остальные - после фиксации текущей транзакции
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import traceback
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from celery import current_task
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from market import outbox
+from market.middleware import endpoint_name
+from market.models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+# медленные запросы текущего HTTP запроса
+current_log = ContextVar('slow_query_log', default=None)
+# запись медленных запросов выполняется сама (ее запросы не записываются)
+_saving = ContextVar('slow_query_saving', default=False)
+
+NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%s|\$\d+|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize(sql):
+    """
+    SQL без значений: запросы, отличающиеся только параметрами, совпадают
+    """
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(statement):
+    return hashlib.sha1(statement.encode()).hexdigest()
+
+
+def call_stack():
+    """
+    Стек вызова запроса: последние SLOW_QUERY_STACK_DEPTH кадров кода проекта
+    """
+    base_dir = str(settings.BASE_DIR)
+    frames = [frame for frame in traceback.extract_stack()[:-2]
+              if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename]
+    return ''.join(traceback.format_list(frames[-settings.SLOW_QUERY_STACK_DEPTH:]))
+
+
+def capture_slow_queries(execute, sql, params, many, context):
+    """
+    Обертка выполнения запросов к БД, устанавливается на каждое соединение (см. market/signals.py)
+    """
+    threshold = settings.SLOW_QUERY_THRESHOLD
+    if threshold is None or _saving.get():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if duration >= threshold and not sql.lstrip().upper().startswith('EXPLAIN'):
+            capture(sql, params, many, context, duration)
+
+
+def capture(sql, params, many, context, duration):
+    connection = context['connection']
+    query = {'sql': sql, 'duration': duration, 'alias': connection.alias, 'stack': call_stack(), 'explain': None}
+    # план получаем только для чтения: EXPLAIN ANALYZE выполняет запрос
+    if (not many and sql.lstrip().upper().startswith('SELECT')
+            and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE):
+        # параметры передаются отдельно от SQL; даты, Decimal и UUID - строками, PostgreSQL приводит их к типу колонки
+        query['explain'] = {'sql': sql,
+                            'params': None if params is None else json.loads(json.dumps(params, default=str))}
+
+    log = current_log.get()
+    if log is not None:
+        log.append(query)
+    else:
+        query['source'] = current_task.name if current_task else ''
+        transaction.on_commit(partial(save, [query]), using=connection.alias)
+
+
+def aggregate(digest, duration, **values):
+    return SlowQuery.objects.filter(fingerprint=digest).update(
+        calls=F('calls') + 1, total_time=F('total_time') + duration, max_time=Greatest('max_time', duration),
+        **values)
+
+
+def save(queries, source=''):
+    """
+    Добавляет медленные запросы в агрегаты по отпечатку, для запросов с планом ставит задачу EXPLAIN
+    """
+    from market.tasks import explain_slow_query_task
+
+    token = _saving.set(True)
+    try:
+        for query in queries:
+            statement = normalize(query['sql'])
+            digest = fingerprint(statement)
+            values = {'view': query.get('source', source)[:100], 'stack': query['stack'],
+                      'last_seen': timezone.now()}
+            if not aggregate(digest, query['duration'], **values):
+                try:
+                    with transaction.atomic():
+                        SlowQuery.objects.create(fingerprint=digest, statement=statement,
+                                                 total_time=query['duration'], max_time=query['duration'],
+                                                 **values)
+                except IntegrityError:
+                    # отпечаток добавлен одновременно другим процессом
+                    aggregate(digest, query['duration'], **values)
+            if query['explain']:
+                outbox.enqueue(explain_slow_query_task, fingerprint=digest, alias=query['alias'], **query['explain'])
+    except DatabaseError as error:
+        logger.warning('Slow queries are not saved: %s', error)
+    finally:
+        _saving.reset(token)
+
+
+def explain(fingerprint, alias, sql, params=None):
+    """
+    Записывает план выполнения запроса в SlowQuery. В PostgreSQL запрос выполняется (ANALYZE)
+    в транзакции, которая откатывается, время ограничено SLOW_QUERY_EXPLAIN_TIMEOUT
+    """
+    connection = connections[alias]
+    token = _saving.set(True)
+    try:
+        with transaction.atomic(using=alias):
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(f'SET LOCAL statement_timeout = {int(settings.SLOW_QUERY_EXPLAIN_TIMEOUT * 1000)}')
+                    prefix = connection.ops.explain_query_prefix(analyze=True, buffers=True)
+                else:
+                    prefix = connection.ops.explain_query_prefix()
+                cursor.execute(f'{prefix} {sql}', params)
+                plan = '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+            transaction.set_rollback(True, using=alias)
+    finally:
+        _saving.reset(token)
+    return SlowQuery.objects.filter(fingerprint=fingerprint).update(plan=plan, plan_at=timezone.now())
+
+
+class SlowQueryMiddleware:
+    """
+    Собирает медленные запросы к БД HTTP запроса и сохраняет их после ответа
+    с именем обработчика ("order:GET")
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = []
+        token = current_log.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_log.reset(token)
+        if queries:
+            save(queries, endpoint_name(request))
+        return response
+
+    async def __acall__(self, request):
+        queries = []
+        token = current_log.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_log.reset(token)
+        if queries:
+            await sync_to_async(save, thread_sensitive=False)(queries, endpoint_name(request))
+        return response
+
+
+def install_slow_query_capture(connection):
+    if capture_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_slow_queries)
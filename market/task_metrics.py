@@ -0,0 +1,84 @@
+"""
+Метрики задач Celery (метрика "tasks", ключ - имя задачи):
+    published - отправлено в брокер;
+    started, succeeded, failed, retried - запущено, выполнено, с ошибкой, отправлено на повтор;
+    wait_time - суммарное время от отправки в брокер до запуска, секунды;
+    run_time - суммарное время выполнения, секунды.
+Длина очередей (метрика "queues") записывается периодической задачей sample_queues_task.
+"""
+import time
+
+import redis
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun, task_retry
+from django.conf import settings
+
+from market import metrics
+
+# заголовок сообщения с временем отправки задачи в брокер
+PUBLISHED_AT = 'published_at'
+
+# время запуска выполняемых задач процесса: id задачи - время
+_started = {}
+
+
+@before_task_publish.connect
+def task_published(sender=None, headers=None, **kwargs):
+    if headers is not None:
+        headers[PUBLISHED_AT] = time.time()
+    metrics.incr('tasks', sender, published=1)
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    now = time.time()
+    _started[task_id] = time.perf_counter()
+    values = {'started': 1}
+    published_at = getattr(task.request, PUBLISHED_AT, None) or (task.request.headers or {}).get(PUBLISHED_AT)
+    if published_at:
+        values['wait_time'] = max(now - float(published_at), 0)
+    metrics.incr('tasks', task.name, **values)
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    values = {'run_time': time.perf_counter() - started} if started is not None else {}
+    if state == 'SUCCESS':
+        values['succeeded'] = 1
+    metrics.incr('tasks', task.name, **values)
+
+
+@task_failure.connect
+def task_failed(sender=None, **kwargs):
+    metrics.incr('tasks', sender.name, failed=1)
+
+
+@task_retry.connect
+def task_retried(sender=None, **kwargs):
+    metrics.incr('tasks', sender.name, retried=1)
+
+
+def queue_names():
+    """
+    Очереди задач из настроек маршрутизации
+    """
+    return sorted({route['queue'] for route in settings.CELERY_ROUTES.values()} | {settings.CELERY_DEFAULT_QUEUE})
+
+
+def broker_queue_depths(client=None):
+    """
+    Число задач в очередях брокера. В Redis задачи с приоритетом хранятся в отдельных списках
+    "очередь", "очередь:1" ... "очередь:9"
+    """
+    client = client or redis.Redis.from_url(settings.BROKER_URL)
+    separator = settings.BROKER_TRANSPORT_OPTIONS.get('sep', ':')
+    steps = settings.BROKER_TRANSPORT_OPTIONS.get('priority_steps', [0])
+    depths = {}
+    with client.pipeline(transaction=False) as pipe:
+        for queue in queue_names():
+            for step in steps:
+                pipe.llen(f'{queue}{separator}{step}' if step else queue)
+        lengths = iter(pipe.execute())
+    for queue in queue_names():
+        depths[queue] = sum(next(lengths) for _ in steps)
+    return depths
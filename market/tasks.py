@@ -1,8 +1,27 @@
+import time
+
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.db import connection
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
 from dj_api_market.celery import app
 
-from market.models import ConfirmEmailToken, User
+from market import metrics
+from market.mail import flush, get_queue, queue_mail
+from market.models import ConfirmEmailToken, User, Order, OutboxMessage
+from market.partitions import create_partitions
+from market.slow_queries import explain
+from market.task_metrics import broker_queue_depths
+
+
+def delete_expired_confirm_tokens(user_ids):
+    """
+    Удаляет просроченные токены подтверждения пользователей: ConfirmAccount их не принимает,
+    поэтому вместо них отправляется новый токен
+    """
+    ConfirmEmailToken.objects.filter(user_id__in=user_ids,
+                                     created_at__lt=timezone.now() - settings.CONFIRM_TOKEN_TTL).delete()
 
 
 @app.task
@@ -11,37 +30,112 @@ def send_token_to_email_task(user_id, title,  **kwargs):
     Отправляем письмо с токеном пользователю
     """
     # send an e-mail to the user
-    token, _ = ConfirmEmailToken.objects.get_or_create(user_id=user_id)
+    delete_expired_confirm_tokens([user_id])
+    token, _ = ConfirmEmailToken.objects.select_related('user').get_or_create(user_id=user_id)
+    queue_mail([(token.user.email, f"{title}", token.key)])
 
-    msg = EmailMultiAlternatives(
-        # title:
-        f"{title}",
-        # message:
-        token.key,
-        # from:
-        settings.EMAIL_HOST_USER,
-        # to:
-        [token.user.email]
-    )
-    msg.send()
+
+@app.task
+def send_tokens_to_emails_task(user_ids, title, **kwargs):
+    """
+    Отправляем письма с токенами пачке пользователей
+    """
+    users = User.objects.filter(id__in=user_ids).only('id', 'email')
+    delete_expired_confirm_tokens(user_ids)
+    tokens = dict(ConfirmEmailToken.objects.filter(user_id__in=user_ids).values_list('user_id', 'key'))
+    new_tokens = [ConfirmEmailToken(user_id=user.id, key=ConfirmEmailToken.generate_key())
+                  for user in users if user.id not in tokens]
+    ConfirmEmailToken.objects.bulk_create(new_tokens)
+    tokens.update((token.user_id, token.key) for token in new_tokens)
+
+    queue_mail([(user.email, f"{title}", tokens[user.id]) for user in users])
 
 
 @app.task
-def send_simple_mail_task(user_id, title, message, **kwargs):
+def send_simple_mail_task(user_id, title, message, email=None, **kwargs):
     """
-    Отправляем письмо пользователю
+    Отправляем письмо пользователю.
+    Если адрес известен отправителю, он передается в email и пользователь не запрашивается из БД
     """
     # send an e-mail to the user
-    user = User.objects.get(id=user_id)
-
-    msg = EmailMultiAlternatives(
-        # title:
-        f"{title}",
-        # message:
-        f"{message}",
-        # from:
-        settings.EMAIL_HOST_USER,
-        # to:
-        [user.email]
-    )
-    msg.send()
+    if email is None:
+        email = User.objects.values_list('email', flat=True).get(id=user_id)
+    queue_mail([(email, f"{title}", f"{message}")])
+
+
+@app.task
+def send_orders_state_mail_task(order_ids, state, **kwargs):
+    """
+    Отправляем покупателям письма об изменении статуса заказов
+    """
+    state_name = dict(Order._meta.get_field('state').choices).get(state, state)
+    orders = Order.objects.filter(id__in=order_ids).values_list('id', 'user__email')
+
+    queue_mail([(email, 'Django-API-market: Обновление статуса заказа', f'Статус заказа №{order_id} изменен: {state_name}')
+                for order_id, email in orders])
+
+
+@app.task
+def flush_mail_task(**kwargs):
+    """
+    Отправляем письма из очереди пачками через одно соединение с почтовым сервером
+    """
+    sent, retried = flush()
+    return {'sent': sent, 'retried': retried}
+
+
+@app.task
+def create_order_partitions_task(months=3, **kwargs):
+    """
+    Создаем секции таблиц заказов на несколько месяцев вперед
+    """
+    return create_partitions(connection, months=months)
+
+
+def delete_in_batches(queryset, batch_size):
+    """
+    Удаляет записи queryset пачками по batch_size, каждая пачка в отдельной транзакции,
+    чтобы не держать блокировки долго. Возвращает число удаленных записей
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+
+
+@app.task
+def purge_stale_auth_tokens_task(**kwargs):
+    """
+    Удаляем просроченные токены авторизации и токены подтверждения email
+    """
+    now = timezone.now()
+    batch_size = settings.AUTH_PURGE_BATCH_SIZE
+    return {
+        'tokens': delete_in_batches(Token.objects.filter(created__lt=now - settings.AUTH_TOKEN_TTL), batch_size),
+        'confirm_tokens': delete_in_batches(
+            ConfirmEmailToken.objects.filter(created_at__lt=now - settings.CONFIRM_TOKEN_TTL), batch_size),
+    }
+
+
+@app.task
+def sample_queues_task(**kwargs):
+    """
+    Записываем в метрики длину очередей задач в брокере, очереди писем и outbox
+    """
+    depths = broker_queue_depths()
+    depths['mail-outgoing'] = len(get_queue())
+    depths['outbox'] = OutboxMessage.objects.count()
+    sampled_at = time.time()
+    for queue, depth in depths.items():
+        metrics.set('queues', queue, depth=depth, sampled_at=sampled_at)
+    return depths
+
+
+@app.task
+def explain_slow_query_task(fingerprint, alias, sql, params=None, **kwargs):
+    """
+    Записываем план выполнения медленного запроса
+    """
+    return explain(fingerprint, alias, sql, params)
@@ -1,10 +1,12 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from market.views.user_views import RegisterAccount, ConfirmAccount, LoginAccount, AccountDetails, \
-    ContactView, ResetPassword, ResetPasswordConfirm
+from market.views.user_views import RegisterAccount, ConfirmAccount, LoginAccount, LogoutAccount, \
+    AccountDetails, ContactView, ResetPassword, ResetPasswordConfirm, BulkProvisionAccounts
 from market.views.shop_views import MarketView, BasketView, OrderView
-from market.views.partner_views import PartnerUpdate, PartnerState, PartnerOrders
+from market.views.async_views import AsyncMarketView, AsyncBasketView, AsyncOrderView, AsyncPartnerOrders
+from market.views.metrics_views import QueryStatsView, TaskStatsView
+from market.views.partner_views import PartnerUpdate, PartnerState, PartnerOrders, PartnerOrdersState
 
 router = DefaultRouter()
 router.register('market', MarketView)
@@ -15,6 +17,8 @@ urlpatterns = [
     path('user/register', RegisterAccount.as_view(), name='user-register'),
     path('user/register/confirm', ConfirmAccount.as_view(), name='user-register-confirm'),
     path('user/login', LoginAccount.as_view(), name='user-login'),
+    path('user/logout', LogoutAccount.as_view(), name='user-logout'),
+    path('user/bulk', BulkProvisionAccounts.as_view(), name='user-bulk'),
 
     path('user/password_reset', ResetPassword.as_view(), name='password-reset'),
     path('user/password_reset/confirm', ResetPasswordConfirm.as_view(), name='password-reset-confirm'),
@@ -23,8 +27,20 @@ urlpatterns = [
 
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
     path('partner/state', PartnerState.as_view(), name='partner-state'),
+    path('partner/orders/state', PartnerOrdersState.as_view(), name='partner-orders-state'),
 
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
 
+    # асинхронные обработчики чтения (ASGI)
+    path('async/market', AsyncMarketView.as_view(), name='async-market-list'),
+    path('async/market/<int:pk>', AsyncMarketView.as_view(), name='async-market-detail'),
+    path('async/basket', AsyncBasketView.as_view(), name='async-basket'),
+    path('async/order', AsyncOrderView.as_view(), name='async-order'),
+    path('async/partner/orders', AsyncPartnerOrders.as_view(), name='async-partner-orders-list'),
+    path('async/partner/orders/<int:pk>', AsyncPartnerOrders.as_view(), name='async-partner-orders-detail'),
+
+    path('metrics/queries', QueryStatsView.as_view(), name='metrics-queries'),
+    path('metrics/tasks', TaskStatsView.as_view(), name='metrics-tasks'),
+
 ] + router.urls
@@ -0,0 +1,220 @@
+"""
+Асинхронные обработчики чтения каталога, корзины и заказов (api/async/...).
+
+Обработчики используют асинхронный интерфейс ORM и не занимают поток сервера на время
+ожидания ответа БД. Предназначены для запуска под ASGI (см. README), ответы совпадают
+с ответами синхронных обработчиков.
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import Count, F, Prefetch, Sum
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.authentication import get_authorization_header
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from market.authentication import CachedTokenAuthentication
+from market.catalog import catalog_etag, catalog_last_modified, patch_catalog_headers
+from market.filters import OrderFilter, ProductInfoFilter
+from market.models import ProductInfo, Order, OrderItem
+from market.pagination import OrderPagination
+from market.serializers import ProductInfoSerializer, OrderSerializer, OrderHistorySerializer, \
+    OrderSummarySerializer
+
+
+async def authenticate(request):
+    """
+    Пользователь по токену из заголовка Authorization ("Token <key>") или None
+    """
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b'token':
+        return None
+    try:
+        user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(auth[1].decode())
+    except (exceptions.AuthenticationFailed, UnicodeError):
+        return None
+    return user
+
+
+def get_page_size(request, pagination_class):
+    """
+    Размер страницы по правилам класса постраничного вывода DRF
+    """
+    param = pagination_class.page_size_query_param
+    if param and param in request.GET:
+        try:
+            page_size = int(request.GET[param])
+        except ValueError:
+            page_size = 0
+        if page_size > 0:
+            return min(page_size, pagination_class.max_page_size or page_size)
+    return pagination_class.page_size
+
+
+async def paginate(request, queryset, pagination_class=PageNumberPagination):
+    """
+    Страница queryset в формате PageNumberPagination: count, next, previous, results.
+    Возвращает None, если номер страницы неверный
+    """
+    page_size = get_page_size(request, pagination_class)
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return None
+    count = await queryset.acount()
+    offset = (page - 1) * page_size
+    if page < 1 or (offset >= count and page != 1):
+        return None
+
+    results = [obj async for obj in queryset[offset:offset + page_size]]
+    url = request.build_absolute_uri()
+    if page == 1:
+        previous = None
+    elif page == 2:
+        previous = remove_query_param(url, 'page')
+    else:
+        previous = replace_query_param(url, 'page', page - 1)
+    return {
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if offset + page_size < count else None,
+        'previous': previous,
+        'results': results,
+    }
+
+
+def detail(message, status):
+    return JsonResponse({'detail': message}, status=status)
+
+
+class AsyncReadView(View):
+    """
+    Базовый класс асинхронных обработчиков чтения.
+    Проверяет токен (authentication_required) и тип пользователя (shop_only)
+    """
+    authentication_required = True
+    shop_only = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await authenticate(request) if self.authentication_required else None
+        if self.authentication_required and request.user is None:
+            return detail('Authentication credentials were not provided.', 401)
+        if self.shop_only and request.user.type != 'shop':
+            return detail('Only for shops', 403)
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def paginated_response(self, request, queryset, serializer_class, pagination_class=PageNumberPagination):
+        page = await paginate(request, queryset, pagination_class)
+        if page is None:
+            return detail('Invalid page.', 404)
+        page['results'] = serializer_class(page['results'], many=True).data
+        return JsonResponse(page)
+
+    @staticmethod
+    async def detail_response(queryset, pk, serializer_class):
+        instance = await queryset.filter(pk=pk).afirst()
+        if instance is None:
+            return detail('Not found.', 404)
+        return JsonResponse(serializer_class(instance).data)
+
+
+class AsyncMarketView(AsyncReadView):
+    """
+    Класс для отображения товаров
+    с возможностью поиска по имени и фильтрации по магазину и категории
+    """
+    authentication_required = False
+
+    async def get(self, request, pk=None, *args, **kwargs):
+        # версии каталогов читаются из БД один раз и сохраняются в запросе
+        last_modified = await sync_to_async(catalog_last_modified)(request)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        etag = quote_etag(catalog_etag(request))
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await self.get_catalog(request, pk)
+        if response.status_code in (200, 304):
+            response.headers.setdefault('ETag', etag)
+            if last_modified:
+                response.headers.setdefault('Last-Modified', http_date(last_modified))
+            patch_catalog_headers(response)
+        return response
+
+    async def get_catalog(self, request, pk):
+        queryset = ProductInfo.objects.select_related('product__category').prefetch_related(
+            'product_parameters__parameter').order_by('id')
+        if pk is not None:
+            return await self.detail_response(queryset, pk, ProductInfoSerializer)
+
+        filterset = ProductInfoFilter(request.GET, queryset=queryset)
+        if not filterset.is_valid():
+            return JsonResponse(filterset.errors, status=400)
+        queryset = filterset.qs
+        for term in request.GET.get('search', '').replace(',', ' ').split():
+            queryset = queryset.filter(product__name__icontains=term)
+
+        return await self.paginated_response(request, queryset, ProductInfoSerializer)
+
+
+class AsyncBasketView(AsyncReadView):
+    """
+    Класс для получения корзины пользователя
+    """
+
+    async def get(self, request, *args, **kwargs):
+        items = OrderItem.objects.select_related('product_info__product__category').prefetch_related(
+            'product_info__product_parameters__parameter')
+        basket = Order.objects.filter(user_id=request.user.id, state='basket').select_related(
+            'contact').prefetch_related(Prefetch('ordered_items', queryset=items))
+
+        serializer = OrderSerializer([order async for order in basket], many=True)
+        return JsonResponse(serializer.data, safe=False)
+
+
+class AsyncOrderView(AsyncReadView):
+    """
+    Класс для получения заказов пользователя.
+    Поддерживается постраничный вывод (page, page_size), фильтры state, state__in, dt__gte, dt__lte
+    и краткий режим без позиций заказа (summary=true)
+    """
+
+    async def get(self, request, *args, **kwargs):
+        orders = Order.objects.filter(user_id=request.user.id).exclude(state='basket').order_by('-dt', '-id')
+
+        filterset = OrderFilter(request.GET, queryset=orders)
+        if not filterset.is_valid():
+            return JsonResponse({'Status': False, 'Errors': filterset.errors})
+        orders = filterset.qs
+
+        if request.GET.get('summary') in ('1', 'true', 'True'):
+            orders = orders.annotate(items_count=Count('ordered_items'),
+                                     total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__price')))
+            serializer_class = OrderSummarySerializer
+        else:
+            orders = orders.select_related('contact').prefetch_related('ordered_items')
+            serializer_class = OrderHistorySerializer
+
+        return await self.paginated_response(request, orders, serializer_class, OrderPagination)
+
+
+class AsyncPartnerOrders(AsyncReadView):
+    """
+    Класс для получения заказов поставщиками
+    с возможностью фильтрации по статусу и диапазону дат
+    """
+    shop_only = True
+
+    async def get(self, request, pk=None, *args, **kwargs):
+        shop_orders = OrderItem.objects.filter(shop__user_id=request.user.id).values('order_id')
+        orders = Order.objects.filter(id__in=shop_orders).exclude(state='basket').select_related(
+            'contact').prefetch_related('ordered_items').order_by('-dt', '-id')
+        if pk is not None:
+            return await self.detail_response(orders, pk, OrderHistorySerializer)
+
+        filterset = OrderFilter(request.GET, queryset=orders)
+        if not filterset.is_valid():
+            return JsonResponse(filterset.errors, status=400)
+        return await self.paginated_response(request, filterset.qs, OrderHistorySerializer)
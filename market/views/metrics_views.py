@@ -0,0 +1,73 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from market import metrics, prometheus
+
+
+class QueryStatsView(APIView):
+    """
+    Класс для просмотра статистики запросов к БД по обработчикам (для сотрудников площадки).
+    Обработчики отсортированы по среднему числу запросов к БД
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        stats = []
+        for endpoint, counters in metrics.collect('queries').items():
+            requests = counters.get('requests') or 1
+            stats.append({
+                'endpoint': endpoint,
+                'requests': int(counters.get('requests', 0)),
+                'queries': int(counters.get('queries', 0)),
+                'avg_queries': round(counters.get('queries', 0) / requests, 2),
+                'avg_db_time_ms': round(counters.get('db_time', 0) * 1000 / requests, 2),
+                'over_budget': int(counters.get('over_budget', 0)),
+            })
+        stats.sort(key=lambda item: item['avg_queries'], reverse=True)
+        return Response(stats)
+
+
+class TaskStatsView(APIView):
+    """
+    Класс для просмотра статистики задач Celery и длины очередей (для сотрудников площадки)
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        tasks = []
+        for name, counters in sorted(metrics.collect('tasks').items()):
+            started = counters.get('started') or 1
+            tasks.append({
+                'task': name,
+                'published': int(counters.get('published', 0)),
+                'started': int(counters.get('started', 0)),
+                'succeeded': int(counters.get('succeeded', 0)),
+                'failed': int(counters.get('failed', 0)),
+                'retried': int(counters.get('retried', 0)),
+                'avg_wait_ms': round(counters.get('wait_time', 0) * 1000 / started, 2),
+                'avg_run_ms': round(counters.get('run_time', 0) * 1000 / started, 2),
+            })
+        queues = {name: {'depth': int(values.get('depth', 0)), 'sampled_at': values.get('sampled_at')}
+                  for name, values in sorted(metrics.collect('queues').items())}
+        return Response({'tasks': tasks, 'queues': queues})
+
+
+class PrometheusMetricsView(View):
+    """
+    Класс для сбора метрик Prometheus: HTTP запросы, запросы к БД, кэши, задачи Celery.
+    Если задан METRICS_SCRAPE_TOKEN, требуется заголовок "Authorization: Bearer <токен>"
+    """
+
+    def get(self, request, *args, **kwargs):
+        token = settings.METRICS_SCRAPE_TOKEN
+        if token and not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+        return HttpResponse(prometheus.render(), content_type=prometheus.CONTENT_TYPE)
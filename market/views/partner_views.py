@@ -2,6 +2,7 @@ from distutils.util import strtobool
 
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
+from django.db import transaction
 from django.db.models import QuerySet
 from django.http import JsonResponse
 
@@ -12,9 +13,14 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from yaml import load as load_yaml, Loader
 
-from market.models import ProductInfo, Category, Product, Shop, Parameter, ProductParameter, Order
+from market import outbox
+from market.catalog import catalog_update
+from market.filters import OrderFilter
+from market.models import ProductInfo, Category, Product, Shop, Parameter, ProductParameter, Order, OrderItem, \
+    STATE_TRANSITIONS
 from market.permissions import IsShop
-from market.serializers import ShopSerializer, OrderSerializer
+from market.serializers import ShopSerializer, OrderHistorySerializer
+from market.tasks import send_orders_state_mail_task
 
 
 class PartnerUpdate(APIView):
@@ -52,32 +58,37 @@ class PartnerUpdate(APIView):
                 # проверяем является ли пользователь администратором магазина
                 if shop_obj.user == request.user or created:
 
-                    for category in data['categories']:
-                        category_obj, _ = Category.objects.get_or_create(id=category['id'],
-                                                                         name=category['name'],
-                                                                         )
-                        category_obj.shops.add(shop_obj.id)
-                        category_obj.save()
-                    ProductInfo.objects.filter(shop_id=shop_obj.id).delete()
-
-                    for product in data['goods']:
-                        product_obj, _ = Product.objects.get_or_create(name=product['name'],
-                                                                       category_id=product['category']
-                                                                       )
-
-                        product_info_obj, _ = ProductInfo.objects.get_or_create(product_id=product_obj.id,
-                                                                                shop_id=shop_obj.id,
-                                                                                model=product['model'],
-                                                                                quantity=product['quantity'],
-                                                                                price=product['price'],
-                                                                                price_rrc=product['price_rrc'],
-                                                                                external_id=product['id']
-                                                                                )
-                        for parameter, value in product['parameters'].items():
-                            parameter_obj, _ = Parameter.objects.get_or_create(name=parameter)
-                            ProductParameter.objects.create(product_info_id=product_info_obj.id,
-                                                            parameter_id=parameter_obj.id,
-                                                            value=value)
+                    # версия каталога увеличивается один раз после импорта, а не на каждую запись
+                    with catalog_update(shop_obj.id):
+                        for category in data['categories']:
+                            category_obj, _ = Category.objects.get_or_create(id=category['id'],
+                                                                             name=category['name'],
+                                                                             )
+                            category_obj.shops.add(shop_obj.id)
+                            category_obj.save()
+                        # позиции корзин с удаляемыми товарами удаляются,
+                        # в оформленных заказах остаются данные товара на момент оформления
+                        OrderItem.objects.filter(product_info__shop_id=shop_obj.id, order__state='basket').delete()
+                        ProductInfo.objects.filter(shop_id=shop_obj.id).delete()
+
+                        for product in data['goods']:
+                            product_obj, _ = Product.objects.get_or_create(name=product['name'],
+                                                                           category_id=product['category']
+                                                                           )
+
+                            product_info_obj, _ = ProductInfo.objects.get_or_create(product_id=product_obj.id,
+                                                                                    shop_id=shop_obj.id,
+                                                                                    model=product['model'],
+                                                                                    quantity=product['quantity'],
+                                                                                    price=product['price'],
+                                                                                    price_rrc=product['price_rrc'],
+                                                                                    external_id=product['id']
+                                                                                    )
+                            for parameter, value in product['parameters'].items():
+                                parameter_obj, _ = Parameter.objects.get_or_create(name=parameter)
+                                ProductParameter.objects.create(product_info_id=product_info_obj.id,
+                                                                parameter_id=parameter_obj.id,
+                                                                value=value)
                     return JsonResponse({'Status': True})
                 else:
                     return JsonResponse({'Status': False, 'Errors': 'Обновлять прайс может '
@@ -116,15 +127,63 @@ class PartnerState(APIView):
 class PartnerOrders(ReadOnlyModelViewSet):
     """
     Класс для получения заказов поставщиками
+    с возможностью фильтрации по статусу и диапазону дат
     """
-    serializer_class = OrderSerializer
+    serializer_class = OrderHistorySerializer
     permission_classes = [IsAuthenticated, IsShop]
+    filterset_class = OrderFilter
 
     def get_queryset(self):
-        queryset = Order.objects.filter(
-            ordered_items__product_info__shop__user_id=self.request.user.id).exclude(state='basket').distinct()
+        # Заказы выбираем по магазину позиции (индекс orderitem_shop_order_idx),
+        # подзапрос вместо join избавляет от distinct
+        shop_orders = OrderItem.objects.filter(shop__user_id=self.request.user.id).values('order_id')
+        queryset = Order.objects.filter(id__in=shop_orders).exclude(state='basket').select_related(
+            'contact').prefetch_related('ordered_items')
 
         if isinstance(queryset, QuerySet):
             # Ensure queryset is re-evaluated on each request.
             queryset = queryset.all()
         return queryset
+
+
+class PartnerOrdersState(APIView):
+    """
+    Класс для массового изменения статуса заказов поставщиком
+    """
+
+    permission_classes = [IsAuthenticated, IsShop]
+
+    # изменить статус заказов.
+    # orders - список id заказов (или строка с id через запятую), state - новый статус
+    def post(self, request, *args, **kwargs):
+        orders = request.data.get('orders')
+        state = request.data.get('state')
+        if orders and state:
+            if isinstance(orders, str):
+                orders = orders.split(',')
+            orders = [str(order_id).strip() for order_id in orders]
+            order_ids = {int(order_id) for order_id in orders if order_id.isdigit()}
+
+            # статусы, из которых разрешен переход в новый статус
+            from_states = [from_state for from_state, to_states in STATE_TRANSITIONS.items() if state in to_states]
+            if not from_states:
+                return JsonResponse({'Status': False, 'Errors': f'Недопустимый статус: {state}'})
+
+            with transaction.atomic():
+                shop_orders = OrderItem.objects.filter(shop__user_id=request.user.id,
+                                                       order_id__in=order_ids).values('order_id')
+                updated_ids = list(Order.objects.select_for_update().filter(
+                    id__in=shop_orders, state__in=from_states).values_list('id', flat=True))
+                # все заказы переводятся одним запросом
+                Order.objects.filter(id__in=updated_ids).update(state=state)
+
+                if updated_ids and 'test' not in request.data:
+                    # одна задача Celery на все уведомления покупателей
+                    outbox.enqueue(send_orders_state_mail_task, order_ids=updated_ids, state=state)
+
+            errors = {order_id: 'Заказ не найден или переход статуса недопустим'
+                      for order_id in sorted(order_ids.difference(updated_ids))}
+            errors.update((order_id, 'Некорректный id заказа') for order_id in orders if not order_id.isdigit())
+            return JsonResponse({'Status': True, 'Обновлено объектов': len(updated_ids), 'Errors': errors})
+
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
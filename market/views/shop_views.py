@@ -1,6 +1,9 @@
-from django.db import IntegrityError
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Count, Sum, F
 from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework.filters import SearchFilter
@@ -9,23 +12,38 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from market import outbox
+from market.catalog import catalog_etag, catalog_last_modified, patch_catalog_headers
+from market.filters import OrderFilter
 from market.models import ProductInfo, Order, OrderItem
-from market.serializers import ProductInfoSerializer, OrderSerializer, OrderItemSerializer
+from market.pagination import OrderPagination
+from market.serializers import ProductInfoSerializer, OrderSerializer, OrderItemSerializer, \
+    OrderSummarySerializer, OrderHistorySerializer
 # from market.signals import new_order
 from market.tasks import send_simple_mail_task
 
 
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified), name='list')
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified), name='retrieve')
 class MarketView(ReadOnlyModelViewSet):
     """
     Класс для отображения товаров
-    с возможностью поиска по имени и фильтрации по магазину и категории
+    с возможностью поиска по имени и фильтрации по магазину и категории.
+    Ответы содержат ETag и Last-Modified по версиям каталогов магазинов,
+    на запросы с актуальным If-None-Match возвращается 304 без выборки товаров
     """
-    queryset = ProductInfo.objects.all()
+    queryset = ProductInfo.objects.order_by('id')
     serializer_class = ProductInfoSerializer
     filter_backends = [SearchFilter, DjangoFilterBackend]
     filterset_fields = ['shop', 'product__category']
     search_fields = ['product__name']
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            patch_catalog_headers(response)
+        return response
+
 
 class BasketView(APIView):
     """
@@ -44,6 +62,8 @@ class BasketView(APIView):
     # добавить позиции в корзину
     def post(self, request, *args, **kwargs):
 
+        # одновременное создание второй корзины отклоняет ограничение unique_user_basket,
+        # get_or_create в этом случае возвращает уже созданную корзину
         basket, _ = Order.objects.get_or_create(user=request.user, state='basket')
         objects_created = 0
         ordered_items = request.data.get('ordered_items')
@@ -70,13 +90,13 @@ class BasketView(APIView):
         items_string = request.data.get('items')
         if items_string:
             items_list = items_string.split(',')
-            basket = Order.objects.filter(user=request.user, state='basket')
+            basket = Order.objects.filter(user=request.user, state='basket').first()
             if basket:
                 query = Q()
                 objects_deleted = False
                 for order_item_id in items_list:
                     if order_item_id.isdigit():
-                        query = query | Q(order_id=basket[0].id, id=order_item_id)
+                        query = query | Q(order_id=basket.id, id=order_item_id)
                         objects_deleted = True
                 if objects_deleted:
                     deleted_count = OrderItem.objects.filter(query).delete()[0]
@@ -90,13 +110,13 @@ class BasketView(APIView):
 
         ordered_items = request.data.get('ordered_items')
         if ordered_items:
-            basket = Order.objects.filter(user=request.user, state='basket')
+            basket = Order.objects.filter(user=request.user, state='basket').first()
             if basket:
                 objects_updated = 0
                 for order_item in ordered_items:
                     if type(order_item['id']) == int and type(order_item['quantity']) == int:
                         objects_updated += OrderItem.objects.filter(
-                            order_id=basket[0].id,
+                            order_id=basket.id,
                             id=order_item['id']).update(quantity=order_item['quantity'])
 
                 return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
@@ -111,33 +131,61 @@ class OrderView(APIView):
 
     permission_classes = [IsAuthenticated]
 
-    # получить мои заказы
+    # получить мои заказы.
+    # Поддерживается постраничный вывод (page, page_size), фильтры state, state__in, dt__gte, dt__lte
+    # и краткий режим без позиций заказа (summary=true)
     def get(self, request, *args, **kwargs):
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').distinct()
-
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        orders = Order.objects.filter(user_id=request.user.id).exclude(state='basket').order_by('-dt', '-id')
+
+        filterset = OrderFilter(request.query_params, queryset=orders)
+        if not filterset.is_valid():
+            return JsonResponse({'Status': False, 'Errors': filterset.errors})
+        orders = filterset.qs
+
+        if request.query_params.get('summary') in ('1', 'true', 'True'):
+            orders = orders.annotate(items_count=Count('ordered_items'),
+                                     total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__price')))
+            serializer_class = OrderSummarySerializer
+        else:
+            orders = orders.select_related('contact').prefetch_related('ordered_items')
+            serializer_class = OrderHistorySerializer
+
+        paginator = OrderPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     # разместить заказ из корзины
     def post(self, request, *args, **kwargs):
         if {'contact'}.issubset(request.data):
+            # дата оформленного заказа - момент оформления, по ней заказ и его позиции
+            # попадают в секцию текущего месяца
+            now = timezone.now()
             try:
-                is_updated = Order.objects.filter(
-                    user_id=request.user.id, state='basket').update(
-                    contact_id=request.data['contact'],
-                    state='new')
+                with transaction.atomic():
+                    basket_ids = list(Order.objects.filter(
+                        user_id=request.user.id, state='basket').values_list('id', flat=True))
+                    is_updated = Order.objects.filter(id__in=basket_ids).update(
+                        contact_id=request.data['contact'],
+                        state='new',
+                        dt=now)
+                    # цены и данные товаров фиксируются в позициях заказа на момент оформления
+                    OrderItem.objects.filter(order_id__in=basket_ids).capture_catalog(order_dt=now)
+
+                    if is_updated:
+                        # отправить email о создании нового заказа, используя Signals:
+                        # new_order.send(user_id=request.user.id)
+
+                        # используя Celery (через outbox, в одной транзакции с заказом)
+                        outbox.enqueue(send_simple_mail_task,
+                                       user_id=request.user.id,
+                                       email=request.user.email,
+                                       title='Django-API-market: Обновление статуса заказа',
+                                       message='Заказ сформирован')
             except IntegrityError as error:
                 print(error)
                 return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
             else:
                 if is_updated:
-                    # отправить email о создании нового заказа, используя Signals:
-                    # new_order.send(user_id=request.user.id)
-
-                    # используя Celery
-                    send_simple_mail_task.delay(user_id=request.user.id,
-                                                title='Django-API-market: Обновление статуса заказа',
-                                                message='Заказ сформирован')
                     return JsonResponse({'Status': True})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
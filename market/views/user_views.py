@@ -1,32 +1,62 @@
-from django.contrib.auth import authenticate
+import json
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.password_validation import validate_password
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from django.http import JsonResponse
 from django.db.models.query import QuerySet
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 
-from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from market import outbox
+from market.authentication import issue_token
 from market.models import ConfirmEmailToken, Contact, User
-from market.serializers import UserSerializer, ContactSerializer
+from market.parsers import CSVParser
+from market.passwords import aauthenticate, amake_password, executor
+from market.serializers import UserSerializer, ContactSerializer, UserProvisionSerializer
 # from market.signals import new_user_registered
-from market.tasks import send_token_to_email_task, send_simple_mail_task
+from market.tasks import send_token_to_email_task, send_simple_mail_task, send_tokens_to_emails_task
+
+
+def request_data(request):
+    """
+    Данные запроса для асинхронных обработчиков (JSON или данные формы)
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
 
 
-class RegisterAccount(APIView):
+@method_decorator(csrf_exempt, name='dispatch')
+class RegisterAccount(View):
     """
     Класс для регистрации пользователей.
-    При успешной регистрации пользователю высылается email с токеном
+    При успешной регистрации пользователю высылается email с токеном.
+    Обработчик асинхронный: хеширование пароля выполняется в пуле хеширования,
+    пользователь сохраняется в БД одним запросом
     """
 
     # Тип пользователя (магазин или покупатель) устанавливается в момент регистрации
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
+        data = request_data(request)
 
-        if {'first_name', 'last_name', 'email', 'password', 'company', 'position'}.issubset(request.data):
+        if {'first_name', 'last_name', 'email', 'password', 'company', 'position'}.issubset(data):
             try:
-                validate_password(request.data['password'])
+                validate_password(data['password'])
             except Exception as password_error:
                 error_array = []
                 # noinspection PyTypeChecker
@@ -34,31 +64,38 @@ class RegisterAccount(APIView):
                     error_array.append(item)
                 return JsonResponse({'Status': False, 'Errors': {'password': error_array}})
             else:
-                user_serializer = UserSerializer(data=request.data)
-                if user_serializer.is_valid():
-                    user = user_serializer.save()
-                    user.set_password(request.data['password'])
-                    if request.data.get('type') == 'shop':
+                user_serializer = UserSerializer(data=data)
+                if await sync_to_async(user_serializer.is_valid)():
+                    user = User(**user_serializer.validated_data)
+                    user.password = await amake_password(data['password'])
+                    if data.get('type') == 'shop':
                         user.type = 'shop'
-                    user.save()
+                    await sync_to_async(self.save_user)(user, notify=data.get('test') != 'test')
 
-                    if request.data.get('test') == 'test':
+                    if data.get('test') == 'test':
                         # Для тестирования возвращаем:
                         return JsonResponse({'Status': True, 'Test': 'Passed'})
-
-                    else:
-                        # Отправить пользователю email (с токеном) для его подтверждения, используя Signals:
-                        # new_user_registered.send(user_id=user.id)
-
-                        # используя Celery
-                        send_token_to_email_task.delay(user_id=user.id,
-                                                       title='Django-API-market: Mail confirmation token')
-                        return JsonResponse({'Status': True})
+                    return JsonResponse({'Status': True})
                 else:
                     return JsonResponse({'Status': False, 'Errors': user_serializer.errors})
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
+    @staticmethod
+    def save_user(user, notify):
+        """
+        Сохраняет пользователя и задачу отправки письма с токеном в одной транзакции
+        """
+        with transaction.atomic():
+            user.save()
+            if notify:
+                # Отправить пользователю email (с токеном) для его подтверждения, используя Signals:
+                # new_user_registered.send(user_id=user.id)
+
+                # используя Celery (через outbox)
+                outbox.enqueue(send_token_to_email_task,
+                               user_id=user.id, title='Django-API-market: Mail confirmation token')
+
 
 class ConfirmAccount(APIView):
     """
@@ -70,7 +107,9 @@ class ConfirmAccount(APIView):
 
         if {'email', 'token'}.issubset(request.data):
             token = ConfirmEmailToken.objects.filter(user__email=request.data['email'],
-                                                     key=request.data['token']).first()
+                                                     key=request.data['token'],
+                                                     created_at__gte=timezone.now() - settings.CONFIRM_TOKEN_TTL
+                                                     ).first()
             if token:
                 token.user.is_active = True
                 token.user.save()
@@ -82,19 +121,22 @@ class ConfirmAccount(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class LoginAccount(APIView):
+@method_decorator(csrf_exempt, name='dispatch')
+class LoginAccount(View):
     """
-    Класс для авторизации пользователей
+    Класс для авторизации пользователей.
+    Обработчик асинхронный: authenticate (с проверкой пароля) выполняется в пуле хеширования
     """
 
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
+        data = request_data(request)
 
-        if {'email', 'password'}.issubset(request.data):
-            user = authenticate(request, username=request.data['email'], password=request.data['password'])
+        if {'email', 'password'}.issubset(data):
+            user = await aauthenticate(request, username=data['email'], password=data['password'])
 
             if user is not None:
                 if user.is_active:
-                    token, _ = Token.objects.get_or_create(user=user)
+                    token = await sync_to_async(issue_token)(user)
 
                     return JsonResponse({'Status': True, 'Token': token.key})
 
@@ -105,6 +147,136 @@ class LoginAccount(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
+class LogoutAccount(APIView):
+    """
+    Класс для выхода пользователя. Токен авторизации удаляется
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        request.auth.delete()
+        return JsonResponse({'Status': True})
+
+
+class BulkProvisionAccounts(APIView):
+    """
+    Класс для массовой регистрации пользователей и их контактов (для сотрудников площадки).
+    Принимает JSON (список или {"users": [...]}) либо CSV (тело запроса text/csv или файл file).
+    Строка: first_name, last_name, email, company, position, type, password (необязательно)
+    и поля контакта city, street, house, structure, building, apartment, phone (необязательно).
+    Все строки проверяются до записи: при любой ошибке не создается ни один пользователь.
+    Пользователи и контакты создаются пачками, письма с токенами отправляются одной задачей
+    """
+
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, CSVParser, MultiPartParser, FormParser]
+
+    user_fields = ('first_name', 'last_name', 'email', 'company', 'position', 'type')
+    contact_fields = ('city', 'street', 'house', 'structure', 'building', 'apartment', 'phone')
+
+    def post(self, request, *args, **kwargs):
+        rows, test = self.get_rows(request)
+        if rows is None:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        if len(rows) > settings.BULK_PROVISION_MAX_ROWS:
+            return JsonResponse({'Status': False,
+                                 'Errors': f'Превышено число строк: {settings.BULK_PROVISION_MAX_ROWS}'})
+
+        users, contacts, passwords, errors = self.validate_rows(rows)
+        if errors:
+            return JsonResponse({'Status': False, 'Errors': errors})
+
+        # хеширование паролей - в пуле хеширования, параллельно для всей пачки
+        for user, password in zip(users, executor.map(make_password, passwords)):
+            user.password = password
+
+        batch_size = settings.BULK_PROVISION_BATCH_SIZE
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=batch_size)
+            for contact in contacts:
+                contact.user_id = contact.user.id
+            Contact.objects.bulk_create(contacts, batch_size=batch_size)
+
+            if not test:
+                # письма с токенами для подтверждения email - одной задачей (Через Celery, через outbox)
+                outbox.enqueue(send_tokens_to_emails_task, user_ids=[user.id for user in users],
+                               title='Django-API-market: Mail confirmation token')
+
+        return JsonResponse({'Status': True, 'Создано пользователей': len(users), 'Создано контактов': len(contacts)})
+
+    @staticmethod
+    def get_rows(request):
+        """
+        Строки для регистрации и признак тестового запроса
+        """
+        if 'file' in request.FILES:
+            return CSVParser().parse(request.FILES['file']), request.data.get('test') == 'test'
+        data = request.data
+        if isinstance(data, list):
+            return data, request.query_params.get('test') == 'test'
+        users = data.get('users')
+        return (users if isinstance(users, list) else None), data.get('test') == 'test'
+
+    def validate_rows(self, rows):
+        """
+        Проверяет все строки за один проход.
+        Возвращает несохраненных пользователей, контакты, пароли и ошибки по номерам строк
+        """
+        users, contacts, passwords, errors = [], [], [], {}
+        emails = {}
+
+        for number, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                errors[number] = 'Неверный формат строки'
+                continue
+            row = {key: value.strip() if isinstance(value, str) else value
+                   for key, value in row.items() if key is not None}
+            row_errors = {}
+
+            serializer = UserProvisionSerializer(data={key: row[key] for key in self.user_fields if row.get(key)})
+            if not serializer.is_valid():
+                row_errors.update(serializer.errors)
+            else:
+                email = User.objects.normalize_email(serializer.validated_data['email'])
+                if email.lower() in emails:
+                    row_errors['email'] = [f'Email повторяется в строке {emails[email.lower()]}']
+                emails.setdefault(email.lower(), number)
+                user = User(**dict(serializer.validated_data, email=email))
+
+            password = row.get('password') or None
+            if password:
+                try:
+                    validate_password(password)
+                except Exception as password_error:
+                    row_errors['password'] = list(password_error)
+
+            contact = None
+            if any(row.get(key) for key in self.contact_fields):
+                contact_serializer = ContactSerializer(
+                    data={key: row[key] for key in self.contact_fields if row.get(key)})
+                if contact_serializer.is_valid():
+                    contact = Contact(**contact_serializer.validated_data)
+                else:
+                    row_errors.update(contact_serializer.errors)
+
+            if row_errors:
+                errors[number] = row_errors
+                continue
+            users.append(user)
+            passwords.append(password)
+            if contact:
+                contact.user = user
+                contacts.append(contact)
+
+        # уже зарегистрированные email - одним запросом
+        registered = User.objects.filter(email__in=[user.email for user in users]).values_list('email', flat=True)
+        for email in registered:
+            errors[emails[email.lower()]] = {'email': ['Пользователь с таким email уже существует']}
+
+        return users, contacts, passwords, errors
+
+
 class AccountDetails(APIView):
     """
     Класс для работы данными пользователя
@@ -118,7 +290,9 @@ class AccountDetails(APIView):
         return Response(serializer.data)
 
     # Редактирование данные.
-    # При изменении email, его необходимо подтвердить, как при регистрации
+    # При изменении email, его необходимо подтвердить, как при регистрации.
+    # Изменения и задачи отправки писем сохраняются в одной транзакции
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         # проверяем обязательные аргументы
         if 'password' in request.data:
@@ -135,10 +309,12 @@ class AccountDetails(APIView):
                 request.user.set_password(request.data['password'])
 
                 if 'test' not in request.data:
-                    # отправляем пользователю email уведомление о смене пароля (Через Celery)
-                    send_simple_mail_task.delay(user_id=request.user.id,
-                                                title='Django-API-market: Изменение пароля',
-                                                message='Пароль был изменен')
+                    # отправляем пользователю email уведомление о смене пароля (Через Celery, через outbox)
+                    outbox.enqueue(send_simple_mail_task,
+                                   user_id=request.user.id,
+                                   email=request.user.email,
+                                   title='Django-API-market: Изменение пароля',
+                                   message='Пароль был изменен')
         # проверяем остальные данные
         user_serializer = UserSerializer(request.user, data=request.data, partial=True)
         if user_serializer.is_valid():
@@ -154,9 +330,9 @@ class AccountDetails(APIView):
                                          'Test': 'Passed',
                                          'Details': 'Изменился email. Нужно подтверждение'})
 
-                # Отправить пользователю письмо с токеном для подтверждения email (Через Celery)
-                send_token_to_email_task.delay(user_id=request.user.id,
-                                               title='Django-API-market: Mail confirmation token')
+                # Отправить пользователю письмо с токеном для подтверждения email (Через Celery, через outbox)
+                outbox.enqueue(send_token_to_email_task,
+                               user_id=request.user.id, title='Django-API-market: Mail confirmation token')
 
                 user_serializer.save()
                 return JsonResponse({'Status': True, 'Details': 'Изменился email. Нужно подтверждение'})
@@ -226,9 +402,9 @@ class ResetPassword(APIView):
             user = User.objects.get(email=request.data['email'])
             if user:
                 if 'test' not in request.data:
-                    # Отправить пользователю письмо с токеном для подтверждения email (Через Celery)
-                    send_token_to_email_task.delay(user_id=user.id,
-                                                   title='Django-API-market: Reset password token')
+                    # Отправить пользователю письмо с токеном для подтверждения email (Через Celery, через outbox)
+                    outbox.enqueue(send_token_to_email_task,
+                                   user_id=user.id, title='Django-API-market: Reset password token')
                     return JsonResponse({'Status': True})
 
                 # Для тестирования возвращаем:
@@ -246,11 +422,14 @@ class ResetPasswordConfirm(APIView):
     Класс для подтверждения сброса пароля
     """
 
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
 
         if {'token', 'email', 'password'}.issubset(request.data):
             token = ConfirmEmailToken.objects.filter(user__email=request.data['email'],
-                                                     key=request.data['token']).first()
+                                                     key=request.data['token'],
+                                                     created_at__gte=timezone.now() - settings.CONFIRM_TOKEN_TTL
+                                                     ).first()
             if token:
                 # проверяем пароль на сложность
                 try:
@@ -266,10 +445,12 @@ class ResetPasswordConfirm(APIView):
                     token.user.save()
                     token.delete()
                     if 'test' not in request.data:
-                        # отправляем пользователю email уведомление о смене пароля (Через Celery)
-                        send_simple_mail_task.delay(user_id=token.user.id,
-                                                    title='Django-API-market: Изменение пароля',
-                                                    message='Пароль был изменен')
+                        # отправляем пользователю email уведомление о смене пароля (Через Celery, через outbox)
+                        outbox.enqueue(send_simple_mail_task,
+                                       user_id=token.user.id,
+                                       email=token.user.email,
+                                       title='Django-API-market: Изменение пароля',
+                                       message='Пароль был изменен')
                         return JsonResponse({'Status': True})
                     # Для тестирования возвращаем:
                     return JsonResponse({'Status': True, 'Test': 'Passed'})
@@ -0,0 +1,168 @@
+from random import randint
+
+import pytest
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
+
+from market import mail, metrics
+from market.authentication import local_cache
+from market.models import User, Shop, Category, Product, ProductInfo, Order, OrderItem
+from market.tasks import flush_mail_task
+
+
+@pytest.fixture(scope='session')
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix):
+    """Фикстура второй локальной базы данных replica - реплики для тестов маршрутизации чтения.
+    Данные в нее не реплицируются: чтение с реплики не видит записей основной базы"""
+    default = connections.settings['default']
+    test_name = None if default['ENGINE'].endswith('sqlite3') else f'test_{default["NAME"]}_replica'
+    connections.settings['replica'] = {**default, 'TEST': {**default['TEST'], 'NAME': test_name}}
+
+
+@pytest.fixture()
+def replica(settings):
+    """Фикстура - чтение с реплики replica"""
+    settings.DATABASE_REPLICAS = ['replica']
+    return 'replica'
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Фикстура очистки кэшей перед каждым тестом"""
+    cache.clear()
+    local_cache.clear()
+    metrics.clear()
+
+
+@pytest.fixture(autouse=True)
+def query_budgets(settings):
+    """Фикстура - превышение бюджета запросов к БД в тестах приводит к ошибке"""
+    settings.QUERY_BUDGET_MODE = 'raise'
+
+
+@pytest.fixture(autouse=True)
+def mail_queue(settings, monkeypatch):
+    """Фикстура очереди писем в памяти процесса. Письма отправляются явным вызовом flush_mail_task"""
+    settings.MAIL_QUEUE_BACKEND = 'market.mail.LocalMailQueue'
+    monkeypatch.setattr(flush_mail_task, 'apply_async', lambda **kwargs: None)
+    # новая очередь для каждого теста: без писем, запланированных отправок и блокировки
+    mail._queues.pop(settings.MAIL_QUEUE_BACKEND, None)
+    return mail.get_queue()
+
+
+@pytest.fixture()
+def client():
+    """Фикстура создания клиента"""
+    return APIClient()
+
+
+@pytest.fixture()
+def create_user():
+    """Фикстура создания пользователя"""
+
+    user = User.objects.create_user(first_name='First',
+                                    last_name='Second',
+                                    email=f'FirstSecond{randint(0, 1000)}@mail.ru',
+                                    password='qwer1234A',
+                                    company='CompanyOne',
+                                    position='worker',
+                                    type='shop',
+                                    )
+    return user
+
+
+@pytest.fixture()
+def create_active_user():
+    """Фикстура создания активного пользователя """
+
+    user = User.objects.create_user(first_name='First',
+                                    last_name='Second',
+                                    email=f'FirstSecond{randint(0, 1000)}@mail.ru',
+                                    password='qwer1234A',
+                                    company='CompanyOne',
+                                    position='worker',
+                                    type='shop',
+                                    is_active=True
+                                    )
+    return user
+
+
+@pytest.fixture()
+def create_token(create_active_user):
+    """Фикстура создания пользователя и токена для авторизации"""
+
+    token, _ = Token.objects.get_or_create(user_id=create_active_user.id)
+    return token
+
+
+@pytest.fixture()
+def client_auth(create_token):
+    """Фикстура создания клиента с заголовками для аваторизации"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + create_token.key)
+    return client
+
+
+@pytest.fixture()
+def create_shop(create_token):
+    """Фикстура создания магазина, администратором которого является авторизованный пользователь"""
+
+    shop = Shop.objects.create(name=f'Shop{randint(0, 1000)}', user_id=create_token.user.id)
+    return shop
+
+
+@pytest.fixture()
+def create_product_info(create_shop):
+    """Фикстура создания товара в магазине"""
+
+    category = Category.objects.create(name='Смартфоны')
+    product = Product.objects.create(name='Смартфон Apple iPhone XS Max 512GB (золотистый)', category=category)
+    product_info = ProductInfo.objects.create(product=product,
+                                              shop=create_shop,
+                                              model='apple/iphone/xs-max',
+                                              quantity=14,
+                                              price=110000,
+                                              price_rrc=116990,
+                                              external_id=4216292)
+    return product_info
+
+
+@pytest.fixture()
+def create_buyer():
+    """Фикстура создания активного покупателя"""
+
+    user = User.objects.create_user(first_name='Buyer',
+                                    last_name='Second',
+                                    email=f'Buyer{randint(0, 1000)}@mail.ru',
+                                    password='qwer1234A',
+                                    company='CompanyTwo',
+                                    position='manager',
+                                    type='buyer',
+                                    is_active=True
+                                    )
+    return user
+
+
+@pytest.fixture()
+def create_orders(create_buyer, create_product_info):
+    """Фикстура создания корзины и оформленных заказов покупателя с товаром магазина"""
+
+    orders = []
+    for state in ('basket', 'new', 'confirmed', 'delivered'):
+        order = Order.objects.create(user=create_buyer, state=state)
+        OrderItem.objects.create(order=order, product_info=create_product_info, quantity=2)
+        orders.append(order)
+    OrderItem.objects.exclude(order__state='basket').capture_catalog()
+    return orders
+
+
+@pytest.fixture()
+def buyer_client(create_buyer):
+    """Фикстура создания клиента с заголовками для авторизации покупателя"""
+
+    token, _ = Token.objects.get_or_create(user_id=create_buyer.id)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    return client
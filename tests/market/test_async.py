@@ -0,0 +1,105 @@
+import pytest
+from rest_framework.test import APIClient
+
+from market.models import Parameter, ProductParameter
+
+
+@pytest.fixture()
+def product_parameters(create_product_info):
+    """Фикстура создания характеристик товара"""
+
+    for name, value in (('Диагональ (дюйм)', '6.5'), ('Цвет', 'золотистый')):
+        ProductParameter.objects.create(product_info=create_product_info,
+                                        parameter=Parameter.objects.create(name=name),
+                                        value=value)
+    return create_product_info
+
+
+@pytest.mark.django_db
+def test_async_order_history(buyer_client, create_orders):
+    """Тест - асинхронная история заказов совпадает с синхронной"""
+
+    response = buyer_client.get('/api/async/order')
+
+    assert response.status_code == 200
+    assert response.json() == buyer_client.get('/api/order').json()
+
+    response = buyer_client.get('/api/async/order', {'summary': 'true', 'state': 'new'})
+    assert response.json() == buyer_client.get('/api/order', {'summary': 'true', 'state': 'new'}).json()
+
+
+@pytest.mark.django_db
+def test_async_order_pagination(buyer_client, create_orders):
+    """Тест постраничного вывода асинхронной истории заказов"""
+
+    data = buyer_client.get('/api/async/order', {'page_size': 1, 'page': 2}).json()
+
+    assert data['count'] == 3
+    assert len(data['results']) == 1
+    assert data['next'].endswith('/api/async/order?page=3&page_size=1')
+    assert data['previous'].endswith('/api/async/order?page_size=1')
+
+    response = buyer_client.get('/api/async/order', {'page': 10})
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_async_basket(buyer_client, create_orders, product_parameters):
+    """Тест - асинхронная корзина совпадает с синхронной"""
+
+    response = buyer_client.get('/api/async/basket')
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data == buyer_client.get('/api/basket').json()
+    assert data[0]['total_sum'] == 220000
+    assert len(data[0]['ordered_items'][0]['product_info']['product_parameters']) == 2
+
+
+@pytest.mark.django_db
+def test_async_market(client, product_parameters):
+    """Тест асинхронного каталога с фильтрацией и поиском"""
+
+    data = client.get('/api/async/market').json()
+    assert data['results'] == client.get('/api/market/').json()['results']
+
+    shop_id = product_parameters.shop_id
+    assert client.get('/api/async/market', {'shop': shop_id, 'search': 'iphone'}).json()['count'] == 1
+    assert client.get('/api/async/market', {'shop': shop_id + 1}).json()['count'] == 0
+    assert client.get('/api/async/market', {'search': 'samsung'}).json()['count'] == 0
+    assert client.get('/api/async/market', {'shop': 'abc'}).status_code == 400
+
+    response = client.get(f'/api/async/market/{product_parameters.id}')
+    assert response.json() == client.get(f'/api/market/{product_parameters.id}/').json()
+
+
+@pytest.mark.django_db
+def test_async_partner_orders(client_auth, buyer_client, create_orders):
+    """Тест - асинхронные заказы поставщика совпадают с синхронными"""
+
+    response = client_auth.get('/api/async/partner/orders', {'state__in': 'new,confirmed'})
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data['count'] == 2
+    assert data['results'] == client_auth.get('/api/partner/orders/', {'state__in': 'new,confirmed'}).json()['results']
+
+    order = create_orders[1]
+    response = client_auth.get(f'/api/async/partner/orders/{order.id}')
+    assert response.json() == client_auth.get(f'/api/partner/orders/{order.id}/').json()
+
+    # корзина покупателя поставщику недоступна
+    assert client_auth.get(f'/api/async/partner/orders/{create_orders[0].id}').status_code == 404
+    # заказы поставщика недоступны покупателю
+    assert buyer_client.get('/api/async/partner/orders').status_code == 403
+
+
+@pytest.mark.django_db
+def test_async_authentication(create_orders):
+    """Тест - асинхронные обработчики заказов требуют авторизации"""
+
+    client = APIClient()
+    assert client.get('/api/async/order').status_code == 401
+
+    client.credentials(HTTP_AUTHORIZATION='Token wrong')
+    assert client.get('/api/async/basket').status_code == 401
@@ -0,0 +1,127 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from market.catalog import bump_version, catalog_update
+from market.models import Shop, User, Parameter, ProductParameter
+
+SHOP_YAML = Path(__file__).resolve().parents[2] / 'data' / 'shop1.yaml'
+
+
+@pytest.mark.django_db
+def test_catalog_etag(client, create_product_info):
+    """Тест - ответ каталога содержит ETag, при актуальном If-None-Match возвращается 304"""
+
+    response = client.get('/api/market/')
+    assert response.status_code == 200
+    assert 'public' in response['Cache-Control']
+    assert response.has_header('Last-Modified')
+    etag = response['ETag']
+
+    response = client.get('/api/market/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+
+    assert client.get('/api/market/?page_size=1', HTTP_IF_NONE_MATCH=etag).status_code == 200
+    detail = client.get(f'/api/market/{create_product_info.id}/')
+    assert client.get(f'/api/market/{create_product_info.id}/',
+                      HTTP_IF_NONE_MATCH=detail['ETag']).status_code == 304
+
+
+@pytest.mark.django_db
+def test_catalog_version(client, create_product_info):
+    """Тест - изменение каталога магазина меняет ETag только ответов с этим магазином"""
+
+    other_shop = Shop.objects.create(name='Other shop')
+    url = f'/api/market/?shop={create_product_info.shop_id}'
+    etag = client.get(url)['ETag']
+    other_etag = client.get(f'/api/market/?shop={other_shop.id}')['ETag']
+
+    bump_version(create_product_info.shop_id)
+
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+    assert client.get(f'/api/market/?shop={other_shop.id}', HTTP_IF_NONE_MATCH=other_etag).status_code == 304
+
+
+@pytest.mark.django_db
+def test_catalog_etag_single_query(client, create_product_info):
+    """Тест - проверка If-None-Match выполняет один агрегирующий запрос, ETag меняется при добавлении магазина"""
+
+    etag = client.get('/api/market/')['ETag']
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get('/api/market/', HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert len(queries) == 1
+
+    Shop.objects.create(name='Other shop')
+    assert client.get('/api/market/', HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_async_catalog_etag(client, create_product_info):
+    """Тест - асинхронный каталог поддерживает If-None-Match"""
+
+    response = client.get('/api/async/market')
+    assert response.status_code == 200
+    assert client.get('/api/async/market', HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+
+    bump_version(create_product_info.shop_id)
+    assert client.get('/api/async/market', HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+
+@pytest.mark.django_db
+def test_import_bumps_version(client_auth, monkeypatch):
+    """Тест - импорт прайса увеличивает версию каталога магазина"""
+
+    monkeypatch.setattr('market.views.partner_views.get',
+                        lambda url: SimpleNamespace(content=SHOP_YAML.read_bytes()))
+    for version in (1, 2):
+        response = client_auth.post('/api/partner/update', {'url': 'https://example.com/shop1.yaml'})
+        assert response.json()['Status'] is True
+        assert Shop.objects.get(name='Связной').catalog_version == version
+
+
+@pytest.mark.django_db
+def test_admin_price_change_etag(client, create_product_info):
+    """Тест - изменение цены товара в админке меняет ETag каталога"""
+
+    url = f'/api/market/{create_product_info.id}/'
+    etag = client.get(url)['ETag']
+
+    client.force_login(User.objects.create_superuser(email='staff@mail.ru', password='qwer1234A', is_active=True))
+    response = client.post(f'/admin/market/productinfo/{create_product_info.id}/change/', {
+        'product': create_product_info.product_id, 'shop': create_product_info.shop_id,
+        'model': create_product_info.model, 'quantity': create_product_info.quantity, 'price': 99000,
+        'price_rrc': create_product_info.price_rrc, 'external_id': create_product_info.external_id,
+    }, format='multipart')
+    assert response.status_code == 302
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json()['price'] == 99000
+
+
+@pytest.mark.django_db
+def test_catalog_signals(client, create_product_info):
+    """Тест - изменение продукта, категории и параметров через ORM увеличивает версию каталога магазина"""
+
+    shop = Shop.objects.get(id=create_product_info.shop_id)
+    version = shop.catalog_version
+    product = create_product_info.product
+    product.name = 'Смартфон Apple iPhone XS Max 256GB (золотистый)'
+    product.save()
+    product.category.save()
+    ProductParameter.objects.create(product_info=create_product_info,
+                                    parameter=Parameter.objects.create(name='Цвет'), value='золотистый')
+    shop.refresh_from_db()
+    assert shop.catalog_version == version + 3
+
+    # внутри пакетного изменения версия увеличивается один раз
+    with catalog_update(shop.id):
+        create_product_info.price = 99000
+        create_product_info.save()
+        product.save()
+    shop.refresh_from_db()
+    assert shop.catalog_version == version + 4
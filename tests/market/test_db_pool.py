@@ -0,0 +1,139 @@
+import psycopg2
+import pytest
+from django.db import connection
+from django.db.utils import load_backend
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from dj_api_market.db.postgresql_pool.pool import ConnectionPool, close_pools
+
+postgresql = pytest.mark.skipif(connection.vendor != 'postgresql', reason='Пул соединений работает только с PostgreSQL')
+
+
+class FakeConnection:
+    """Соединение psycopg2 без сервера БД"""
+
+    class Info:
+        transaction_status = TRANSACTION_STATUS_IDLE
+
+    class Cursor:
+        def __init__(self, connection):
+            self.connection = connection
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def execute(self, sql):
+            self.connection.checks += 1
+            if self.connection.broken:
+                raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.checks = 0
+        self.rollbacks = 0
+        self.info = self.Info()
+
+    def cursor(self):
+        return self.Cursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture()
+def pool():
+    return ConnectionPool(max_size=2, max_lifetime=60, check_interval=0, timeout=0.1)
+
+
+def test_pool_reuse(pool):
+    """Тест - возвращенное соединение выдается повторно, новое не открывается"""
+
+    connection = pool.getconn(FakeConnection)
+    pool.putconn(connection)
+
+    assert pool.getconn(FakeConnection) is connection
+    assert connection.checks == 1
+    assert pool.stats() == {'size': 1, 'idle': 0, 'max_size': 2}
+
+
+def test_pool_exhausted(pool):
+    """Тест - при исчерпании пула соединение ожидается не дольше timeout"""
+
+    first, second = pool.getconn(FakeConnection), pool.getconn(FakeConnection)
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn(FakeConnection)
+
+    pool.putconn(first)
+    assert pool.getconn(FakeConnection) is first
+    assert second is not first
+
+
+def test_pool_health_check(pool):
+    """Тест - неисправное и устаревшее соединения закрываются и заменяются новыми"""
+
+    connection = pool.getconn(FakeConnection)
+    pool.putconn(connection)
+    connection.broken = True
+
+    replacement = pool.getconn(FakeConnection)
+    assert replacement is not connection
+    assert connection.closed
+
+    pool.max_lifetime = 0
+    pool.putconn(replacement)
+    assert replacement.closed
+    assert pool.stats()['size'] == 0
+
+
+def test_pool_rollback(pool):
+    """Тест - незавершенная транзакция откатывается при возврате соединения, чужое соединение закрывается"""
+
+    connection = pool.getconn(FakeConnection)
+    connection.info.transaction_status = TRANSACTION_STATUS_INTRANS
+    pool.putconn(connection)
+    assert connection.rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+    foreign = FakeConnection()
+    pool.putconn(foreign)
+    assert foreign.closed
+    assert pool.stats()['idle'] == 1
+
+
+@postgresql
+@pytest.mark.django_db(transaction=True)
+def test_pool_postgresql():
+    """Тест - движок с пулом на сервере PostgreSQL: закрытое соединение возвращается в пул и выдается повторно"""
+
+    engine = 'dj_api_market.db.postgresql_pool'
+    settings_dict = {**connection.settings_dict, 'ENGINE': engine, 'CONN_MAX_AGE': 0, 'POOL': {'MAX_SIZE': 2}}
+    wrapper = load_backend(engine).DatabaseWrapper(settings_dict, 'pool')
+    try:
+        backend_pids = []
+        for _ in range(2):
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT pg_backend_pid()')
+                backend_pids.append(cursor.fetchone()[0])
+            wrapper.close()
+            assert wrapper.pool.stats()['idle'] == 1
+        assert backend_pids[0] == backend_pids[1]
+
+        # незавершенная транзакция откатывается при возврате в пул
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pool_check (id integer)')
+        wrapper.close()
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pool_check')")
+            assert cursor.fetchone()[0] is None
+        wrapper.close()
+    finally:
+        close_pools(settings_dict['NAME'])
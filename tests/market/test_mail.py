@@ -0,0 +1,162 @@
+import json
+import smtplib
+import time
+
+import pytest
+from django.core import mail as django_mail
+from django.core.mail.backends.locmem import EmailBackend
+
+from market import mail
+from market.tasks import flush_mail_task, send_simple_mail_task
+
+
+class FlakyBackend(EmailBackend):
+    """Почтовый бэкенд, отклоняющий письма на заданные адреса"""
+
+    errors = {}
+    connections = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        FlakyBackend.connections += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.errors.get(message.to[0])
+            if error:
+                raise error
+        return super().send_messages(messages)
+
+
+@pytest.fixture()
+def flaky_backend(settings):
+    settings.EMAIL_BACKEND = 'tests.market.test_mail.FlakyBackend'
+    FlakyBackend.errors = {}
+    FlakyBackend.connections = 0
+    return FlakyBackend
+
+
+def test_queue_mail(mail_queue):
+    """Тест постановки писем в очередь и отправки пачками"""
+
+    mail.queue_mail([(f'user{number}@mail.ru', 'Title', 'Message') for number in range(5)])
+    assert len(mail_queue) == 5
+    assert len(django_mail.outbox) == 0
+
+    assert mail.flush(batch_size=2) == (5, 0)
+    assert len(mail_queue) == 0
+    assert [message.to for message in django_mail.outbox] == [[f'user{number}@mail.ru'] for number in range(5)]
+
+
+def test_flush_shared_connection(mail_queue, flaky_backend):
+    """Тест - пачка писем отправляется через одно соединение"""
+
+    mail.queue_mail([(f'user{number}@mail.ru', 'Title', 'Message') for number in range(3)])
+    flush_mail_task()
+
+    assert len(django_mail.outbox) == 3
+    assert flaky_backend.connections == 1
+
+
+def test_flush_retry(mail_queue, flaky_backend, settings):
+    """Тест повторной отправки писем при временных ошибках"""
+
+    settings.MAIL_MAX_ATTEMPTS = 2
+    flaky_backend.errors = {
+        'busy@mail.ru': smtplib.SMTPResponseException(451, b'Try again later'),
+        'unknown@mail.ru': smtplib.SMTPResponseException(550, b'No such user'),
+    }
+    mail.queue_mail([('ok@mail.ru', 'Title', 'Message'),
+                     ('busy@mail.ru', 'Title', 'Message'),
+                     ('unknown@mail.ru', 'Title', 'Message')])
+
+    assert mail.flush() == (1, 1)
+    # временная ошибка - письмо отложено, постоянная - письмо отброшено
+    assert len(mail_queue) == 1
+    mail_queue.promote(float('inf'))
+    assert [json.loads(item)['to'] for item in mail_queue.pop(10)] == ['busy@mail.ru']
+
+
+def test_flush_retry_not_before_delay(mail_queue, flaky_backend, settings, monkeypatch):
+    """Тест - отложенное письмо не отправляется раньше MAIL_RETRY_DELAY, даже если отправка запущена новым письмом"""
+
+    flaky_backend.errors = {'busy@mail.ru': smtplib.SMTPResponseException(451, b'Try again later')}
+    mail.queue_mail([('busy@mail.ru', 'Title', 'Message')])
+    assert mail.flush() == (0, 1)
+
+    flaky_backend.errors = {}
+    mail.queue_mail([('new@mail.ru', 'Title', 'Message')])
+    assert mail.flush() == (1, 0)
+    assert [message.to for message in django_mail.outbox] == [['new@mail.ru']]
+
+    now = time.time()
+    monkeypatch.setattr(mail.time, 'time', lambda: now + settings.MAIL_RETRY_DELAY + 1)
+    assert mail.flush() == (1, 0)
+    assert django_mail.outbox[-1].to == ['busy@mail.ru']
+    assert len(mail_queue) == 0
+
+
+def test_flush_retry_delay(mail_queue, flaky_backend, settings, monkeypatch):
+    """Тест - повторная отправка планируется через MAIL_RETRY_DELAY, даже если отправка новых писем уже запланирована"""
+
+    scheduled = []
+    monkeypatch.setattr(flush_mail_task, 'apply_async', lambda **kwargs: scheduled.append(kwargs))
+    flaky_backend.errors = {'busy@mail.ru': smtplib.SMTPResponseException(451, b'Try again later')}
+    mail.queue_mail([('busy@mail.ru', 'Title', 'Message')])
+    mail.queue_mail([('new@mail.ru', 'Title', 'Message')])
+    assert scheduled == [{'countdown': settings.MAIL_FLUSH_DELAY}]
+
+    mail.flush(batch_size=1)
+    mail.queue_mail([('later@mail.ru', 'Title', 'Message')])
+    assert scheduled[1:] == [{'countdown': settings.MAIL_RETRY_DELAY}, {'countdown': settings.MAIL_FLUSH_DELAY}]
+
+
+def test_flush_restores_processing(mail_queue):
+    """Тест - письма, взятые из очереди аварийно завершившейся отправкой, отправляются следующей"""
+
+    mail.queue_mail([(f'user{number}@mail.ru', 'Title', 'Message') for number in range(3)])
+    mail_queue.pop(2)
+    assert len(mail_queue) == 1
+
+    assert mail.flush() == (3, 0)
+    assert [message.to for message in django_mail.outbox] == [[f'user{number}@mail.ru'] for number in range(3)]
+    assert mail.flush() == (0, 0)
+
+
+def test_flush_locked(mail_queue, monkeypatch):
+    """Тест - пока очередь отправляет другой процесс, отправка откладывается"""
+
+    scheduled = []
+    monkeypatch.setattr(flush_mail_task, 'apply_async', lambda **kwargs: scheduled.append(kwargs))
+    mail.queue_mail([('user@mail.ru', 'Title', 'Message')])
+    mail_queue.lock(60)
+
+    assert mail.flush() == (0, 0)
+    assert len(scheduled) == 2
+    assert len(mail_queue) == 1
+
+    mail_queue.unlock()
+    assert mail.flush() == (1, 0)
+
+
+def test_flush_retry_limit(mail_queue, flaky_backend, settings):
+    """Тест - письмо отбрасывается после MAIL_MAX_ATTEMPTS попыток"""
+
+    settings.MAIL_MAX_ATTEMPTS = 2
+    settings.MAIL_RETRY_DELAY = 0
+    flaky_backend.errors = {'busy@mail.ru': smtplib.SMTPServerDisconnected()}
+    mail.queue_mail([('busy@mail.ru', 'Title', 'Message')])
+
+    assert mail.flush() == (0, 1)
+    assert mail.flush() == (0, 0)
+    assert len(mail_queue) == 0
+
+
+@pytest.mark.django_db
+def test_simple_mail_without_lookup(django_assert_num_queries):
+    """Тест - письмо по известному адресу ставится в очередь без запроса пользователя"""
+
+    with django_assert_num_queries(0):
+        send_simple_mail_task(user_id=1, email='user@mail.ru', title='Title', message='Message')
+    flush_mail_task()
+    assert django_mail.outbox[0].to == ['user@mail.ru']
@@ -0,0 +1,201 @@
+import time
+
+import pytest
+
+from market import metrics
+from market.middleware import QueryBudgetExceeded
+from market.models import Order, OrderItem
+from market.task_metrics import broker_queue_depths, task_failed, task_published
+from market.tasks import send_simple_mail_task
+
+
+@pytest.mark.django_db
+def test_query_metrics(buyer_client, create_orders):
+    """Тест сбора статистики запросов к БД по обработчикам"""
+
+    buyer_client.get('/api/order')
+    buyer_client.get('/api/order')
+
+    stats = metrics.collect('queries')['order:GET']
+    assert stats['requests'] == 2
+    assert stats['queries'] > 0
+    assert stats['db_time'] > 0
+    assert stats['over_budget'] == 0
+
+
+@pytest.mark.django_db
+def test_query_budget_independent_of_data(buyer_client, create_orders, create_product_info):
+    """Тест - число запросов истории заказов не зависит от числа заказов"""
+
+    for quantity in range(1, 11):
+        order = Order.objects.create(user=create_orders[1].user, state='new')
+        OrderItem.objects.create(order=order, product_info=create_product_info, quantity=quantity)
+
+    # при превышении бюджета тест завершится ошибкой QueryBudgetExceeded
+    response = buyer_client.get('/api/order', {'page_size': 100})
+    assert response.json()['count'] == 13
+
+
+@pytest.mark.django_db
+def test_query_budget_exceeded(buyer_client, create_orders, settings, caplog):
+    """Тест превышения бюджета запросов к БД"""
+
+    settings.QUERY_BUDGETS = {'order': 1}
+
+    with pytest.raises(QueryBudgetExceeded):
+        buyer_client.get('/api/order')
+
+    settings.QUERY_BUDGET_MODE = 'log'
+    response = buyer_client.get('/api/order')
+    assert response.status_code == 200
+    assert 'order:GET' in caplog.text
+    assert metrics.collect('queries')['order:GET']['over_budget'] == 2
+
+
+@pytest.mark.django_db
+def test_query_stats(client_auth, create_active_user):
+    """Тест просмотра статистики запросов к БД сотрудником площадки"""
+
+    response = client_auth.get('/api/metrics/queries')
+    assert response.status_code == 403
+
+    create_active_user.is_staff = True
+    create_active_user.save()
+    client_auth.get('/api/user/details')
+
+    response = client_auth.get('/api/metrics/queries')
+    assert response.status_code == 200
+    endpoints = {item['endpoint']: item for item in response.json()}
+    assert endpoints['user-details:GET']['requests'] == 1
+    assert endpoints['user-details:GET']['avg_queries'] > 0
+
+
+@pytest.mark.django_db
+def test_task_metrics(create_user):
+    """Тест сбора статистики выполнения задач Celery"""
+
+    headers = {}
+    task_published(sender=send_simple_mail_task.name, headers=headers)
+    assert headers['published_at'] <= time.time()
+
+    send_simple_mail_task.apply(kwargs=dict(user_id=create_user.id, title='Title', message='Message'),
+                                headers={'published_at': time.time() - 2})
+    task_failed(sender=send_simple_mail_task)
+
+    stats = metrics.collect('tasks')[send_simple_mail_task.name]
+    assert stats['published'] == 1
+    assert stats['started'] == 1
+    assert stats['succeeded'] == 1
+    assert stats['failed'] == 1
+    assert stats['wait_time'] >= 2
+    assert stats['run_time'] > 0
+
+
+class FakeRedis:
+    """Списки Redis для подсчета длины очередей"""
+
+    def __init__(self, lengths):
+        self.lengths = lengths
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def llen(self, key):
+        self.commands.append(key)
+
+    def execute(self):
+        return [self.lengths.get(key, 0) for key in self.commands]
+
+
+def test_broker_queue_depths():
+    """Тест подсчета длины очередей с учетом приоритетов"""
+
+    depths = broker_queue_depths(FakeRedis({'mail': 2, 'mail:5': 3, 'maintenance': 1}))
+
+    assert depths['mail'] == 5
+    assert depths['maintenance'] == 1
+    assert depths['default'] == 0
+
+
+@pytest.mark.django_db
+def test_task_stats(client_auth, create_active_user):
+    """Тест просмотра статистики задач сотрудником площадки"""
+
+    create_active_user.is_staff = True
+    create_active_user.save()
+    metrics.incr('tasks', 'market.tasks.flush_mail_task', started=2, succeeded=2, run_time=0.5)
+    metrics.set('queues', 'mail', depth=7, sampled_at=time.time())
+
+    response = client_auth.get('/api/metrics/tasks')
+    data = response.json()
+    assert response.status_code == 200
+    assert data['tasks'][0]['avg_run_ms'] == 250
+    assert data['queues']['mail']['depth'] == 7
+
+
+@pytest.mark.django_db
+def test_request_metrics(client, create_product_info):
+    """Тест сбора метрик HTTP запросов и вывода в формате Prometheus"""
+
+    client.get('/api/market/')
+    client.get('/api/market/')
+    client.get('/api/market/0/')
+
+    stats = metrics.collect('http')['productinfo-list:GET:200']
+    assert stats['requests'] == 2
+    assert stats['response_bytes'] > 0
+    assert stats['le_10'] == 2
+    assert metrics.collect('http')['productinfo-detail:GET:404']['requests'] == 1
+
+    response = client.get('/metrics')
+    assert response['Content-Type'].startswith('text/plain')
+    text = response.content.decode()
+    assert 'http_requests_total{view="productinfo-list",method="GET",status="200"} 2' in text
+    assert 'http_request_duration_seconds_bucket{view="productinfo-list",method="GET",status="200",le="+Inf"} 2' \
+           in text
+    assert 'db_queries_total{view="productinfo-list",method="GET"}' in text
+    assert text.count('# TYPE http_requests_total counter') == 1
+
+
+@pytest.mark.django_db
+def test_request_metrics_single_write(client, create_product_info, monkeypatch):
+    """Тест - метрики запроса, включая счетчики запросов к БД, записываются за одно обращение к хранилищу"""
+
+    calls = []
+    monkeypatch.setattr(metrics, 'incr', lambda *args, **kwargs: calls.append(('incr', args)))
+    monkeypatch.setattr(metrics, 'incr_many', lambda items: calls.append(('incr_many', items)))
+
+    client.get('/api/market/')
+
+    assert len(calls) == 1
+    method, items = calls[0]
+    assert method == 'incr_many'
+    assert {name for name, _, _ in items} >= {'http', 'queries'}
+
+
+@pytest.mark.django_db
+def test_cache_metrics(client_auth, settings):
+    """Тест учета попаданий и промахов кэшей"""
+
+    settings.CACHES = {'default': {'BACKEND': 'market.cache.LocMemCache'}}
+    client_auth.get('/api/user/details')
+    client_auth.get('/api/user/details')
+
+    stats = metrics.collect('cache')
+    assert stats['auth-local'] == {'hits': 1, 'misses': 1}
+    assert stats['default'] == {'hits': 0, 'misses': 1}
+
+
+def test_metrics_scrape_token(client, settings):
+    """Тест - при заданном METRICS_SCRAPE_TOKEN метрики доступны только с токеном"""
+
+    settings.METRICS_SCRAPE_TOKEN = 'secret'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code == 200
@@ -0,0 +1,167 @@
+from datetime import datetime, timezone
+
+import pytest
+from django.db import IntegrityError, transaction
+
+from market.models import Contact, Order, OutboxMessage
+from market.partitions import month_start
+from market.tasks import flush_mail_task, send_orders_state_mail_task, send_simple_mail_task
+
+
+@pytest.mark.django_db
+def test_order_history(buyer_client, create_orders):
+    """Тест получения истории заказов покупателя"""
+
+    response = buyer_client.get('/api/order')
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data['count'] == 3
+    assert 'basket' not in [order['state'] for order in data['results']]
+    assert data['results'][0]['ordered_items']
+    assert data['results'][0]['total_sum'] == 220000
+
+
+@pytest.mark.django_db
+def test_order_history_pagination(buyer_client, create_orders):
+    """Тест постраничного вывода истории заказов"""
+
+    response = buyer_client.get('/api/order', {'page_size': 2})
+    data = response.json()
+    assert len(data['results']) == 2
+    assert data['next']
+
+    response = buyer_client.get('/api/order', {'page_size': 2, 'page': 2})
+    assert len(response.json()['results']) == 1
+
+
+@pytest.mark.django_db
+def test_order_history_filter(buyer_client, create_orders):
+    """Тест фильтрации истории заказов по статусу и дате"""
+
+    response = buyer_client.get('/api/order', {'state': 'delivered'})
+    data = response.json()
+    assert data['count'] == 1
+    assert data['results'][0]['state'] == 'delivered'
+
+    response = buyer_client.get('/api/order', {'dt__gte': '2000-01-01T00:00:00Z'})
+    assert response.json()['count'] == 3
+
+    response = buyer_client.get('/api/order', {'state': 'unknown'})
+    assert response.json()['Status'] is False
+
+
+@pytest.mark.django_db
+def test_order_history_summary(buyer_client, create_orders):
+    """Тест краткого режима истории заказов"""
+
+    response = buyer_client.get('/api/order', {'summary': 'true'})
+    data = response.json()
+    order = data['results'][0]
+    assert 'ordered_items' not in order
+    assert order['items_count'] == 1
+    assert order['total_sum'] == 220000
+
+
+@pytest.mark.django_db
+def test_empty_order_sum(buyer_client, create_orders):
+    """Тест - сумма пустого оформленного заказа и пустой корзины одинакова во всех режимах"""
+
+    user = create_orders[1].user
+    order = Order.objects.create(user=user, state='new')
+    Order.objects.filter(user=user, state='basket').delete()
+    basket = Order.objects.create(user=user, state='basket')
+
+    for empty in (order, basket):
+        assert empty.sum() is None
+        assert Order.objects.prefetch_related('ordered_items').get(id=empty.id).sum() is None
+
+    results = buyer_client.get('/api/order').json()['results']
+    assert [item['total_sum'] for item in results if item['id'] == order.id] == [None]
+    results = buyer_client.get('/api/order', {'summary': 'true'}).json()['results']
+    assert [item['total_sum'] for item in results if item['id'] == order.id] == [None]
+
+
+@pytest.mark.django_db
+def test_orders_state_mail(create_orders, mailoutbox):
+    """Тест пакетной отправки писем об изменении статуса заказов"""
+
+    send_orders_state_mail_task(order_ids=[order.id for order in create_orders[1:]], state='confirmed')
+    assert len(mailoutbox) == 0
+
+    assert flush_mail_task() == {'sent': 3, 'retried': 0}
+    assert len(mailoutbox) == 3
+    assert mailoutbox[0].to == [create_orders[0].user.email]
+
+
+@pytest.mark.django_db
+def test_order_checkout(buyer_client, create_orders):
+    """Тест оформления заказа из корзины"""
+
+    basket = create_orders[0]
+    contact = Contact.objects.create(user=basket.user, city='NewCity', street='WestStreet',
+                                     phone='+79998883344', house='50')
+
+    response = buyer_client.post('/api/order', data=dict(contact=contact.id))
+
+    assert response.json()['Status']
+    basket.refresh_from_db()
+    assert basket.state == 'new'
+    # дата позиций заказа совпадает с датой оформления заказа
+    assert set(basket.ordered_items.values_list('order_dt', flat=True)) == {basket.dt}
+    # цена товара зафиксирована в позиции заказа
+    assert basket.ordered_items.get().price == 110000
+    # письмо о заказе записано в outbox в транзакции оформления заказа
+    assert OutboxMessage.objects.get().task == send_simple_mail_task.name
+
+
+@pytest.mark.django_db
+def test_one_basket_per_user(buyer_client, create_buyer, create_product_info):
+    """Тест - у пользователя одна корзина, вторую корзину отклоняет ограничение БД"""
+
+    response = buyer_client.post('/api/basket', {'ordered_items': [
+        {'product_info': create_product_info.id, 'quantity': 1}]}, format='json')
+    assert response.json()['Status']
+    basket = Order.objects.get(user=create_buyer, state='basket')
+
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Order.objects.create(user=create_buyer, state='basket')
+    # на оформленные заказы ограничение не распространяется
+    Order.objects.create(user=create_buyer, state='new')
+    Order.objects.create(user=create_buyer, state='new')
+
+    item = basket.ordered_items.get()
+    response = buyer_client.put('/api/basket', {'ordered_items': [{'id': item.id, 'quantity': 3}]}, format='json')
+    assert response.json()['Обновлено объектов'] == 1
+    item.refresh_from_db()
+    assert item.quantity == 3
+
+
+def test_month_start():
+    """Тест вычисления границ помесячных секций заказов"""
+
+    value = datetime(2023, 12, 15, 10, 30, tzinfo=timezone.utc)
+
+    assert month_start(value) == datetime(2023, 12, 1, tzinfo=timezone.utc)
+    assert month_start(value, shift=1) == datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert month_start(value, shift=-12) == datetime(2022, 12, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.django_db
+def test_order_history_after_price_update(buyer_client, create_orders, create_product_info):
+    """Тест - история заказов не меняется при обновлении прайса поставщиком"""
+
+    create_product_info.price = 1
+    create_product_info.save()
+    response = buyer_client.get('/api/order', {'state': 'new'})
+    order = response.json()['results'][0]
+    assert order['total_sum'] == 220000
+    assert order['ordered_items'][0]['product_name'] == create_product_info.product.name
+
+    # товар удален из каталога при загрузке нового прайса
+    create_product_info.delete()
+    response = buyer_client.get('/api/order', {'state': 'new'})
+    order = response.json()['results'][0]
+    assert order['total_sum'] == 220000
+    assert order['ordered_items'][0]['price'] == 110000
+    assert order['ordered_items'][0]['product_info'] is None
@@ -0,0 +1,126 @@
+import pytest
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from market import outbox
+from market.models import OutboxMessage, User
+from market.tasks import send_simple_mail_task, send_token_to_email_task
+
+
+@pytest.fixture()
+def sent_tasks(monkeypatch):
+    """Фикстура - задачи, переданные в брокер"""
+
+    sent = []
+    for task in (send_simple_mail_task, send_token_to_email_task):
+        monkeypatch.setattr(task, 'apply_async', lambda kwargs, name=task.name: sent.append((name, kwargs)))
+    return sent
+
+
+@pytest.mark.django_db
+def test_outbox_relay(sent_tasks):
+    """Тест передачи задач из outbox в брокер пачками"""
+
+    for number in range(5):
+        outbox.enqueue(send_simple_mail_task, user_id=number, title='Title', message='Message')
+
+    assert outbox.relay(batch_size=2) == 5
+    assert [kwargs['user_id'] for _, kwargs in sent_tasks] == list(range(5))
+    assert not OutboxMessage.objects.exists()
+
+
+@pytest.mark.django_db
+def test_outbox_rollback(sent_tasks):
+    """Тест - задача не отправляется, если транзакция отменена"""
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            outbox.enqueue(send_simple_mail_task, user_id=1, title='Title', message='Message')
+            raise RuntimeError
+
+    assert outbox.relay() == 0
+    assert sent_tasks == []
+
+
+@pytest.mark.django_db
+def test_outbox_broker_unavailable(monkeypatch, sent_tasks):
+    """Тест - при недоступном брокере сообщения остаются в outbox и отправляются с растущей паузой"""
+
+    def unavailable(**kwargs):
+        raise ConnectionError('broker is down')
+
+    monkeypatch.setattr(send_simple_mail_task, 'apply_async', unavailable)
+    outbox.enqueue(send_simple_mail_task, user_id=1, title='Title', message='Message')
+    outbox.enqueue(send_token_to_email_task, user_id=2)
+    outbox.enqueue(send_simple_mail_task, user_id=3, title='Title', message='Message')
+
+    # неотправленные сообщения не задерживают остальные
+    assert outbox.relay() == 1
+    assert sent_tasks == [(send_token_to_email_task.name, {'user_id': 2})]
+    first = OutboxMessage.objects.first()
+    assert first.attempts == 1 and 'broker is down' in first.last_error
+    assert first.next_attempt_at > timezone.now()
+
+    # до наступления времени повтора сообщения не выбираются
+    assert outbox.relay() == 0
+    assert OutboxMessage.objects.first().attempts == 1
+
+    # сколько бы попыток ни было, сообщения не отбрасываются, пауза растет
+    delays = []
+    for _ in range(30):
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        outbox.relay()
+        message = OutboxMessage.objects.first()
+        delays.append((message.next_attempt_at - timezone.now()).total_seconds())
+    assert OutboxMessage.objects.count() == 2
+    assert OutboxMessage.objects.first().attempts == 31
+    assert delays[0] < delays[3] and max(delays) <= settings.OUTBOX_RETRY_MAX_DELAY
+
+    monkeypatch.undo()
+    sent_tasks = []
+    monkeypatch.setattr(send_simple_mail_task, 'apply_async', lambda kwargs: sent_tasks.append(kwargs))
+    OutboxMessage.objects.update(next_attempt_at=timezone.now())
+    assert outbox.relay() == 2
+    assert [kwargs['user_id'] for kwargs in sent_tasks] == [1, 3]
+    assert not OutboxMessage.objects.exists()
+
+
+@pytest.mark.django_db
+def test_outbox_dead_letter(sent_tasks, client):
+    """Тест - сообщение с неизвестной задачей помечается dead и не удаляется, остальные отправляются"""
+
+    OutboxMessage.objects.create(task='market.tasks.removed_task', kwargs={'user_id': 1})
+    outbox.enqueue(send_token_to_email_task, user_id=2)
+
+    assert outbox.relay() == 1
+    message = OutboxMessage.objects.get()
+    assert message.dead and 'removed_task' in message.last_error
+    OutboxMessage.objects.update(next_attempt_at=timezone.now())
+    assert outbox.relay() == 0
+    assert OutboxMessage.objects.get().attempts == 1
+
+    # после исправления сообщение возвращается в очередь из админки
+    client.force_login(User.objects.create_superuser(email='staff@mail.ru', password='qwer1234A', is_active=True))
+    response = client.post('/admin/market/outboxmessage/', {
+        'action': 'retry', 'index': 0, '_selected_action': [message.id]}, format='multipart')
+    assert response.status_code == 302
+    message.refresh_from_db()
+    assert not message.dead and message.attempts == 0
+
+
+@pytest.mark.django_db
+def test_register_outbox(client, sent_tasks):
+    """Тест - задача отправки письма при регистрации записывается в outbox"""
+
+    response = client.post('/api/user/register', data=dict(first_name='First',
+                                                           last_name='Second',
+                                                           email='Outbox@mail.ru',
+                                                           password='qwer1234A',
+                                                           company='CompanyOne',
+                                                           position='worker'))
+    assert response.json()['Status']
+    assert sent_tasks == []
+
+    assert outbox.relay() == 1
+    assert sent_tasks[0][0] == send_token_to_email_task.name
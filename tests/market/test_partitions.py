@@ -0,0 +1,135 @@
+import importlib
+from datetime import datetime, timezone
+
+import psycopg2
+import pytest
+from django.db import OperationalError, connection
+from django.db.migrations.loader import MigrationLoader
+
+from market.models import Order, OrderItem
+from market import partitions as partitioning
+from market.partitions import ORDER_HISTORY_TABLE, ORDER_ITEM_TABLE, create_partitions, detach_partitions, \
+    is_partitioned, month_start, partition_name, _detach_partition, _partitions
+
+postgresql = pytest.mark.skipif(connection.vendor != 'postgresql', reason='Секционирование есть только в PostgreSQL')
+
+migration = importlib.import_module('market.migrations.0004_order_partitions')
+
+
+def partitions(table):
+    with connection.cursor() as cursor:
+        return {name for name, _ in _partitions(cursor, table)}
+
+
+@postgresql
+@pytest.mark.django_db
+def test_migrate_existing_orders(create_buyer, create_product_info):
+    """Тест - миграция 0004 секционирует таблицы с существующими заказами и позициями заказов"""
+
+    apps = MigrationLoader(connection).project_state(('market', '0004_order_partitions')).apps
+    HistoricalOrder = apps.get_model('market', 'Order')
+    HistoricalOrderItem = apps.get_model('market', 'OrderItem')
+    with connection.cursor() as cursor:
+        # таблицы до секционирования создаются в отдельной схеме, ссылки на остальные таблицы - в public
+        cursor.execute('CREATE SCHEMA partitioning_test')
+        cursor.execute('SET LOCAL search_path TO partitioning_test, public')
+    with connection.schema_editor() as schema_editor:
+        schema_editor.create_model(HistoricalOrder)
+        schema_editor.create_model(HistoricalOrderItem)
+
+    dates = [datetime(2022, 11, 5, tzinfo=timezone.utc), datetime(2023, 1, 20, tzinfo=timezone.utc)]
+    orders = []
+    for state, dt in [('basket', dates[1]), ('new', dates[0]), ('delivered', dates[1])]:
+        order = HistoricalOrder.objects.create(user_id=create_buyer.id, state=state)
+        # dt заполняется автоматически (auto_now_add), дата в прошлом задается отдельно
+        HistoricalOrder.objects.filter(id=order.id).update(dt=dt)
+        HistoricalOrderItem.objects.create(order_id=order.id, order_dt=dt, quantity=1,
+                                           product_info_id=create_product_info.id, shop_id=create_product_info.shop_id)
+        orders.append(order)
+
+    migration.partition_tables(connection)
+
+    with connection.cursor() as cursor:
+        assert is_partitioned(cursor, 'market_order') and is_partitioned(cursor, 'market_orderitem')
+        cursor.execute('SELECT state FROM market_order_basket')
+        assert cursor.fetchall() == [('basket',)]
+        cursor.execute('SELECT count(*) FROM market_order_legacy')
+        assert cursor.fetchone()[0] == 2
+        cursor.execute('SELECT count(*) FROM market_orderitem')
+        assert cursor.fetchone()[0] == 3
+        # новые заказы получают следующие id, заказы следующего месяца попадают в его секцию
+        cutover = month_start(datetime.now(timezone.utc), shift=1)
+        cursor.execute("INSERT INTO market_order (user_id, dt, state) VALUES (%s, %s, 'new') RETURNING id",
+                       [create_buyer.id, cutover])
+        order_id = cursor.fetchone()[0]
+        assert order_id == orders[-1].id + 1
+        cursor.execute('SELECT tableoid::regclass::text FROM market_order WHERE id = %s', [order_id])
+        assert cursor.fetchone()[0] == partition_name(ORDER_HISTORY_TABLE, cutover)
+
+
+@postgresql
+@pytest.mark.django_db
+def test_create_partitions_moves_default_rows(create_buyer):
+    """Тест - заказы, попавшие в секцию по умолчанию, переносятся в созданную для их месяца секцию"""
+
+    month = month_start(datetime.now(timezone.utc), shift=24)
+    order = Order.objects.create(user=create_buyer, state='new')
+    Order.objects.filter(id=order.id).update(dt=month)
+    OrderItem.objects.create(order=order, order_dt=month, quantity=1)
+
+    created = create_partitions(connection, months=0, start=month)
+    assert created == [partition_name(ORDER_HISTORY_TABLE, month), partition_name(ORDER_ITEM_TABLE, month)]
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT tableoid::regclass::text FROM market_order WHERE id = %s', [order.id])
+        assert cursor.fetchone()[0] == created[0]
+        cursor.execute(f'SELECT count(*) FROM {ORDER_ITEM_TABLE}_default')
+        assert cursor.fetchone()[0] == 0
+    assert Order.objects.get(id=order.id).ordered_items.count() == 1
+
+
+@postgresql
+@pytest.mark.django_db
+def test_detach_partitions_keeps_legacy():
+    """Тест - отключаются только помесячные секции, секции *_legacy остаются подключенными"""
+
+    # секции *_legacy покрывают период до начала следующего месяца, дальше - помесячные секции
+    month = month_start(datetime.now(timezone.utc), shift=1)
+    detached = detach_partitions(connection, month_start(month, 1))
+    assert detached == [partition_name(ORDER_HISTORY_TABLE, month), partition_name(ORDER_ITEM_TABLE, month)]
+    assert not [name for name in detached if name.endswith('_legacy')]
+    assert 'market_order_legacy' in partitions(ORDER_HISTORY_TABLE)
+    assert 'market_orderitem_legacy' in partitions(ORDER_ITEM_TABLE)
+    assert partition_name(ORDER_HISTORY_TABLE, month) not in partitions(ORDER_HISTORY_TABLE)
+
+
+class LockedCursor:
+    """Курсор, на котором DETACH PARTITION не дожидается блокировки первые locked раз"""
+
+    def __init__(self, locked):
+        self.locked = locked
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if 'DETACH' in sql and self.locked:
+            self.locked -= 1
+            try:
+                raise psycopg2.errors.LockNotAvailable('canceling statement due to lock timeout')
+            except psycopg2.Error as error:
+                raise OperationalError(*error.args) from error
+
+
+@pytest.mark.django_db
+def test_detach_partition_lock_timeout(monkeypatch):
+    """Тест - отключение секции ждет блокировку не дольше lock_timeout и повторяется, попытки ограничены"""
+
+    monkeypatch.setattr(partitioning, 'DETACH_RETRY_DELAY', 0)
+    cursor = LockedCursor(locked=2)
+    _detach_partition(connection, cursor, ORDER_ITEM_TABLE, 'market_orderitem_y2022m01')
+    assert len([sql for sql in cursor.statements if 'DETACH' in sql]) == 3
+    assert all('lock_timeout' in cursor.statements[i] for i in range(0, 6, 2))
+
+    cursor = LockedCursor(locked=partitioning.DETACH_ATTEMPTS)
+    with pytest.raises(OperationalError):
+        _detach_partition(connection, cursor, ORDER_ITEM_TABLE, 'market_orderitem_y2022m01')
+    assert len([sql for sql in cursor.statements if 'DETACH' in sql]) == partitioning.DETACH_ATTEMPTS
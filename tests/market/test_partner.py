@@ -0,0 +1,109 @@
+import pytest
+
+from market.models import OrderItem
+
+
+@pytest.mark.django_db
+def test_order_item_shop(create_orders, create_product_info):
+    """Тест заполнения магазина у позиции заказа"""
+
+    assert OrderItem.objects.filter(shop=create_product_info.shop).count() == len(create_orders)
+
+
+@pytest.mark.django_db
+def test_shop_delete_keeps_order_items(create_orders, create_product_info):
+    """Тест - удаление магазина не удаляет позиции оформленных заказов, данные на момент оформления сохраняются"""
+
+    new = create_orders[1]
+    create_product_info.shop.delete()
+
+    item = OrderItem.objects.get(order=new)
+    assert item.shop is None
+    assert item.product_info is None
+    assert item.shop_name and item.price == create_product_info.price
+    assert new.sum() == 220000
+
+
+@pytest.mark.django_db
+def test_partner_orders(client_auth, create_orders):
+    """Тест получения заказов поставщиком"""
+
+    response = client_auth.get('/api/partner/orders/')
+
+    assert response.status_code == 200
+    data = response.json()
+    # корзина покупателя в заказы поставщика не попадает
+    assert data['count'] == 3
+    assert 'basket' not in [order['state'] for order in data['results']]
+
+
+@pytest.mark.django_db
+def test_partner_orders_filter(client_auth, create_orders):
+    """Тест фильтрации заказов поставщика по статусу и дате"""
+
+    response = client_auth.get('/api/partner/orders/', {'state': 'confirmed'})
+    data = response.json()
+    assert response.status_code == 200
+    assert data['count'] == 1
+    assert data['results'][0]['state'] == 'confirmed'
+
+    response = client_auth.get('/api/partner/orders/', {'state__in': 'new,delivered'})
+    assert response.json()['count'] == 2
+
+    response = client_auth.get('/api/partner/orders/', {'dt__lte': '2000-01-01T00:00:00Z'})
+    assert response.json()['count'] == 0
+
+
+@pytest.mark.django_db
+def test_partner_orders_other_shop(client_auth, create_orders, create_buyer):
+    """Тест - поставщик не видит заказы без своих товаров"""
+
+    OrderItem.objects.update(shop=None)
+
+    response = client_auth.get('/api/partner/orders/')
+    assert response.json()['count'] == 0
+
+
+@pytest.mark.django_db
+def test_partner_orders_state(client_auth, create_orders):
+    """Тест массового изменения статуса заказов поставщиком"""
+
+    basket, new, confirmed, delivered = create_orders
+
+    response = client_auth.post('/api/partner/orders/state', data=dict(orders=[basket.id, new.id, delivered.id],
+                                                                       state='confirmed',
+                                                                       test='test'))
+    data = response.json()
+    assert response.status_code == 200
+    assert data['Status']
+    assert data['Обновлено объектов'] == 1
+    # корзину и доставленный заказ подтвердить нельзя
+    assert set(data['Errors']) == {str(basket.id), str(delivered.id)}
+
+    new.refresh_from_db()
+    basket.refresh_from_db()
+    assert new.state == 'confirmed'
+    assert basket.state == 'basket'
+
+
+@pytest.mark.django_db
+def test_partner_orders_state_bad_ids(client_auth, create_orders):
+    """Тест - нечисловые id заказов возвращаются в Errors, как и ненайденные"""
+
+    new = create_orders[1]
+    response = client_auth.post('/api/partner/orders/state', data=dict(orders=f'{new.id}, abc,0',
+                                                                       state='confirmed',
+                                                                       test='test'))
+    data = response.json()
+    assert data['Обновлено объектов'] == 1
+    assert set(data['Errors']) == {'abc', '0'}
+
+
+@pytest.mark.django_db
+def test_partner_orders_state_invalid(client_auth, create_orders):
+    """Тест изменения статуса заказов на недопустимый"""
+
+    response = client_auth.post('/api/partner/orders/state', data=dict(orders=f'{create_orders[1].id}',
+                                                                       state='basket',
+                                                                       test='test'))
+    assert response.json()['Status'] is False
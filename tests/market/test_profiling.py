@@ -0,0 +1,90 @@
+import json
+import pstats
+
+import pytest
+from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
+
+from market.models import RequestProfile, User
+
+
+@pytest.fixture()
+def profiling(settings):
+    """Фикстура - профилирование запросов включено"""
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_SAMPLE_RATE = 0
+
+
+@pytest.fixture()
+def staff_user():
+    """Фикстура создания сотрудника площадки"""
+    return User.objects.create_superuser(email='staff@mail.ru', password='qwer1234A', is_active=True)
+
+
+@pytest.fixture()
+def staff_client(staff_user):
+    """Фикстура создания клиента с заголовками для авторизации сотрудника"""
+    token, _ = Token.objects.get_or_create(user_id=staff_user.id)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    return client
+
+
+@pytest.mark.django_db
+def test_profile_request(profiling, staff_client, staff_user, client, create_orders, tmp_path):
+    """Тест - запрос сотрудника с заголовком X-Profile профилируется, профиль скачивается из админки"""
+
+    response = staff_client.get('/api/order', HTTP_X_PROFILE='1')
+    assert response.status_code == 200
+
+    record = RequestProfile.objects.get(id=response['X-Profile-Id'])
+    assert record.user == staff_user
+    assert record.view_name == 'order'
+    assert record.queries == len(record.sql) > 0
+    assert all(query['duration'] >= 0 and query['sql'] for query in record.sql)
+
+    client.force_login(staff_user)
+    assert str(record.id) in client.get('/admin/market/requestprofile/').content.decode()
+
+    download = client.get(f'/admin/market/requestprofile/{record.id}/download/pstats/')
+    assert download['Content-Disposition'] == f'attachment; filename="profile-{record.id}.prof"'
+    (tmp_path / 'profile.prof').write_bytes(download.content)
+    stats = pstats.Stats(str(tmp_path / 'profile.prof'))
+    assert any(name == 'get' and file.endswith('shop_views.py') for file, _, name in stats.stats)
+
+    data = json.loads(client.get(f'/admin/market/requestprofile/{record.id}/download/speedscope/').content)
+    python_profile, sql_profile = data['profiles']
+    assert any(frame['name'] == 'get' and frame['file'].endswith('shop_views.py')
+               for frame in data['shared']['frames'])
+    # каждый открытый кадр закрывается, вложенные кадры закрываются раньше внешних
+    stack = []
+    for event in python_profile['events']:
+        if event['type'] == 'O':
+            stack.append(event['frame'])
+        else:
+            assert stack.pop() == event['frame']
+    assert not stack and python_profile['events']
+    assert len(sql_profile['events']) == 2 * len(record.sql)
+
+
+@pytest.mark.django_db
+def test_profile_only_staff(profiling, settings, client_auth, staff_client):
+    """Тест - профилируются только запросы сотрудников, при выключенном профилировании - никакие"""
+
+    assert 'X-Profile-Id' not in client_auth.get('/api/user/details', HTTP_X_PROFILE='1')
+    assert 'X-Profile-Id' not in staff_client.get('/api/user/details')
+
+    settings.PROFILING_ENABLED = False
+    assert 'X-Profile-Id' not in staff_client.get('/api/user/details', HTTP_X_PROFILE='1')
+    assert not RequestProfile.objects.exists()
+
+
+@pytest.mark.django_db
+def test_profile_sampling(profiling, settings, staff_client):
+    """Тест - при PROFILING_SAMPLE_RATE профилируются запросы сотрудников без заголовка"""
+
+    settings.PROFILING_SAMPLE_RATE = 1
+    settings.PROFILING_KEEP = 2
+    for _ in range(3):
+        assert 'X-Profile-Id' in staff_client.get('/api/user/details')
+    assert RequestProfile.objects.count() == 2
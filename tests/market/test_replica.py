@@ -0,0 +1,57 @@
+import pytest
+from django.db import transaction
+
+from dj_api_market.db.routers import ReplicaRouter, RoutingState, current_routing
+from market.models import OrderItem, ProductInfo
+
+# реплика - отдельная пустая база данных: чтение с нее не видит данных основной базы
+pytestmark = pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+
+
+def test_replica_reads(client, create_product_info, replica):
+    """Тест - каталог читается с реплики, запись идет в основную базу данных"""
+
+    assert client.get('/api/market/').json()['count'] == 0
+    assert client.get('/api/async/market').json()['count'] == 0
+    assert ProductInfo.objects.using(replica).count() == 0
+
+    create_product_info.quantity = 10
+    create_product_info.save()
+    assert ProductInfo.objects.get().quantity == 10
+
+
+def test_replica_not_configured(client, create_product_info):
+    """Тест - без реплик каталог читается из основной базы данных"""
+
+    assert client.get('/api/market/').json()['count'] == 1
+
+
+def test_read_your_writes(buyer_client, client_auth, create_orders, replica):
+    """Тест - после записи клиент читает из основной базы данных, другие клиенты - с реплики"""
+
+    assert buyer_client.get('/api/order').json()['count'] == 0
+
+    item = OrderItem.objects.get(order=create_orders[0])
+    response = buyer_client.delete('/api/basket', {'items': str(item.id)})
+    assert response.json()['Status'] is True
+
+    assert buyer_client.get('/api/order').json()['count'] == 3
+    assert buyer_client.get('/api/async/order').json()['count'] == 3
+    assert client_auth.get('/api/partner/orders/').json()['count'] == 0
+
+
+def test_router_transaction(replica):
+    """Тест - чтение внутри транзакции идет в основную базу данных"""
+
+    router = ReplicaRouter()
+    state = RoutingState()
+    state.replica = True
+    token = current_routing.set(state)
+    try:
+        assert router.db_for_read(ProductInfo) == replica
+        with transaction.atomic():
+            assert router.db_for_read(ProductInfo) == 'default'
+        assert router.db_for_write(ProductInfo) == 'default'
+        assert state.wrote
+    finally:
+        current_routing.reset(token)
@@ -0,0 +1,37 @@
+import pytest
+from django.core.management import call_command
+
+from dj_api_market import openapi
+
+
+@pytest.fixture()
+def schema_dir(settings, tmp_path):
+    """Фикстура каталога файлов схемы OpenAPI"""
+    settings.OPENAPI_SCHEMA_DIR = str(tmp_path)
+    return tmp_path
+
+
+def test_generate_schema(schema_dir, monkeypatch):
+    """Тест - схема генерируется повторно, только если изменился код"""
+
+    call_command('generate_openapi')
+    assert {path.name for path in schema_dir.iterdir()} == {'swagger.json', 'swagger.yaml', 'manifest.json'}
+    assert openapi.generate() is False
+
+    monkeypatch.setattr(openapi, 'source_fingerprint', lambda: 'changed')
+    assert openapi.generate() is True
+
+
+def test_schema_etag(client, schema_dir, monkeypatch):
+    """Тест - схема отдается из файла с ETag, при совпадении If-None-Match - ответ 304"""
+
+    response = client.get('/swagger.json')
+    assert response.status_code == 200
+    assert '/basket' in response.json()['paths']
+    etag = response['ETag']
+
+    # повторные запросы не генерируют схему
+    monkeypatch.setattr(openapi, 'generate', lambda *args, **kwargs: pytest.fail('schema regenerated'))
+    response = client.get('/swagger.json', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert client.get('/swagger.yaml').content.startswith(b"swagger: '2.0'")
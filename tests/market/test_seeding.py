@@ -0,0 +1,60 @@
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from market.models import Category, Order, OrderItem, ProductInfo, ProductParameter, Shop, User
+
+SIZES = ['--shops', '3', '--categories', '4', '--products', '40', '--buyers', '25', '--end-date', '2023-06-01']
+
+
+def snapshot():
+    return (list(Order.objects.order_by('id').values_list('user__email', 'dt', 'state', 'contact__phone')),
+            list(OrderItem.objects.order_by('id').values_list('order__dt', 'product_info__external_id',
+                                                               'quantity', 'price')),
+            list(ProductInfo.objects.order_by('id').values_list('product__name', 'shop__name', 'price')))
+
+
+@pytest.mark.django_db
+def test_seed_marketplace():
+    """Тест - команда создает согласованные данные площадки, повторный запуск отклоняется"""
+
+    out = StringIO()
+    call_command('seed_marketplace', *SIZES, stdout=out)
+    assert 'market_orderitem: ' in out.getvalue()
+
+    assert Shop.objects.count() == 3
+    assert User.objects.filter(type='buyer').count() == 25
+    assert ProductInfo.objects.count() >= 40
+    assert ProductParameter.objects.count() >= 3 * ProductInfo.objects.count()
+    assert Category.objects.filter(shops__isnull=False).exists()
+    for order in Order.objects.exclude(state='basket').select_related('contact'):
+        assert order.contact.user_id == order.user_id
+    assert not Order.objects.filter(state='basket', contact__isnull=False).exists()
+    # позиции заказа - предложения магазинов со снимком данных товара
+    for item in OrderItem.objects.select_related('order', 'product_info__product', 'shop'):
+        assert item.product_info.shop_id == item.shop_id and item.order_dt == item.order.dt
+        if item.order.state != 'basket':
+            assert item.product_name == item.product_info.product.name and item.shop_name == item.shop.name
+    assert User.objects.get(email='buyer0@seed.example.com').check_password('Seed-Passw0rd')
+
+    with pytest.raises(CommandError):
+        call_command('seed_marketplace', *SIZES, stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_seed_marketplace_deterministic():
+    """Тест - при одинаковых seed и дате создаются одинаковые данные, при другом seed - другие"""
+
+    call_command('seed_marketplace', *SIZES, stdout=StringIO())
+    first = snapshot()
+    assert first[0] and first[1]
+
+    # пользователи удаляются вместе с магазинами, предложениями, контактами и заказами
+    User.objects.all().delete()
+    call_command('seed_marketplace', *SIZES, stdout=StringIO())
+    assert snapshot() == first
+
+    User.objects.all().delete()
+    call_command('seed_marketplace', *SIZES, '--seed', '2', stdout=StringIO())
+    assert snapshot() != first
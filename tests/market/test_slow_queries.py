@@ -0,0 +1,72 @@
+import pytest
+
+from market.models import Order, OutboxMessage, SlowQuery
+from market.slow_queries import fingerprint, normalize
+from market.tasks import explain_slow_query_task
+
+
+@pytest.fixture()
+def capture_all(settings):
+    """Фикстура - записываются все запросы к БД, для всех SELECT записывается план"""
+    settings.SLOW_QUERY_THRESHOLD = 0
+    settings.SLOW_QUERY_EXPLAIN_RATE = 1
+
+
+def test_normalize():
+    """Тест - запросы, отличающиеся только значениями, имеют один отпечаток"""
+
+    first = normalize('SELECT "id" FROM "market_order" WHERE "id" IN (%s, %s, %s) AND "state" = \'new\' LIMIT 21')
+    second = normalize('SELECT  "id" FROM "market_order"\n WHERE "id" IN (%s) AND "state" = \'basket\' LIMIT 5')
+    assert first == second == 'SELECT "id" FROM "market_order" WHERE "id" IN (...) AND "state" = ? LIMIT ?'
+    assert fingerprint(first) == fingerprint(second)
+    assert normalize('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s)') == 'INSERT INTO "t" ("a", "b") VALUES (...)'
+
+
+@pytest.mark.django_db
+def test_slow_queries_of_view(capture_all, buyer_client, create_orders):
+    """Тест - медленные запросы обработчика записываются с обработчиком и стеком, план - задачей"""
+
+    buyer_client.get('/api/order')
+    buyer_client.get('/api/order')
+
+    query = SlowQuery.objects.filter(view='order:GET', statement__contains='"market_order"').first()
+    assert query.calls == 2
+    assert query.max_time <= query.total_time
+    assert 'shop_views.py' in query.stack
+
+    message = OutboxMessage.objects.filter(task=explain_slow_query_task.name,
+                                           kwargs__fingerprint=query.fingerprint).first()
+    # SQL передается с параметрами отдельно, без подставленных значений
+    assert '%s' in message.kwargs['sql'] and message.kwargs['params']
+    assert explain_slow_query_task(**message.kwargs) == 1
+    query.refresh_from_db()
+    assert query.plan and query.plan_at
+
+
+@pytest.mark.django_db
+def test_slow_queries_outside_request(capture_all, settings, django_capture_on_commit_callbacks):
+    """Тест - медленные запросы вне HTTP запросов записываются после фиксации транзакции"""
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Order.objects.filter(state='new').count()
+    assert SlowQuery.objects.get(statement__contains='COUNT(*)').view == ''
+
+    settings.SLOW_QUERY_THRESHOLD = None
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        Order.objects.filter(state='basket').exists()
+    assert not callbacks
+
+
+@pytest.mark.django_db
+def test_slow_queries_without_values(settings, client_auth, create_token):
+    """Тест - значения параметров (ключ токена, email) не сохраняются и без SLOW_QUERY_EXPLAIN_RATE не передаются"""
+
+    settings.SLOW_QUERY_THRESHOLD = 0
+    assert settings.SLOW_QUERY_EXPLAIN_RATE == 0
+
+    client_auth.get('/api/user/details')
+
+    assert SlowQuery.objects.filter(statement__contains='"authtoken_token"').exists()
+    for value in (create_token.key, create_token.user.email):
+        assert not SlowQuery.objects.filter(statement__contains=value).exists()
+    assert not OutboxMessage.objects.filter(task=explain_slow_query_task.name).exists()
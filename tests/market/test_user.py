@@ -1,10 +1,22 @@
+import json
+from datetime import timedelta
 from random import randint
 
 import pytest
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 
+from market.authentication import dump_token, load_token
 from market.models import User, Contact, ConfirmEmailToken
+from market.tasks import flush_mail_task, purge_stale_auth_tokens_task, send_token_to_email_task, \
+    send_tokens_to_emails_task
 
 
 @pytest.fixture()
@@ -117,7 +129,8 @@ def test_confirm_reg(create_user, client):
     assert data['Status']
 
 
-@pytest.mark.django_db
+# вход выполняется в пуле хеширования, в другом соединении с БД: данные теста должны быть зафиксированы
+@pytest.mark.django_db(transaction=True)
 def test_login(create_active_user, client):
     """Тест авторизации"""
 
@@ -240,3 +253,266 @@ def test_confirm_reset_password(create_active_user, client):
     assert response.status_code == 200
     data = response.json()
     assert data['Status']
+
+
+@pytest.mark.django_db
+def test_cached_token_auth(client_auth, django_assert_num_queries):
+    """Тест кэширования аутентификации по токену"""
+
+    assert client_auth.get('/api/user/details').status_code == 200
+
+    # повторный запрос не обращается к таблице токенов, остается только запрос контактов
+    with django_assert_num_queries(1):
+        assert client_auth.get('/api/user/details').status_code == 200
+
+
+@pytest.mark.django_db
+def test_token_cache_json(create_token):
+    """Тест - в кэше токенов хранится JSON без пароля, пользователь восстанавливается из него"""
+
+    data = dump_token(create_token)
+    assert 'password' not in json.loads(data)['user']
+
+    token = load_token(Token, create_token.key, data)
+    user = create_token.user
+    assert (token.user.id, token.user.email, token.user.is_active, token.user.is_staff) == \
+           (user.id, user.email, user.is_active, user.is_staff)
+    assert token.user.date_joined == user.date_joined
+    assert token.created == create_token.created
+    assert token.user.get_deferred_fields() == {'password'}
+    assert token.user.check_password('qwer1234A') == user.check_password('qwer1234A')
+
+
+@pytest.mark.django_db
+def test_logout(client_auth):
+    """Тест выхода пользователя"""
+
+    assert client_auth.get('/api/user/details').status_code == 200
+
+    response = client_auth.post('/api/user/logout')
+    assert response.json()['Status']
+
+    assert client_auth.get('/api/user/details').status_code == 401
+
+
+@pytest.mark.django_db
+def test_deactivated_user_auth(client_auth, create_token):
+    """Тест сброса кэша аутентификации при деактивации пользователя"""
+
+    assert client_auth.get('/api/user/details').status_code == 200
+
+    user = create_token.user
+    user.is_active = False
+    user.save()
+
+    assert client_auth.get('/api/user/details').status_code == 401
+
+
+@pytest.mark.django_db
+def test_expired_token(client_auth, create_token):
+    """Тест аутентификации по просроченному токену"""
+
+    Token.objects.filter(key=create_token.key).update(created=timezone.now() - timedelta(days=30))
+
+    assert client_auth.get('/api/user/details').status_code == 401
+    assert not Token.objects.filter(key=create_token.key).exists()
+
+
+@pytest.mark.django_db
+def test_token_renewal(client_auth, create_token):
+    """Тест продления токена при использовании"""
+
+    created = timezone.now() - timedelta(days=2)
+    Token.objects.filter(key=create_token.key).update(created=created)
+
+    assert client_auth.get('/api/user/details').status_code == 200
+    assert Token.objects.get(key=create_token.key).created > created
+
+
+# вход выполняется в пуле хеширования, в другом соединении с БД: данные теста должны быть зафиксированы
+@pytest.mark.django_db(transaction=True)
+def test_login_replaces_expired_token(create_token, client):
+    """Тест выдачи нового токена вместо просроченного при авторизации"""
+
+    Token.objects.filter(key=create_token.key).update(created=timezone.now() - timedelta(days=30))
+
+    response = client.post('/api/user/login', data=dict(email=create_token.user.email, password='qwer1234A'))
+
+    data = response.json()
+    assert data['Status']
+    assert data['Token'] != create_token.key
+
+
+@pytest.mark.django_db
+def test_purge_stale_auth_tokens(create_token, create_user, settings):
+    """Тест удаления просроченных токенов"""
+
+    settings.AUTH_PURGE_BATCH_SIZE = 1
+    Token.objects.filter(key=create_token.key).update(created=timezone.now() - timedelta(days=30))
+    stale = ConfirmEmailToken.objects.create(user=create_user)
+    ConfirmEmailToken.objects.filter(id=stale.id).update(created_at=timezone.now() - timedelta(days=30))
+    fresh = ConfirmEmailToken.objects.create(user=create_user)
+
+    assert purge_stale_auth_tokens_task() == {'tokens': 1, 'confirm_tokens': 1}
+    assert list(ConfirmEmailToken.objects.values_list('id', flat=True)) == [fresh.id]
+
+
+@pytest.mark.django_db
+def test_reg_single_write(client):
+    """Тест - при регистрации пользователь записывается в БД одним запросом"""
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.post('/api/user/register', data=dict(first_name='First',
+                                                               last_name='Second',
+                                                               email='Single@mail.ru',
+                                                               password='qwer1234A',
+                                                               company='CompanyOne',
+                                                               position='worker',
+                                                               test='test'
+                                                               ))
+
+    assert response.json()['Status']
+    writes = [query['sql'] for query in context.captured_queries
+              if query['sql'].startswith(('INSERT', 'UPDATE')) and 'market_user' in query['sql']]
+    assert len(writes) == 1
+    assert User.objects.get(email='Single@mail.ru').check_password('qwer1234A')
+
+
+# вход выполняется в пуле хеширования, в другом соединении с БД: данные теста должны быть зафиксированы
+@pytest.mark.django_db(transaction=True)
+def test_login_inactive(create_user, client):
+    """Тест авторизации пользователя с неподтвержденным email: ModelBackend не авторизует неактивных пользователей"""
+
+    failed = []
+    user_login_failed.connect(lambda **kwargs: failed.append(kwargs['credentials']), weak=False,
+                              dispatch_uid='test_login_inactive')
+    try:
+        response = client.post('/api/user/login', data=dict(email=create_user.email, password='qwer1234A'))
+        data = response.json()
+        assert data['Status'] is False
+        assert data['Errors'] == 'Не удалось авторизовать'
+
+        response = client.post('/api/user/login', data=dict(email=create_user.email, password='wrong'))
+        assert response.json()['Errors'] == 'Не удалось авторизовать'
+    finally:
+        user_login_failed.disconnect(dispatch_uid='test_login_inactive')
+    assert [credentials['username'] for credentials in failed] == [create_user.email] * 2
+
+
+# вход выполняется в пуле хеширования, в другом соединении с БД: данные теста должны быть зафиксированы
+@pytest.mark.django_db(transaction=True)
+def test_login_upgrades_hash(create_active_user, client, settings):
+    """Тест - при входе хеш пароля пересчитывается основным алгоритмом PASSWORD_HASHERS"""
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.PBKDF2PasswordHasher',
+                                 'django.contrib.auth.hashers.MD5PasswordHasher']
+    User.objects.filter(id=create_active_user.id).update(password=make_password('qwer1234A', hasher='md5'))
+
+    response = client.post('/api/user/login', data=dict(email=create_active_user.email, password='qwer1234A'))
+    assert response.json()['Status'] is True
+    assert User.objects.get(id=create_active_user.id).password.startswith('pbkdf2_sha256$')
+
+
+@pytest.fixture()
+def staff_client(client_auth, create_active_user):
+    """Фикстура клиента сотрудника площадки"""
+
+    create_active_user.is_staff = True
+    create_active_user.save()
+    return client_auth
+
+
+@pytest.mark.django_db
+def test_bulk_provision(staff_client):
+    """Тест массовой регистрации пользователей с контактами"""
+
+    users = [dict(first_name='Bulk', last_name=f'User{number}', email=f'bulk{number}@mail.ru',
+                  company='CompanyTwo', position='worker') for number in range(3)]
+    users[0].update(password='qwer1234A', city='Moscow', street='Lenina', house='1', phone='+79990000000')
+
+    response = staff_client.post('/api/user/bulk', data=dict(users=users, test='test'), format='json')
+    data = response.json()
+    assert data['Status']
+    assert data['Создано пользователей'] == 3
+    assert data['Создано контактов'] == 1
+
+    first = User.objects.get(email='bulk0@mail.ru')
+    assert first.check_password('qwer1234A')
+    assert not first.is_active
+    assert Contact.objects.get().user == first
+    assert not User.objects.get(email='bulk1@mail.ru').has_usable_password()
+
+
+@pytest.mark.django_db
+def test_bulk_provision_csv(staff_client):
+    """Тест массовой регистрации пользователей из CSV"""
+
+    content = ('first_name,last_name,email,company,position,city,street,house,phone\n'
+               'Csv,One,csv1@mail.ru,CompanyTwo,worker,Moscow,Lenina,1,+79990000000\n'
+               'Csv,Two,csv2@mail.ru,CompanyTwo,worker,,,,\n')
+
+    response = staff_client.post('/api/user/bulk?test=test', data=content, content_type='text/csv')
+    data = response.json()
+    assert data['Status']
+    assert data['Создано пользователей'] == 2
+    assert data['Создано контактов'] == 1
+
+
+@pytest.mark.django_db
+def test_bulk_provision_errors(staff_client, create_user):
+    """Тест - при ошибке в любой строке пользователи не создаются"""
+
+    users = [dict(first_name='Bulk', last_name='One', email='bulk@mail.ru'),
+             dict(first_name='Bulk', last_name='Two', email='BULK@mail.ru'),
+             dict(first_name='Bulk', last_name='Three', email=create_user.email),
+             dict(first_name='Bulk', last_name='Four', email='four@mail.ru', city='Moscow'),
+             dict(first_name='Bulk', email='not-email')]
+
+    response = staff_client.post('/api/user/bulk', data=dict(users=users, test='test'), format='json')
+    data = response.json()
+    assert data['Status'] is False
+    assert set(data['Errors']) == {'2', '3', '4', '5'}
+    assert not User.objects.filter(last_name__in=['One', 'Two', 'Four']).exists()
+
+
+@pytest.mark.django_db
+def test_bulk_provision_staff_only(client_auth):
+    """Тест - массовая регистрация доступна только сотрудникам площадки"""
+
+    response = client_auth.post('/api/user/bulk', data=dict(users=[], test='test'), format='json')
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_send_tokens_to_emails(create_user):
+    """Тест отправки писем с токенами пачке пользователей"""
+
+    other = User.objects.create_user(email='other@mail.ru', first_name='Other', last_name='User')
+    existing = ConfirmEmailToken.objects.create(user=create_user)
+
+    send_tokens_to_emails_task(user_ids=[create_user.id, other.id], title='Token')
+    flush_mail_task()
+
+    assert len(mail.outbox) == 2
+    assert ConfirmEmailToken.objects.count() == 2
+    assert existing.key in [message.body for message in mail.outbox]
+
+
+@pytest.mark.django_db
+def test_send_tokens_replace_expired(client, create_user):
+    """Тест - вместо просроченного токена подтверждения отправляется новый, который принимает ConfirmAccount"""
+
+    other = User.objects.create_user(email='other@mail.ru', first_name='Other', last_name='User')
+    expired = [ConfirmEmailToken.objects.create(user=user) for user in (create_user, other)]
+    ConfirmEmailToken.objects.update(created_at=timezone.now() - settings.CONFIRM_TOKEN_TTL - timedelta(minutes=1))
+
+    send_token_to_email_task(user_id=create_user.id, title='Token')
+    send_tokens_to_emails_task(user_ids=[other.id], title='Token')
+    flush_mail_task()
+
+    keys = [message.body for message in mail.outbox]
+    assert len(keys) == 2
+    assert not {token.key for token in expired} & set(keys)
+    assert ConfirmEmailToken.objects.count() == 2
+    response = client.post('/api/user/register/confirm', data=dict(email=create_user.email, token=keys[0]))
+    assert response.json()['Status'] is True